@@ -0,0 +1,97 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Times ThriftArgumentConverter on large request bodies.
+
+Run from the repository root:
+    python benchmarks/converter_benchmark.py [--elements 100000] [--repeat 5]
+
+Each request body holds the given number of elements, converted as a list of i64s, a list of structs, and a map of
+strings to enums. The generated classes are built in memory, so the thrift compiler is not needed. Point PYTHONPATH at
+another checkout to compare against a different version of the converter.
+
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+
+from thriftcli import ThriftArgumentConverter, ThriftTypeBuilder
+
+THRIFT_CONTENT = """
+enum Color {
+    RED,
+    GREEN,
+    BLUE
+}
+
+typedef i64 Id
+
+struct Point {
+    1: Id id,
+    2: double x,
+    3: double y,
+    4: string label,
+    5: Color color
+}
+
+service Benchmark {
+    void putIds(1: list<Id> ids),
+    void putPoints(1: list<Point> points),
+    void putColors(1: map<string, Color> colors)
+}
+"""
+
+
+def generate_requests(elements):
+    """ Returns the method names and request bodies to convert.
+
+    :param elements: the number of elements in each request body
+    :type elements: int
+    :rtype: list of (str, dict)
+
+    """
+    colors = ['RED', 'GREEN', 'BLUE']
+    return [
+        ('putIds', {'ids': range(elements)}),
+        ('putPoints', {'points': [{'id': index, 'x': 1.5, 'y': index, 'label': 'point', 'color': colors[index % 3]}
+                                  for index in range(elements)]}),
+        ('putColors', {'colors': {'key%d' % index: colors[index % 3] for index in range(elements)}}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times ThriftArgumentConverter on large request bodies.')
+    parser.add_argument('--elements', type=int, default=100000, help='the number of elements in each request body')
+    parser.add_argument('--repeat', type=int, default=5, help='the number of times to convert each request body')
+    args = parser.parse_args()
+    temp_dir = tempfile.mkdtemp()
+    try:
+        thrift_path = os.path.join(temp_dir, 'Benchmark.thrift')
+        with open(thrift_path, 'w') as thrift_file:
+            thrift_file.write(THRIFT_CONTENT)
+        converter = ThriftArgumentConverter(thrift_path)
+        ThriftTypeBuilder(converter._parse_result).build()
+        print '%12s %10s %12s %14s' % ('method', 'elements', 'best (ms)', 'ns/element')
+        for method_name, request_body in generate_requests(args.elements):
+            best = min(timeit.repeat(lambda: converter.convert_args('Benchmark.Benchmark', method_name, request_body),
+                                     repeat=args.repeat, number=1))
+            print '%12s %10d %12.1f %14.0f' % (method_name, args.elements, best * 1000,
+                                               best * 1000000000 / args.elements)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
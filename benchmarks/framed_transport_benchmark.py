@@ -0,0 +1,98 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Compares thrift's TFramedTransport with TZeroCopyFramedTransport reading large frames from a loopback server.
+
+Run from the repository root:
+    python benchmarks/framed_transport_benchmark.py [--sizes 1 8 32] [--total 320]
+
+For each frame size in megabytes, a server on a loopback socket answers every one-byte request frame with a frame of
+that size, until about total megabytes were read. Each transport and size runs in its own process, so the peak RSS
+it adds over the process's starting RSS is its own.
+
+"""
+
+import argparse
+import resource
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from thrift.transport import TSocket, TTransport
+
+from thriftcli import TZeroCopyFramedTransport
+
+TRANSPORTS = {'thrift': TTransport.TFramedTransport, 'zero-copy': TZeroCopyFramedTransport}
+
+
+def serve_frames(listener, frame_size, frames):
+    """ Answers each request frame with a frame of frame_size bytes, frames times. """
+    server_socket, _ = listener.accept()
+    header = struct.pack('!i', frame_size)
+    payload = 'x' * frame_size
+    for _ in range(frames):
+        request = ''
+        while len(request) < 5:
+            request += server_socket.recv(5 - len(request))
+        server_socket.sendall(header)
+        server_socket.sendall(payload)
+    server_socket.close()
+
+
+def run_transport(transport_name, megabytes, frames):
+    """ Reads frames of megabytes each through a transport, and prints its time per megabyte and peak RSS. """
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    frame_size = megabytes << 20
+    thread = threading.Thread(target=serve_frames, args=(listener, frame_size, frames))
+    thread.daemon = True
+    thread.start()
+    socket_transport = TSocket.TSocket('127.0.0.1', listener.getsockname()[1])
+    socket_transport.open()
+    transport = TRANSPORTS[transport_name](socket_transport)
+    starting_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.time()
+    for _ in range(frames):
+        transport.write('r')
+        transport.flush()
+        if len(transport.read(frame_size)) != frame_size:
+            raise RuntimeError('Short frame')
+    elapsed = time.time() - started
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    transport.close()
+    print '%10s %6d %7d %9.2f %15d' % (transport_name, megabytes, frames, elapsed * 1000 / frames / megabytes,
+                                        (peak_rss - starting_rss) // 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares framed transports reading large frames over loopback.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 8, 32], help='the frame sizes, in megabytes')
+    parser.add_argument('--total', type=int, default=320, help='the number of megabytes to read at each size')
+    parser.add_argument('--transport', choices=sorted(TRANSPORTS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.transport is not None:
+        run_transport(args.transport, args.sizes[0], max(1, args.total // args.sizes[0]))
+        return
+    print '%10s %6s %7s %9s %15s' % ('transport', 'MB', 'frames', 'ms/MB', 'peak RSS (MB)')
+    sys.stdout.flush()
+    for size in args.sizes:
+        for transport_name in ['thrift', 'zero-copy']:
+            subprocess.check_call([sys.executable, __file__, '--transport', transport_name, '--sizes', str(size),
+                                   '--total', str(args.total)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Times ThriftParser on synthetic thrift files of increasing size.
+
+Run from the repository root:
+    python benchmarks/parser_benchmark.py [--sizes 250 500 1000 2000] [--repeat 5]
+
+Each size is the number of structs in the generated file, which also declares one enum, one typedef, and one service
+endpoint per struct, along with a few comments. Point PYTHONPATH at another checkout to compare against a different
+version of the parser.
+
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+
+from thriftcli import ThriftParser
+
+
+def generate_thrift(size):
+    """ Returns the content of a thrift file declaring size structs, enums, typedefs, and endpoints.
+
+    :param size: the number of each kind of definition to declare
+    :type size: int
+    :rtype: str
+
+    """
+    lines = ['namespace py benchmark.generated']
+    for index in range(size):
+        lines.append('enum Enum%d {\n    ZERO,\n    ONE = 1,\n    TWO\n}' % index)
+        lines.append('typedef list<Struct%d> Structs%d' % (index, index))
+        lines.append('/**\n * The struct numbered %d.\n */\n'
+                     'struct Struct%d {\n'
+                     '    1: required i64 id, // The identifier\n'
+                     '    2: optional string name = "name",\n'
+                     '    3: map<string, list<Enum%d>> values,\n'
+                     '    4: set<double> scores\n'
+                     '}' % (index, index, index))
+    lines.append('service BenchmarkService {')
+    for index in range(size):
+        lines.append('    Structs%d get%d(1: i64 id, 2: Struct%d template),' % (index, index, index))
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times ThriftParser on synthetic thrift files of increasing size.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[250, 500, 1000, 2000],
+                        help='the numbers of structs to generate files with')
+    parser.add_argument('--repeat', type=int, default=5, help='the number of times to parse each file')
+    args = parser.parse_args()
+    temp_dir = tempfile.mkdtemp()
+    try:
+        print '%8s %10s %12s %12s' % ('structs', 'bytes', 'best (ms)', 'us/struct')
+        for size in args.sizes:
+            thrift_path = os.path.join(temp_dir, 'Benchmark%d.thrift' % size)
+            content = generate_thrift(size)
+            with open(thrift_path, 'w') as thrift_file:
+                thrift_file.write(content)
+            best = min(timeit.repeat(lambda: ThriftParser(thrift_path, processes=1).parse(),
+                                     repeat=args.repeat, number=1))
+            print '%8d %10d %12.1f %12.1f' % (size, len(content), best * 1000, best * 1000000 / size)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
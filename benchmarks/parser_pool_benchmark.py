@@ -0,0 +1,109 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Times ThriftParser on a thrift file with many includes, parsed in process and on pools of processes.
+
+Run from the repository root:
+    python benchmarks/parser_pool_benchmark.py [--includes 256] [--structs 20] [--processes 1 2 4 8] [--repeat 3]
+
+The generated file includes that many files, each declaring that many structs and an endpoint per struct. Nothing is
+cached, so every include is parsed on every run. A speedup below 1 means the pool is slower than parsing in process,
+as it is on a single cpu, where the parses are not run at the same time and their results are pickled back. The
+speedup is over the first number of processes given.
+
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import timeit
+
+from thriftcli import ThriftParser
+
+
+def generate_include(index, structs):
+    """ Returns the content of an included thrift file declaring structs and a service with an endpoint for each.
+
+    :param index: the number of the included file, which its definitions are named after
+    :type index: int
+    :param structs: the number of structs to declare
+    :type structs: int
+    :rtype: str
+
+    """
+    lines = ['namespace py benchmark.include%d' % index]
+    for struct_index in range(structs):
+        lines.append('struct Include%dStruct%d {\n'
+                     '    1: required i64 id,\n'
+                     '    2: optional string name = "name",\n'
+                     '    3: map<string, list<i32>> values\n'
+                     '}' % (index, struct_index))
+    lines.append('service Include%dService {' % index)
+    for struct_index in range(structs):
+        lines.append('    Include%dStruct%d get%d(1: i64 id),' % (index, struct_index, struct_index))
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_thrift_files(directory, includes, structs):
+    """ Writes the included files and the file including them, and returns the path to the latter.
+
+    :param directory: the directory to write the files to
+    :type directory: str
+    :param includes: the number of files to include
+    :type includes: int
+    :param structs: the number of structs in each included file
+    :type structs: int
+    :rtype: str
+
+    """
+    lines = []
+    for index in range(includes):
+        with open(os.path.join(directory, 'Include%d.thrift' % index), 'w') as thrift_file:
+            thrift_file.write(generate_include(index, structs))
+        lines.append('include "Include%d.thrift"' % index)
+    lines.append('namespace py benchmark.root')
+    lines.append('service RootService {\n    void ping()\n}')
+    thrift_path = os.path.join(directory, 'Root.thrift')
+    with open(thrift_path, 'w') as thrift_file:
+        thrift_file.write('\n'.join(lines) + '\n')
+    return thrift_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times ThriftParser on many includes, in process and on pools.')
+    parser.add_argument('--includes', type=int, default=256, help='the number of files to include')
+    parser.add_argument('--structs', type=int, default=20, help='the number of structs in each included file')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='the numbers of processes to parse with, where 1 parses in process')
+    parser.add_argument('--repeat', type=int, default=3, help='the number of times to parse with each')
+    args = parser.parse_args()
+    temp_dir = tempfile.mkdtemp()
+    try:
+        thrift_path = write_thrift_files(temp_dir, args.includes, args.structs)
+        print '%d includes of %d structs, %d cpus' % (args.includes, args.structs, multiprocessing.cpu_count())
+        print '%10s %12s %8s' % ('processes', 'best (ms)', 'speedup')
+        serial = None
+        for processes in args.processes:
+            best = min(timeit.repeat(lambda: ThriftParser(thrift_path, processes=processes).parse(),
+                                     repeat=args.repeat, number=1))
+            if serial is None:
+                serial = best
+            print '%10d %12.1f %8.2f' % (processes, best * 1000, serial / best)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
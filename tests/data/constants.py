@@ -286,7 +286,10 @@ TEST_THRIFT_SERVICES = {
     TEST_THRIFT_SERVICE_REFERENCE2: TEST_THRIFT_SERVICE2,
     TEST_THRIFT_SERVICE_REFERENCE3: TEST_THRIFT_SERVICE3
 }
-TEST_THRIFT_ENUMS = {TEST_THRIFT_ENUM_REFERENCE, TEST_THRIFT_ENUM_REFERENCE2}
+TEST_THRIFT_ENUMS = {
+    TEST_THRIFT_ENUM_REFERENCE: {'A': 0, 'B': 1, 'C': 2, 'D': 3},
+    TEST_THRIFT_ENUM_REFERENCE2: {'W': 0, 'X': 4, 'Y': 0xf2a, 'Z': 0xf2b}
+}
 TEST_THRIFT_PARSE_RESULT = ThriftParseResult(
     TEST_THRIFT_STRUCTS, TEST_THRIFT_SERVICES, TEST_THRIFT_ENUMS, TEST_THRIFT_TYPEDEFS,
     TEST_THRIFT_NAMESPACES)
@@ -335,9 +338,10 @@ TEST_THRIFT_INCLUDED_STRUCTS = {
 TEST_THRIFT_INCLUDED_SERVICES = {
     TEST_THRIFT_INCLUDED_SERVICE_REFERENCE: TEST_THRIFT_INCLUDED_SERVICE
 }
-TEST_THRIFT_INCLUDED_ENUMS = {TEST_THRIFT_INCLUDED_ENUM_REFERENCE}
+TEST_THRIFT_INCLUDED_ENUMS = {TEST_THRIFT_INCLUDED_ENUM_REFERENCE: {'THIS_STUFF': 0, 'THAT_STUFF': 1, 'MORE_STUFF': 2}}
 TEST_THRIFT_INCLUDED_TYPEDEF_DEFINITION = 'typedef i64 Id'
 TEST_THRIFT_INCLUDED_TYPEDEF_DEFINITION2 = 'typedef list<Id> Ids'
+TEST_THRIFT_INCLUDED_TYPEDEF_REFERENCE2 = '%s.Ids' % TEST_THRIFT_INCLUDED_NAMESPACE
 TEST_THRIFT_INCLUDED_TYPEDEFS = {
     '%s.Id' % TEST_THRIFT_INCLUDED_NAMESPACE: 'i64',
     '%s.Ids' % TEST_THRIFT_INCLUDED_NAMESPACE: 'list<%s.Id>' % TEST_THRIFT_INCLUDED_NAMESPACE,
@@ -361,7 +365,8 @@ TEST_THRIFT_INCLUDING_ENUM_DEFINITION = textwrap.dedent("""\
         THREE
     }""" % TEST_THRIFT_INCLUDING_ENUM_NAME)
 TEST_THRIFT_INCLUDING_ENUM_REFERENCE = '%s.%s' % (TEST_THRIFT_INCLUDING_NAMESPACE, TEST_THRIFT_INCLUDING_ENUM_NAME)
-TEST_THRIFT_INCLUDING_ENUMS = {TEST_THRIFT_INCLUDED_ENUM_REFERENCE, TEST_THRIFT_INCLUDING_ENUM_REFERENCE}
+TEST_THRIFT_INCLUDING_ENUMS = TEST_THRIFT_INCLUDED_ENUMS.copy()
+TEST_THRIFT_INCLUDING_ENUMS[TEST_THRIFT_INCLUDING_ENUM_REFERENCE] = {'ONE': 0, 'TWO': 1, 'THREE': 2}
 TEST_THRIFT_INCLUDING_STRUCT_NAME = 'SomeIncludingStruct'
 TEST_THRIFT_INCLUDING_STRUCT_REFERENCE = '%s.%s' % (TEST_THRIFT_INCLUDING_NAMESPACE, TEST_THRIFT_INCLUDING_STRUCT_NAME)
 TEST_THRIFT_INCLUDING_STRUCT_DEFINITION = textwrap.dedent("""\
@@ -372,12 +377,12 @@ TEST_THRIFT_INCLUDING_STRUCT_DEFINITION = textwrap.dedent("""\
         4:%s included_typedef
     }""" % (TEST_THRIFT_INCLUDING_STRUCT_NAME, TEST_THRIFT_INCLUDED_ENUM_REFERENCE,
             TEST_THRIFT_INCLUDED_STRUCT_REFERENCE, TEST_THRIFT_INCLUDING_ENUM_NAME,
-            TEST_THRIFT_INCLUDED_TYPEDEF_DEFINITION2))
+            TEST_THRIFT_INCLUDED_TYPEDEF_REFERENCE2))
 TEST_THRIFT_INCLUDING_STRUCT_FIELDS = {
     'included_enum': ThriftStruct.Field(1, TEST_THRIFT_INCLUDED_ENUM_REFERENCE, 'included_enum'),
     'included_struct': ThriftStruct.Field(2, TEST_THRIFT_INCLUDED_STRUCT_REFERENCE, 'included_struct'),
     'my_enum': ThriftStruct.Field(3, TEST_THRIFT_INCLUDING_ENUM_REFERENCE, 'my_enum'),
-    'included_typedef': ThriftStruct.Field(4, TEST_THRIFT_INCLUDED_TYPEDEF_DEFINITION2, 'included_typedef')
+    'included_typedef': ThriftStruct.Field(4, TEST_THRIFT_INCLUDED_TYPEDEF_REFERENCE2, 'included_typedef')
 }
 TEST_THRIFT_INCLUDING_STRUCT = ThriftStruct(TEST_THRIFT_INCLUDING_STRUCT_REFERENCE, TEST_THRIFT_INCLUDING_STRUCT_FIELDS)
 TEST_THRIFT_INCLUDING_SERVICE_NAME = 'SomeIncludingService'
@@ -483,16 +488,25 @@ TEST_CLI_ARGS6 = [TEST_CLI_NAME, TEST_SERVER_ADDRESS, TEST_THRIFT_ENDPOINT_NAME,
                   '--body', TEST_JSON_REQUEST_BODY, '--include', TEST_THRIFT_DIR_PATH, TEST_THRIFT_DIR_PATH2,
                   '--client_id', TEST_CLIENT_ID, '--tls', '--tls_key_path', TEST_KEY_FILE_PATH, '--cert_verification_mode',
                   TEST_CERTIFICATE_VERIFICATION_NONE_MODE]
+TEST_CLI_ARGS7 = [TEST_CLI_NAME, TEST_SERVER_ADDRESS, TEST_THRIFT_ENDPOINT_NAME, TEST_THRIFT_PATH, '--no_cache',
+                  '--in_memory', '--json_indent', '0', '--no_sort_keys']
+TEST_CLI_ARGS8 = [TEST_CLI_NAME, TEST_SERVER_ADDRESS, TEST_THRIFT_ENDPOINT_NAME, TEST_THRIFT_PATH, '--batch', '-',
+                  '--concurrency', '4', '--nonblocking', '--pipeline', '8',
+                  '--load_balancing', 'least_outstanding', '--protocol', 'compact', '--transport', 'buffered']
 TEST_PARSED_ARGS = (TEST_SERVER_ADDRESS, TEST_THRIFT_ENDPOINT_NAME, TEST_THRIFT_PATH, [], {}, False, False, False, None, TEST_PROXY, False, None,
-                    TEST_CERTIFICATE_VERIFICATION_DEFAULT_MODE)
+                    TEST_CERTIFICATE_VERIFICATION_DEFAULT_MODE, True, False, None, 1, False, 1, 'power_of_two_choices', 'finagle', 'framed', 4, True)
 TEST_PARSED_ARGS2 = (TEST_ZOOKEEPER_SERVER_ADDRESS, TEST_THRIFT_ENDPOINT_NAME, TEST_THRIFT_PATH, [],
-                     TEST_ARGUMENT_DICTIONARY, True, True, True, TEST_CLIENT_ID, None, False, None, TEST_CERTIFICATE_VERIFICATION_DEFAULT_MODE)
+                     TEST_ARGUMENT_DICTIONARY, True, True, True, TEST_CLIENT_ID, None, False, None, TEST_CERTIFICATE_VERIFICATION_DEFAULT_MODE, True, False, None, 1, False, 1, 'power_of_two_choices', 'finagle', 'framed', 4, True)
 TEST_PARSED_ARGS3 = (TEST_SERVER_ADDRESS, TEST_THRIFT_ENDPOINT_NAME, TEST_THRIFT_PATH,
                      [TEST_THRIFT_DIR_PATH, TEST_THRIFT_DIR_PATH2], {}, False, False, False, None, TEST_PROXY, False, None,
-                     TEST_CERTIFICATE_VERIFICATION_DEFAULT_MODE)
+                     TEST_CERTIFICATE_VERIFICATION_DEFAULT_MODE, True, False, None, 1, False, 1, 'power_of_two_choices', 'finagle', 'framed', 4, True)
 TEST_PARSED_ARGS4 = (TEST_SERVER_ADDRESS, TEST_THRIFT_ENDPOINT_NAME, TEST_THRIFT_PATH,
                      [TEST_THRIFT_DIR_PATH, TEST_THRIFT_DIR_PATH2], TEST_ARGUMENT_DICTIONARY, False, False, False, TEST_CLIENT_ID, None, False, None,
-                     TEST_CERTIFICATE_VERIFICATION_DEFAULT_MODE)
+                     TEST_CERTIFICATE_VERIFICATION_DEFAULT_MODE, True, False, None, 1, False, 1, 'power_of_two_choices', 'finagle', 'framed', 4, True)
 TEST_PARSED_ARGS6 = (TEST_SERVER_ADDRESS, TEST_THRIFT_ENDPOINT_NAME, TEST_THRIFT_PATH,
                      [TEST_THRIFT_DIR_PATH, TEST_THRIFT_DIR_PATH2], TEST_ARGUMENT_DICTIONARY, False, False, False, TEST_CLIENT_ID, None, True,
-                     TEST_KEY_FILE_PATH, TEST_CERTIFICATE_VERIFICATION_NONE_MODE)
+                     TEST_KEY_FILE_PATH, TEST_CERTIFICATE_VERIFICATION_NONE_MODE, True, False, None, 1, False, 1, 'power_of_two_choices', 'finagle', 'framed', 4, True)
+TEST_PARSED_ARGS7 = (TEST_SERVER_ADDRESS, TEST_THRIFT_ENDPOINT_NAME, TEST_THRIFT_PATH, [], {}, False, False, False, None, None, False, None,
+                     TEST_CERTIFICATE_VERIFICATION_DEFAULT_MODE, False, True, None, 1, False, 1, 'power_of_two_choices', 'finagle', 'framed', None, False)
+TEST_PARSED_ARGS8 = (TEST_SERVER_ADDRESS, TEST_THRIFT_ENDPOINT_NAME, TEST_THRIFT_PATH, [], {}, False, False, False, None, None, False, None,
+                     TEST_CERTIFICATE_VERIFICATION_DEFAULT_MODE, True, False, '-', 4, True, 8, 'least_outstanding', 'compact', 'buffered', 4, True)
@@ -0,0 +1,123 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+import threading
+import time
+
+from gen.twitter.finagle.thrift.ttypes import RequestHeader, ResponseHeader, UpgradeReply
+from thrift.Thrift import TApplicationException, TMessageType
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+# Imported before the tests patch sys.modules, so the modules the reactor imports on first use outlive the patch
+from twitter.common.rpc.finagle import protocol
+
+from thriftcli.thrift_reactor import FINAGLE_UPGRADE_METHOD
+
+ECHO_THRIFT_CONTENT = """
+service Echo {
+    string echo(1: string message, 2: double delay),
+    oneway void ping()
+}
+"""
+
+
+class EchoServer(object):
+    """ A framed thrift server echoing messages back after a delay, on a thread per connection.
+
+    With a reply_batch above 1, the server reads that many requests before replying to them in reverse order. The
+    protocol_factory selects the protocol the server speaks, the binary protocol by default.
+
+    """
+
+    def __init__(self, service_module, finagle, reply_batch=1, protocol_factory=None):
+        self._service_module = service_module
+        self._finagle = finagle
+        self._reply_batch = reply_batch
+        self._protocol_factory = protocol_factory or TBinaryProtocol.TBinaryProtocolFactory()
+        self._listener = socket.socket()
+        self._listener.bind(('127.0.0.1', 0))
+        self._listener.listen(64)
+        self.port = self._listener.getsockname()[1]
+        self.connections = 0
+        self.requests = 0
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        self._listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self._listener.accept()
+            except socket.error:
+                return
+            self.connections += 1
+            thread = threading.Thread(target=self._serve, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, connection):
+        # A client that does not pipeline would leave the server waiting for more requests to reply to
+        connection.settimeout(5)
+        transport = TTransport.TFramedTransport(TTransport.TFileObjectTransport(connection.makefile('r+b', 0)))
+        protocol = self._protocol_factory.getProtocol(transport)
+        upgraded = False
+        replies = []
+        try:
+            while True:
+                if upgraded:
+                    RequestHeader().read(protocol)
+                method_name, _, seqid = protocol.readMessageBegin()
+                if method_name == FINAGLE_UPGRADE_METHOD:
+                    protocol.skip(12)
+                    protocol.readMessageEnd()
+                    if self._finagle:
+                        protocol.writeMessageBegin(method_name, TMessageType.REPLY, seqid)
+                        UpgradeReply().write(protocol)
+                        upgraded = True
+                    else:
+                        protocol.writeMessageBegin(method_name, TMessageType.EXCEPTION, seqid)
+                        TApplicationException(TApplicationException.UNKNOWN_METHOD).write(protocol)
+                    protocol.writeMessageEnd()
+                    transport.flush()
+                    continue
+                args = getattr(self._service_module, '%s_args' % method_name)()
+                args.read(protocol)
+                protocol.readMessageEnd()
+                if method_name == 'ping':
+                    continue
+                with self._lock:
+                    self.requests += 1
+                    self.running += 1
+                    self.max_running = max(self.max_running, self.running)
+                time.sleep(args.delay)
+                with self._lock:
+                    self.running -= 1
+                replies.append((seqid, args.message))
+                if len(replies) < self._reply_batch:
+                    continue
+                for seqid, message in reversed(replies):
+                    if upgraded:
+                        ResponseHeader().write(protocol)
+                    protocol.writeMessageBegin(method_name, TMessageType.REPLY, seqid)
+                    self._service_module.echo_result(success=message).write(protocol)
+                    protocol.writeMessageEnd()
+                    transport.flush()
+                replies = []
+        except (EOFError, TTransport.TTransportException, socket.error):
+            connection.close()
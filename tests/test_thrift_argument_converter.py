@@ -91,8 +91,42 @@ class TestThriftArgumentConverter(unittest.TestCase):
             ])
         }
         self.assertEqual(args, expected_args)
-        expected_call_args_list = [mock.call(data.TEST_THRIFT_NAMESPACE, data.TEST_THRIFT_STRUCT_NAME)] * 3
+        expected_call_args_list = [mock.call(data.TEST_THRIFT_NAMESPACE, data.TEST_THRIFT_STRUCT_NAME)]
         self.assertEqual(mock_get_type_class.call_args_list, expected_call_args_list)
         expected_call_args = sum([item for sublist in data.TEST_JSON_TO_CONVERT3.values() for item in sublist], [])
         expected_call_args_list = [mock.call(**call_args) for call_args in expected_call_args]
         self.assertEqual(mock_struct_constructor.call_args_list, expected_call_args_list)
+
+    @mock.patch('thriftcli.ThriftArgumentConverter._get_type_class')
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def test_convert_args_reuses_compiled_converters(self, mock_load_file, mock_get_type_class):
+        mock_get_type_class.return_value = mock.Mock(_NAMES_TO_VALUES={'A': 0})
+        mock_load_file.return_value = data.TEST_THRIFT_CONTENT
+        converter = ThriftArgumentConverter(data.TEST_THRIFT_PATH)
+        converter.convert_args(data.TEST_THRIFT_SERVICE_REFERENCE, 'doSomething1', data.TEST_JSON_TO_CONVERT)
+        with mock.patch('thriftcli.ThriftParseResult.get_fields_for_endpoint') as mock_get_fields_for_endpoint:
+            args = converter.convert_args(data.TEST_THRIFT_SERVICE_REFERENCE, 'doSomething1', data.TEST_JSON_TO_CONVERT)
+            self.assertFalse(mock_get_fields_for_endpoint.called)
+        self.assertEqual(args, {"num1": 3, "num2": 4, "op": 0})
+        self.assertEqual(mock_get_type_class.call_count, 1)
+        for body in [0, '', [], False, None]:
+            with self.assertRaises(ThriftCLIError):
+                converter.convert_args(data.TEST_THRIFT_SERVICE_REFERENCE, 'doSomething1', body)
+
+    @mock.patch('thriftcli.ThriftArgumentConverter._get_type_class')
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def test_convert_args_with_recursive_struct(self, mock_load_file, mock_get_type_class):
+        mock_get_type_class.return_value = dict
+        mock_load_file.return_value = '\n'.join([
+            'struct Node {',
+            '    1: i64 value,',
+            '    2: list<Node> children',
+            '}',
+            'service Tree {',
+            '    void put(1: Node root)',
+            '}'
+        ])
+        converter = ThriftArgumentConverter(data.TEST_THRIFT_PATH)
+        args = converter.convert_args('%s.Tree' % data.TEST_THRIFT_NAMESPACE, 'put',
+                                      {'value': '1', 'children': [{'value': 2, 'children': []}]})
+        self.assertEqual(args, {'root': {'value': 1, 'children': ({'value': 2, 'children': ()},)}})
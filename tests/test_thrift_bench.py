@@ -0,0 +1,164 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+import sys
+import threading
+import time
+import unittest
+
+import mock
+from thrift.transport import TTransport
+
+from tests.data.echo_server import ECHO_THRIFT_CONTENT, EchoServer
+from thriftcli import LatencyHistogram, ThriftBenchmark, ThriftCLIError, ThriftParser, ThriftReactor, \
+    ThriftTypeBuilder, make_schedule
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_percentile(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        for value in range(1, 1001):
+            histogram.record(value)
+        self.assertEqual(histogram.count, 1000)
+        self.assertEqual(histogram.percentile(0), 1)
+        self.assertEqual(histogram.percentile(100), 1000)
+        # Values of 256 and above share buckets, so percentiles report the highest value in their bucket
+        self.assertEqual(histogram.percentile(10), 100)
+        self.assertEqual(histogram.percentile(50), 501)
+        self.assertEqual(histogram.percentile(99.9), 999)
+
+    def test_percentile_precision(self):
+        histogram = LatencyHistogram()
+        for value in [1234567, 89012345, 5]:
+            histogram.record(value)
+        self.assertEqual(histogram.percentile(0), 5)
+        self.assertLess(abs(histogram.percentile(50) - 1234567), 1234567 / 100)
+        self.assertEqual(histogram.percentile(100), 89012345)
+
+    def test_add(self):
+        first, second = LatencyHistogram(), LatencyHistogram()
+        for value in range(100):
+            first.record(value)
+            second.record(value + 100)
+        first.add(second)
+        self.assertEqual((first.count, first.min, first.max), (200, 0, 199))
+        self.assertEqual(first.percentile(50), 99)
+        self.assertAlmostEqual(first.summarize()['mean'], 0.0995)
+
+
+class TestMakeSchedule(unittest.TestCase):
+    def test_constant(self):
+        send_times = make_schedule('constant', 4)
+        self.assertEqual([next(send_times) for _ in range(5)], [0, 0.25, 0.5, 0.75, 1])
+
+    def test_poisson(self):
+        send_times = list(itertools.islice(make_schedule('poisson', 100, seed=1), 10000))
+        self.assertEqual(send_times, sorted(send_times))
+        self.assertAlmostEqual(send_times[-1], 100, delta=5)
+        self.assertEqual(send_times, list(itertools.islice(make_schedule('poisson', 100, seed=1), 10000)))
+
+    def test_ramp(self):
+        send_times = make_schedule('ramp', 10, duration=10, ramp_to=30)
+        # 200 requests are sent over the ramp, the first 10 in about the first second, then 30 per second after it
+        send_times = list(itertools.islice(send_times, 231))
+        self.assertEqual(send_times[0], 0)
+        self.assertAlmostEqual(send_times[10], 0.916, places=3)
+        self.assertAlmostEqual(send_times[200], 10)
+        self.assertAlmostEqual(send_times[230], 11)
+        self.assertEqual(send_times, sorted(send_times))
+        send_times = make_schedule('ramp', 10, duration=10, ramp_to=10)
+        self.assertEqual([next(send_times) for _ in range(3)], [0, 0.1, 0.2])
+
+    def test_invalid(self):
+        with self.assertRaises(ThriftCLIError):
+            make_schedule('ramp', 10)
+        with self.assertRaises(ThriftCLIError):
+            make_schedule('burst', 10)
+
+
+class TestThriftBenchmark(unittest.TestCase):
+    def test_requires_limit(self):
+        with self.assertRaises(ThriftCLIError):
+            ThriftBenchmark(mock.Mock(), 'method', {})
+
+    def test_run_requests(self):
+        executor = mock.Mock()
+        calls = []
+        lock = threading.Lock()
+
+        def run(method_name, request_args):
+            with lock:
+                calls.append(method_name)
+                index = len(calls)
+            if index % 10 == 0:
+                raise TTransport.TTransportException(message='failed')
+
+        executor.run = run
+        summary = ThriftBenchmark(executor, 'method', {}, concurrency=4, requests=100).run()
+        self.assertEqual(len(calls), 100)
+        self.assertEqual(summary['requests'], 100)
+        self.assertEqual(summary['errors'], 10)
+        self.assertEqual(summary['error_types'], {'TTransportException': 10})
+        self.assertEqual(summary['concurrency'], 4)
+        self.assertIsNotNone(summary['latency_ms']['p999'])
+
+    def test_run_duration_at_rate(self):
+        executor = mock.Mock()
+        started = time.time()
+        summary = ThriftBenchmark(executor, 'method', {}, concurrency=2, rate=100, duration=0.2).run()
+        self.assertGreaterEqual(time.time() - started, 0.15)
+        self.assertTrue(18 <= summary['requests'] <= 21, summary['requests'])
+        self.assertEqual(summary['requests'], executor.run.call_count)
+        self.assertEqual(summary['rate'], 100)
+        self.assertEqual(summary['schedule'], 'constant')
+
+    def test_run_open_loop(self):
+        executor = mock.Mock()
+        calls = []
+
+        def run(method_name, request_args):
+            calls.append(method_name)
+            # The server stalls once, while 20 more requests are due
+            if len(calls) == 5:
+                time.sleep(0.2)
+
+        executor.run = run
+        summary = ThriftBenchmark(executor, 'method', {}, rate=100, requests=50).run()
+        self.assertEqual(summary['requests'], 50)
+        # Only the stalled request took long to serve, but the requests due during the stall waited for it
+        self.assertLess(summary['service_time_ms']['p90'], 50)
+        self.assertGreater(summary['latency_ms']['p90'], 50)
+        self.assertGreater(summary['send_lag_ms']['max'], 150)
+
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def test_run_nonblocking(self, mock_load_file):
+        mock_load_file.return_value = ECHO_THRIFT_CONTENT
+        with mock.patch.dict(sys.modules):
+            ThriftTypeBuilder(ThriftParser('Echo.thrift').parse()).build()
+            server = EchoServer(sys.modules['Echo.Echo'], False)
+            reactor = ThriftReactor('127.0.0.1', server.port, 'Echo.Echo', max_connections=2, pipeline_window=2)
+            try:
+                executor = mock.Mock(run_async=reactor.submit)
+                summary = ThriftBenchmark(executor, 'echo', {'message': 'hello', 'delay': 0.01}, concurrency=2,
+                                          nonblocking=True, pipeline=2, requests=40).run()
+            finally:
+                reactor.close()
+                server.close()
+        self.assertEqual(summary['requests'], 40)
+        self.assertEqual(summary['errors'], 0)
+        self.assertEqual(summary['concurrency'], 4)
+        self.assertEqual(server.connections, 2)
+        self.assertGreaterEqual(summary['latency_ms']['min'], 10)
+        # The server answers the requests on each connection one at a time, so pipelined requests wait for another
+        self.assertGreaterEqual(summary['latency_ms']['max'], 20)
@@ -10,8 +10,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import StringIO
 import json
+import os
+import subprocess
 import sys
+import time
 import unittest
 
 import mock
@@ -20,6 +24,11 @@ from tests import data
 from tests.data.generated.Sample.ttypes import SampleResponse
 from thriftcli import thrift_cli, ThriftCLIError
 
+# Modules that are only needed by the flags that use them, so must not be imported when thriftcli starts
+OPTIONAL_MODULES = ['kazoo', 'twitter', 'gen', 'requests_kerberos', 'httplib', 'multiprocessing']
+# The most seconds importing thriftcli may take, which is several times what it takes without the optional modules
+STARTUP_IMPORT_SECONDS = 0.5
+
 
 class TestThriftCLI(unittest.TestCase):
     @mock.patch('thriftcli.thrift_cli._load_file')
@@ -50,6 +59,14 @@ class TestThriftCLI(unittest.TestCase):
             args = thrift_cli._parse_namespace(thrift_cli._parse_args())
             expected_args = data.TEST_PARSED_ARGS6
             self.assertEqual(args, expected_args)
+        with mock.patch.object(sys, 'argv', data.TEST_CLI_ARGS7):
+            args = thrift_cli._parse_namespace(thrift_cli._parse_args())
+            expected_args = data.TEST_PARSED_ARGS7
+            self.assertEqual(args, expected_args)
+        with mock.patch.object(sys, 'argv', data.TEST_CLI_ARGS8):
+            args = thrift_cli._parse_namespace(thrift_cli._parse_args())
+            expected_args = data.TEST_PARSED_ARGS8
+            self.assertEqual(args, expected_args)
         with self.assertRaises(ThriftCLIError), mock.patch.object(sys, 'argv', data.TEST_CLI_ARGS2):
             mock_isfile.return_value = True
             mock_load_file.return_value = data.TEST_INVALID_REQUEST_BODY
@@ -57,6 +74,29 @@ class TestThriftCLI(unittest.TestCase):
         with self.assertRaises(ThriftCLIError), mock.patch.object(sys, 'argv', data.TEST_CLI_ARGS5):
             thrift_cli._parse_namespace(thrift_cli._parse_args())
 
+    def test_parse_bench_args(self):
+        parser = thrift_cli._make_bench_parser()
+        args = parser.parse_args(data.TEST_CLI_ARGS[1:] + ['--rate', '50', '--requests', '1000'])
+        self.assertEqual(thrift_cli._parse_bench_namespace(args),
+                         {'rate': 50, 'duration': None, 'requests': 1000, 'schedule': 'constant', 'ramp_to': None,
+                          'seed': None})
+        args = parser.parse_args(data.TEST_CLI_ARGS[1:])
+        self.assertEqual(thrift_cli._parse_bench_namespace(args),
+                         {'rate': None, 'duration': thrift_cli.DEFAULT_BENCH_DURATION, 'requests': None,
+                          'schedule': 'constant', 'ramp_to': None, 'seed': None})
+        args = parser.parse_args(data.TEST_CLI_ARGS[1:] + ['--rate', '10', '--schedule', 'ramp', '--ramp_to', '100',
+                                                           '--duration', '60'])
+        self.assertEqual(thrift_cli._parse_bench_namespace(args),
+                         {'rate': 10, 'duration': 60, 'requests': None, 'schedule': 'ramp', 'ramp_to': 100,
+                          'seed': None})
+        for invalid_args in [['--rate', '0'], ['--schedule', 'poisson'], ['--rate', '10', '--ramp_to', '100'],
+                             ['--rate', '10', '--schedule', 'ramp', '--ramp_to', '100'],
+                             ['--rate', '10', '--schedule', 'ramp', '--duration', '60']]:
+            with self.assertRaises(ThriftCLIError):
+                thrift_cli._parse_bench_namespace(parser.parse_args(data.TEST_CLI_ARGS[1:] + invalid_args))
+        with self.assertRaises(ThriftCLIError):
+            thrift_cli._parse_bench_namespace(parser.parse_args(data.TEST_CLI_ARGS8[1:]))
+
     def test_split_endpoint(self):
         endpoint = '%s.%s' % (data.TEST_THRIFT_SERVICE_NAME, data.TEST_THRIFT_METHOD_NAME)
         expected_service_name, expected_method_name = data.TEST_THRIFT_SERVICE_NAME, data.TEST_THRIFT_METHOD_NAME
@@ -74,3 +114,73 @@ class TestThriftCLI(unittest.TestCase):
         json_response = thrift_cli.ThriftCLI.transform_output(response, return_json=True)
         resp = json.loads(json_response)
         self.assertEqual(len(resp['tags']), 3)
+
+    def test_run_batch(self):
+        cli = thrift_cli.ThriftCLI.__new__(thrift_cli.ThriftCLI)
+        cli._service_name = data.TEST_THRIFT_SERVICE_NAME
+        cli._concurrency = 1
+        cli._nonblocking = False
+        cli._pipeline = 1
+        cli.run = mock.Mock(side_effect=[SampleResponse(message='first'), ThriftCLIError('failed'),
+                                         SampleResponse(message='third'), ThriftCLIError('not an object')])
+        lines = [
+            json.dumps({'endpoint': '%s.first' % data.TEST_THRIFT_SERVICE_NAME, 'body': {'num': 1}}),
+            json.dumps({'endpoint': 'second'}),
+            '',
+            'not json',
+            json.dumps({'endpoint': 'Other.method'}),
+            json.dumps({'body': '{"num": 3}'}),
+            json.dumps({'body': 0})
+        ]
+        output = StringIO.StringIO()
+        failures = cli.run_batch(lines, output, 'third')
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(failures, 4)
+        self.assertEqual([result['line'] for result in results], [1, 2, 4, 5, 6, 7])
+        self.assertEqual(results[0]['result']['message'], 'first')
+        self.assertEqual(results[1]['error'], {'type': 'ThriftCLIError', 'message': 'failed'})
+        self.assertEqual(results[2]['error']['type'], 'ThriftCLIError')
+        self.assertEqual(results[3]['error']['type'], 'ThriftCLIError')
+        self.assertEqual(results[4]['result']['message'], 'third')
+        self.assertEqual(results[5]['error']['type'], 'ThriftCLIError')
+        # Only a missing body defaults to no arguments, any other body is left for the conversion to reject
+        self.assertEqual(cli.run.call_args_list, [mock.call('first', {'num': 1}), mock.call('second', {}),
+                                                  mock.call('third', {'num': 3}), mock.call('third', 0)])
+
+    def test_run_batch_concurrently(self):
+        cli = thrift_cli.ThriftCLI.__new__(thrift_cli.ThriftCLI)
+        cli._service_name = data.TEST_THRIFT_SERVICE_NAME
+        cli._concurrency = 4
+        cli._nonblocking = False
+        cli._pipeline = 1
+        running = []
+        max_running = []
+
+        def run(method_name, request_body):
+            running.append(method_name)
+            max_running.append(len(running))
+            # Earlier requests take longer, so they complete after the requests following them
+            time.sleep(0.01 * (8 - request_body['index']))
+            running.remove(method_name)
+            return request_body['index']
+
+        cli.run = run
+        lines = [json.dumps({'endpoint': 'method', 'body': {'index': index}}) for index in range(8)]
+        output = StringIO.StringIO()
+        failures = cli.run_batch(lines, output)
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(failures, 0)
+        self.assertEqual(results, [{'line': index + 1, 'result': index} for index in range(8)])
+        self.assertTrue(1 < max(max_running) <= 4)
+
+    def test_startup_imports(self):
+        script = ('import json, sys, time\n'
+                  'started, preloaded = time.time(), set(sys.modules)\n'
+                  'import thriftcli.thrift_cli\n'
+                  'imported = sorted(set(sys.modules) - preloaded)\n'
+                  'print json.dumps({"seconds": time.time() - started, "modules": imported})\n')
+        environment = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+        startup = json.loads(subprocess.check_output([sys.executable, '-c', script], env=environment))
+        imported = set(module.split('.')[0] for module in startup['modules'])
+        self.assertEqual([module for module in OPTIONAL_MODULES if module in imported], [])
+        self.assertLess(startup['seconds'], STARTUP_IMPORT_SECONDS)
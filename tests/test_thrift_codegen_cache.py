@@ -0,0 +1,88 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from tests import data
+from thriftcli import ThriftCodegenCache, ThriftParseCache, hash_include_graph
+
+
+class TestThriftCodegenCache(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._thrift_dir = os.path.join(self._temp_dir, 'thrifts')
+        os.mkdir(self._thrift_dir)
+        self._write_thrift('Including.thrift', data.TEST_THRIFT_INCLUDING_CONTENT)
+        self._write_thrift('Included.thrift', data.TEST_THRIFT_INCLUDED_CONTENT)
+        self._thrift_path = os.path.join(self._thrift_dir, 'Including.thrift')
+        patcher = mock.patch('thriftcli.ThriftCodegenCache._get_compiler_version', return_value='0.11.0')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def _write_thrift(self, name, content):
+        with open(os.path.join(self._thrift_dir, name), 'w') as thrift_file:
+            thrift_file.write(content)
+
+    @staticmethod
+    def _generate(out_dir):
+        with open(os.path.join(out_dir, 'generated.py'), 'w') as generated_file:
+            generated_file.write('x' * 100)
+
+    def test_get_package_root_hit_skips_generation(self):
+        cache = ThriftCodegenCache(self._temp_dir)
+        generate = mock.Mock(side_effect=self._generate)
+        package_root = cache.get_package_root(self._thrift_path, [], generate)
+        self.assertTrue(os.path.isfile(os.path.join(package_root, 'generated.py')))
+        self.assertEqual(cache.get_package_root(self._thrift_path, [], generate), package_root)
+        self.assertEqual(generate.call_count, 1)
+
+    def test_get_package_root_miss_on_included_change(self):
+        cache = ThriftCodegenCache(self._temp_dir)
+        generate = mock.Mock(side_effect=self._generate)
+        package_root = cache.get_package_root(self._thrift_path, [], generate)
+        self._write_thrift('Included.thrift', data.TEST_THRIFT_INCLUDED_CONTENT + '\ntypedef i32 Extra')
+        package_root2 = cache.get_package_root(self._thrift_path, [], generate)
+        self.assertNotEqual(package_root, package_root2)
+        self.assertEqual(generate.call_count, 2)
+
+    def test_get_package_root_keeps_entry_over_limit(self):
+        cache = ThriftCodegenCache(self._temp_dir, max_size=50)
+        package_root = cache.get_package_root(self._thrift_path, [], self._generate)
+        self.assertTrue(os.path.isdir(package_root))
+        # The next entry evicts the first, but is kept itself although it is also over the limit
+        package_root2 = cache.get_package_root(os.path.join(self._thrift_dir, 'Included.thrift'), [], self._generate)
+        self.assertFalse(os.path.exists(package_root))
+        self.assertTrue(os.path.isdir(package_root2))
+
+    def test_hash_include_graph(self):
+        parse_cache = ThriftParseCache(self._temp_dir)
+        include_graph_hash = hash_include_graph(self._thrift_path, [])
+        self.assertEqual(hash_include_graph(self._thrift_path, [], parse_cache), include_graph_hash)
+        self.assertEqual(hash_include_graph(self._thrift_path, [], parse_cache), include_graph_hash)
+        self._write_thrift('Included.thrift', data.TEST_THRIFT_INCLUDED_CONTENT + '\ntypedef i32 Extra')
+        self.assertNotEqual(hash_include_graph(self._thrift_path, [], parse_cache), include_graph_hash)
+
+    def test_get_package_root_evicts_least_recently_used(self):
+        cache = ThriftCodegenCache(self._temp_dir, max_size=150)
+        package_root = cache.get_package_root(self._thrift_path, [], self._generate)
+        os.utime(package_root, (0, 0))
+        package_root2 = cache.get_package_root(os.path.join(self._thrift_dir, 'Included.thrift'), [], self._generate)
+        self.assertFalse(os.path.exists(package_root))
+        self.assertTrue(os.path.isdir(package_root2))
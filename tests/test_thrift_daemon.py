@@ -0,0 +1,146 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import unittest
+
+import mock
+from thrift.transport import TTransport
+
+from tests import data
+from thriftcli import ThriftCLIError, ThriftDaemon, ThriftDaemonClient
+
+TEST_OPTIONS = {
+    'thrift_path': data.TEST_THRIFT_PATH,
+    'server_address': data.TEST_SERVER_ADDRESS,
+    'service_name': data.TEST_THRIFT_SERVICE_NAME,
+    'tls': False,
+    'tls_key_path': None,
+    'cert_verification_mode': None,
+    'thrift_dir_paths': [],
+    'zookeeper': False,
+    'client_id': None,
+    'proxy': None,
+    'use_cache': True,
+    'in_memory': False,
+    'protocol': 'finagle',
+    'transport': 'framed',
+    'method_name': data.TEST_THRIFT_METHOD_NAME,
+    'request_body': {'num': 1},
+    'return_json': False,
+}
+
+
+class TestThriftDaemon(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        self._socket_path = os.path.join(temp_dir, 'daemon', 'daemon.sock')
+        patcher = mock.patch('thriftcli.thrift_daemon.ThriftCLI')
+        self._mock_cli_class = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('thriftcli.thrift_daemon.hash_include_graph', return_value='hash')
+        self._mock_hash_include_graph = patcher.start()
+        self.addCleanup(patcher.stop)
+        self._daemon = ThriftDaemon(self._socket_path)
+        self._thread = threading.Thread(target=self._daemon.serve_forever)
+        self._thread.start()
+        self.assertTrue(self._daemon.wait_until_ready(5))
+        self._client = ThriftDaemonClient(self._socket_path)
+
+    def tearDown(self):
+        if self._thread.is_alive():
+            self._daemon.stop()
+            self._thread.join()
+
+    def test_run_reuses_cli(self):
+        self._mock_cli_class.return_value.run.return_value = 'result'
+        self.assertEqual(self._client.run(TEST_OPTIONS), 'result')
+        self.assertEqual(self._client.run(dict(TEST_OPTIONS, request_body={'num': 2})), 'result')
+        self.assertEqual(self._mock_cli_class.call_count, 1)
+        self._mock_cli_class.assert_called_with(data.TEST_THRIFT_PATH, data.TEST_SERVER_ADDRESS,
+                                                data.TEST_THRIFT_SERVICE_NAME, False, None, None, [], False,
+                                                client_id=None, proxy=None, use_cache=True, in_memory=False,
+                                                zookeeper_resolver=mock.ANY, protocol='finagle', transport='framed')
+        self.assertEqual(self._mock_cli_class.return_value.run.call_args_list,
+                         [mock.call(data.TEST_THRIFT_METHOD_NAME, {'num': 1}, False, json_indent=4, sort_keys=True),
+                          mock.call(data.TEST_THRIFT_METHOD_NAME, {'num': 2}, False, json_indent=4, sort_keys=True)])
+        self._client.run(dict(TEST_OPTIONS, server_address='otherhost:9090'))
+        self.assertEqual(self._mock_cli_class.call_count, 2)
+
+    @mock.patch('thriftcli.thrift_daemon.ThriftServerSetCache')
+    @mock.patch('thriftcli.thrift_daemon.ThriftZookeeperResolver')
+    def test_run_picks_resolver_by_use_cache(self, mock_resolver_class, mock_cache_class):
+        cached_resolver, uncached_resolver = mock.Mock(), mock.Mock()
+        mock_resolver_class.side_effect = [cached_resolver, uncached_resolver]
+        self._client.run(TEST_OPTIONS)
+        self._client.run(dict(TEST_OPTIONS, use_cache=False))
+        self._client.run(dict(TEST_OPTIONS, use_cache=False, server_address='otherhost:9090'))
+        self.assertEqual(mock_resolver_class.call_args_list,
+                         [mock.call(mock_cache_class.return_value, watch=True), mock.call(None, watch=True)])
+        self.assertEqual([call[1]['zookeeper_resolver'] for call in self._mock_cli_class.call_args_list],
+                         [cached_resolver, uncached_resolver, uncached_resolver])
+        self._daemon.stop()
+        self._thread.join()
+        cached_resolver.close.assert_called_once_with()
+        uncached_resolver.close.assert_called_once_with()
+
+    def test_run_reloads_changed_thrift_files(self):
+        stale_cli, fresh_cli = mock.Mock(), mock.Mock()
+        fresh_cli.run.return_value = 'result'
+        self._mock_cli_class.side_effect = [stale_cli, fresh_cli]
+        self._client.run(TEST_OPTIONS)
+        self._client.run(TEST_OPTIONS)
+        self.assertEqual(self._mock_cli_class.call_count, 1)
+        self._mock_hash_include_graph.assert_called_with(data.TEST_THRIFT_PATH, [], mock.ANY)
+        self._mock_hash_include_graph.return_value = 'changed'
+        self.assertEqual(self._client.run(TEST_OPTIONS), 'result')
+        self.assertEqual(self._mock_cli_class.call_count, 2)
+        stale_cli.cleanup.assert_called_once_with()
+
+    def test_run_returns_none(self):
+        self._mock_cli_class.return_value.run.return_value = None
+        self.assertIsNone(self._client.run(TEST_OPTIONS))
+
+    def test_run_error(self):
+        self._mock_cli_class.return_value.run.side_effect = ThriftCLIError('failed')
+        with self.assertRaisesRegexp(ThriftCLIError, 'ThriftCLIError: failed'):
+            self._client.run(TEST_OPTIONS)
+        self.assertEqual(self._mock_cli_class.call_count, 1)
+
+    def test_run_reconnects(self):
+        stale_cli, fresh_cli = mock.Mock(), mock.Mock()
+        stale_cli.run.side_effect = [None, TTransport.TTransportException(message='closed')]
+        fresh_cli.run.return_value = 'result'
+        self._mock_cli_class.side_effect = [stale_cli, fresh_cli]
+        self._client.run(TEST_OPTIONS)
+        self.assertEqual(self._client.run(TEST_OPTIONS), 'result')
+        stale_cli.cleanup.assert_called_once_with()
+
+    def test_socket_permissions(self):
+        self.assertEqual(stat.S_IMODE(os.stat(self._socket_path).st_mode) & 0o077, 0)
+        with self.assertRaises(ThriftCLIError):
+            ThriftDaemon(self._socket_path).serve_forever()
+
+    def test_stop(self):
+        self._client.run(TEST_OPTIONS)
+        self._client.stop()
+        self._thread.join(5)
+        self.assertFalse(self._thread.is_alive())
+        self.assertFalse(os.path.exists(self._socket_path))
+        self._mock_cli_class.return_value.cleanup.assert_called_once_with()
+        with self.assertRaises(ThriftCLIError):
+            self._client.run(TEST_OPTIONS)
@@ -10,16 +10,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import shutil
+import ssl
+import sys
+import tempfile
 import unittest
 
 import mock
+from thrift.transport import TTransport
 
 from tests import data
-from thriftcli import ThriftExecutor
+from thriftcli import ThriftExecutor, ThriftLoadBalancer
 
 
 class TestThriftExecutor(unittest.TestCase):
-    @mock.patch('thriftcli.thrift_executor.TFinagleProtocol')
+    @mock.patch('twitter.common.rpc.finagle.protocol.TFinagleProtocol')
     @mock.patch('thriftcli.TTransport.TFramedTransport.open')
     @mock.patch('thriftcli.TSocket.TSocket')
     @mock.patch('thriftcli.ThriftExecutor._import_package')
@@ -39,7 +45,7 @@ class TestThriftExecutor(unittest.TestCase):
         mock_finagle_protocol.assert_called()
 
     # Test Case for when thrift file is in current directory
-    @mock.patch('thriftcli.thrift_executor.TFinagleProtocol')
+    @mock.patch('twitter.common.rpc.finagle.protocol.TFinagleProtocol')
     @mock.patch('thriftcli.TTransport.TFramedTransport.open')
     @mock.patch('thriftcli.TSocket.TSocket')
     @mock.patch('thriftcli.ThriftExecutor._import_package')
@@ -58,10 +64,51 @@ class TestThriftExecutor(unittest.TestCase):
         self.assertTrue(mock_transport_open.called)
         mock_finagle_protocol.assert_called()
 
+    @mock.patch('twitter.common.rpc.finagle.protocol.TFinagleProtocol')
+    @mock.patch('thriftcli.TTransport.TFramedTransport.open')
+    @mock.patch('thriftcli.transport.TProxySocket')
+    @mock.patch('thriftcli.ThriftExecutor._import_package')
+    @mock.patch('subprocess.call')
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def test_init_proxy_pool(self, mock_load_file, mock_call, mock_import_package, mock_proxy_socket,
+                             mock_transport_open, mock_finagle_protocol):
+        mock_load_file.return_value = data.TEST_THRIFT_CONTENT
+        mock_call.return_value = 0
+        executor = ThriftExecutor(data.TEST_THRIFT_PATH, data.TEST_SERVER_ADDRESS, data.TEST_THRIFT_SERVICE_REFERENCE,
+                                  data.TEST_THRIFT_NAMESPACES, proxy='proxyhost:3128', connections=4)
+        # Every connection of the pool tunnels through the same tunneler, sharing its auth header. The pool opens them on
+        # threads, where mock's call_count can miss calls, so the calls are counted from call_args_list
+        self.assertEqual(len(mock_proxy_socket.call_args_list), 4)
+        tunnelers = set(id(call[1]['tunneler']) for call in mock_proxy_socket.call_args_list)
+        self.assertEqual(len(tunnelers), 1)
+        mock_proxy_socket.assert_called_with('proxyhost', '3128', data.TEST_SERVER_HOSTNAME, data.TEST_SERVER_PORT,
+                                             tunneler=mock.ANY)
+        self.assertEqual(len(mock_transport_open.call_args_list), 4)
+        self.assertEqual(executor.get_tunnel_summary()['tunnels'], 0)
+
+    @mock.patch('twitter.common.rpc.finagle.protocol.TFinagleProtocol')
+    @mock.patch('thriftcli.TTransport.TFramedTransport.open')
+    @mock.patch('thriftcli.tls_transport.TProxySSLSocket')
+    @mock.patch('thriftcli.ThriftExecutor._import_package')
+    @mock.patch('subprocess.call')
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def test_init_proxy_ssl(self, mock_load_file, mock_call, mock_import_package, mock_proxy_ssl_socket,
+                            mock_transport_open, mock_finagle_protocol):
+        mock_load_file.return_value = data.TEST_THRIFT_CONTENT
+        mock_call.return_value = 0
+        ThriftExecutor(data.TEST_THRIFT_FILE, data.TEST_SERVER_ADDRESS, data.TEST_THRIFT_SERVICE_REFERENCE,
+                       data.TEST_THRIFT_NAMESPACES, True, None, 'required', proxy='proxyhost:3128')
+        # Proxied connections do not verify the server, whatever the verification mode
+        tls_context = mock_proxy_ssl_socket.call_args[1]['tls_context']
+        self.assertEqual(tls_context.ssl_context.verify_mode, ssl.CERT_NONE)
+        self.assertEqual(tls_context.ssl_context.protocol, ssl.PROTOCOL_TLSv1_2)
+        mock_proxy_ssl_socket.assert_called_with(data.TEST_SERVER_HOSTNAME, data.TEST_SERVER_PORT, 'proxyhost', '3128',
+                                                 ca_certs=None, tunneler=mock.ANY, tls_context=tls_context)
+
     # Test Case for when thrift file is in current directory
-    @mock.patch('thriftcli.thrift_executor.TFinagleProtocol')
+    @mock.patch('twitter.common.rpc.finagle.protocol.TFinagleProtocol')
     @mock.patch('thriftcli.TTransport.TFramedTransport.open')
-    @mock.patch('thriftcli.TSSLSocket.TSSLSocket')
+    @mock.patch('thrift.transport.TSSLSocket.TSSLSocket')
     @mock.patch('thriftcli.ThriftExecutor._import_package')
     @mock.patch('subprocess.call')
     @mock.patch('thriftcli.ThriftParser._load_file')
@@ -74,7 +121,8 @@ class TestThriftExecutor(unittest.TestCase):
         command = 'thrift -r -I . --gen py %s' % data.TEST_THRIFT_FILE
         mock_call.assert_called_with(command, shell=True)
         mock_import_package.assert_called_with(data.TEST_THRIFT_MODULE_NAME, data.TEST_THRIFT_PY_NAMESPACE)
-        mock_tsocket.assert_called_with(data.TEST_SERVER_HOSTNAME, data.TEST_SERVER_PORT,ca_certs=None,validate_callback=mock.ANY)
+        mock_tsocket.assert_called_with(data.TEST_SERVER_HOSTNAME, data.TEST_SERVER_PORT, ssl_context=mock.ANY,
+                                        server_hostname=data.TEST_SERVER_HOSTNAME, validate_callback=mock.ANY)
         self.assertTrue(mock_transport_open.called)
         mock_finagle_protocol.assert_called()
 
@@ -88,3 +136,102 @@ class TestThriftExecutor(unittest.TestCase):
         self.assertEqual((hostname, port), (expected_hostname, expected_port))
         self.assertEqual((hostname2, port2), (expected_hostname2, expected_port2))
         self.assertEqual((hostname3, port3), (expected_hostname3, expected_port3))
+
+    @mock.patch('twitter.common.rpc.finagle.protocol.TFinagleProtocol')
+    @mock.patch('thriftcli.TTransport.TFramedTransport.open')
+    @mock.patch('thriftcli.TSocket.TSocket')
+    @mock.patch('thriftcli.ThriftExecutor._import_package')
+    @mock.patch('subprocess.call')
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def test_init_codegen_cache(self, mock_load_file, mock_call, mock_import_package, mock_tsocket,
+                                mock_transport_open, mock_finagle_protocol):
+        mock_load_file.return_value = data.TEST_THRIFT_CONTENT
+        mock_call.return_value = 0
+        codegen_cache = mock.Mock()
+        codegen_cache.get_package_root.side_effect = lambda thrift_path, thrift_dir_paths, generate: generate('out')
+        ThriftExecutor(data.TEST_THRIFT_PATH, data.TEST_SERVER_ADDRESS, data.TEST_THRIFT_SERVICE_REFERENCE,
+                       data.TEST_THRIFT_NAMESPACES, codegen_cache=codegen_cache)
+        command = 'thrift -r -I %s --gen py -out out %s' % (data.TEST_THRIFT_DIR, data.TEST_THRIFT_PATH)
+        mock_call.assert_called_with(command, shell=True)
+        codegen_cache.get_package_root.assert_called_with(data.TEST_THRIFT_PATH, [data.TEST_THRIFT_DIR], mock.ANY)
+        mock_import_package.assert_called_with(data.TEST_THRIFT_MODULE_NAME, data.TEST_THRIFT_PY_NAMESPACE)
+
+    @mock.patch('twitter.common.rpc.finagle.protocol.TFinagleProtocol')
+    @mock.patch('thriftcli.TTransport.TFramedTransport.close')
+    @mock.patch('thriftcli.TTransport.TFramedTransport.open')
+    @mock.patch('thriftcli.TSocket.TSocket')
+    @mock.patch('thriftcli.ThriftExecutor._import_package')
+    @mock.patch('subprocess.call')
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def test_run_with_connections(self, mock_load_file, mock_call, mock_import_package, mock_tsocket,
+                                  mock_transport_open, mock_transport_close, mock_finagle_protocol):
+        mock_load_file.return_value = data.TEST_THRIFT_CONTENT
+        mock_call.return_value = 0
+        mock_finagle_protocol.side_effect = lambda transport, client_id: mock.Mock()
+        executor = ThriftExecutor(data.TEST_THRIFT_PATH, data.TEST_SERVER_ADDRESS, data.TEST_THRIFT_SERVICE_REFERENCE,
+                                  data.TEST_THRIFT_NAMESPACES, connections=3)
+        self.assertEqual(mock_tsocket.call_count, 3)
+        self.assertEqual(mock_transport_open.call_count, 3)
+        method = mock.Mock(side_effect=[TTransport.TTransportException(), 'result', 'result', 'result'])
+        with mock.patch('thriftcli.ThriftExecutor._get_method', return_value=method) as mock_get_method:
+            with self.assertRaises(TTransport.TTransportException):
+                executor.run(data.TEST_THRIFT_METHOD_NAME, {})
+            self.assertEqual(mock_transport_close.call_count, 1)
+            for _ in range(3):
+                self.assertEqual(executor.run(data.TEST_THRIFT_METHOD_NAME, {}), 'result')
+            # The connection that failed is replaced once it is used again
+            self.assertEqual(mock_tsocket.call_count, 4)
+            self.assertEqual(len(set(call[0][1] for call in mock_get_method.call_args_list)), 4)
+        executor.cleanup()
+        self.assertEqual(mock_transport_close.call_count, 4)
+
+    @mock.patch('twitter.common.rpc.finagle.protocol.TFinagleProtocol')
+    @mock.patch('thriftcli.TSocket.TSocket')
+    @mock.patch('thriftcli.ThriftExecutor._import_package')
+    @mock.patch('subprocess.call')
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def test_run_balanced(self, mock_load_file, mock_call, mock_import_package, mock_tsocket, mock_finagle_protocol):
+        mock_load_file.return_value = data.TEST_THRIFT_CONTENT
+        mock_call.return_value = 0
+        mock_finagle_protocol.side_effect = lambda transport, client_id: mock.Mock()
+        sockets = []
+
+        def make_socket(host, port):
+            sockets.append(mock.Mock(host=host))
+            if host == 'down':
+                sockets[-1].open.side_effect = TTransport.TTransportException(message='refused')
+            return sockets[-1]
+
+        mock_tsocket.side_effect = make_socket
+        load_balancer = ThriftLoadBalancer(['up1:9090', 'down:9090', 'up2:9090'], 'round_robin')
+        executor = ThriftExecutor(data.TEST_THRIFT_PATH, data.TEST_SERVER_ADDRESS, data.TEST_THRIFT_SERVICE_REFERENCE,
+                                  data.TEST_THRIFT_NAMESPACES, connections=2, load_balancer=load_balancer)
+        self.assertEqual(sockets, [])
+        with mock.patch('thriftcli.ThriftExecutor._get_method', return_value=mock.Mock(return_value='result')):
+            for _ in range(6):
+                self.assertEqual(executor.run(data.TEST_THRIFT_METHOD_NAME, {}), 'result')
+        # The member that failed to connect is ejected, and the requests are spread over the others, reusing a
+        # connection to each
+        self.assertEqual(load_balancer.get_available(), ['up1:9090', 'up2:9090'])
+        self.assertEqual([connected_socket.host for connected_socket in sockets], ['up1', 'down', 'up2'])
+        executor.cleanup()
+        self.assertEqual([connected_socket.close.call_count for connected_socket in sockets], [1, 0, 1])
+
+    def test_import_package_replaces_older_version(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        modules = mock.patch.dict(sys.modules)
+        modules.start()
+        self.addCleanup(modules.stop)
+        for version in ['old', 'new']:
+            package_dir = os.path.join(temp_dir, version, 'generated_package')
+            os.makedirs(package_dir)
+            with open(os.path.join(package_dir, '__init__.py'), 'w') as init_file:
+                init_file.write("__all__ = ['ttypes']\n")
+            with open(os.path.join(package_dir, 'ttypes.py'), 'w') as ttypes_file:
+                ttypes_file.write('VERSION = %r\n' % version)
+            # As in the daemon, the new version is imported while the modules of the old one are still loaded
+            with mock.patch('sys.path', [os.path.join(temp_dir, version)] + sys.path):
+                ThriftExecutor._import_package('Generated', 'generated_package')
+            self.assertEqual(sys.modules['Generated.ttypes'].VERSION, version)
+            self.assertEqual(sys.modules['generated_package.ttypes'].VERSION, version)
@@ -0,0 +1,109 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import socket
+import threading
+import unittest
+
+import mock
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TSocket, TTransport
+
+from thriftcli import TZeroCopyFramedTransport, INITIAL_BUFFER_SIZE
+
+
+def _make_socket_transport(sock):
+    socket_transport = TSocket.TSocket()
+    socket_transport.setHandle(sock)
+    return socket_transport
+
+
+class TestTZeroCopyFramedTransport(unittest.TestCase):
+    def setUp(self):
+        client_socket, server_socket = socket.socketpair()
+        self.client = TZeroCopyFramedTransport(_make_socket_transport(client_socket))
+        self.server = TTransport.TFramedTransport(_make_socket_transport(server_socket))
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+
+    def _echo(self, count):
+        """ Echoes count frames back from the server with thrift's own framed transport. """
+        def echo():
+            for _ in range(count):
+                self.server.readFrame()
+                self.server.write(self.server.read(1 << 30))
+                self.server.flush()
+        thread = threading.Thread(target=echo)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def test_round_trip_large_frame(self):
+        frame = ''.join(chr(i % 256) for i in range(256)) * (16 * 1024)
+        thread = self._echo(1)
+        self.client.write(frame[:1000])
+        self.client.write(frame[1000:])
+        self.client.flush()
+        self.assertEqual(self.client.read(len(frame)), frame)
+        thread.join()
+
+    def test_reuses_read_buffer(self):
+        thread = self._echo(3)
+        read_buffers = []
+        for frame in ['a' * 100, 'b' * 1000, 'c' * 10]:
+            self.client.write(frame)
+            self.client.flush()
+            self.assertEqual(self.client.read(len(frame)), frame)
+            read_buffers.append(self.client._read_buffer)
+        thread.join()
+        self.assertEqual(len(read_buffers[0]), INITIAL_BUFFER_SIZE)
+        self.assertIs(read_buffers[1], read_buffers[0])
+        self.assertIs(read_buffers[2], read_buffers[0])
+
+    def test_accelerated_protocol(self):
+        thread = self._echo(1)
+        protocol = TBinaryProtocol.TBinaryProtocolAccelerated(self.client)
+        protocol.writeMessageBegin('echo', 1, 7)
+        protocol.writeString('x' * (2 * INITIAL_BUFFER_SIZE))
+        protocol.writeMessageEnd()
+        self.client.flush()
+        self.assertEqual(protocol.readMessageBegin(), ('echo', 1, 7))
+        self.assertEqual(protocol.readString(), 'x' * (2 * INITIAL_BUFFER_SIZE))
+        thread.join()
+
+    def test_memory_buffer(self):
+        buffer = TTransport.TMemoryBuffer()
+        writer = TZeroCopyFramedTransport(buffer)
+        writer.write('frame')
+        writer.flush()
+        self.assertEqual(buffer.getvalue(), '\x00\x00\x00\x05frame')
+        reader = TZeroCopyFramedTransport(TTransport.TMemoryBuffer(buffer.getvalue()))
+        self.assertEqual(reader.read(5), 'frame')
+        with self.assertRaises(TTransport.TTransportException):
+            reader.read(1)
+
+    def test_connection_reset(self):
+        reset = socket.error(errno.ECONNRESET, 'Connection reset by peer')
+        socket_transport = TSocket.TSocket()
+        socket_transport.setHandle(mock.Mock(**{'recv_into.side_effect': reset}))
+        transport = TZeroCopyFramedTransport(socket_transport)
+        with mock.patch('sys.platform', 'darwin'):
+            with self.assertRaises(TTransport.TTransportException) as context:
+                transport.read(1)
+        self.assertEqual(context.exception.type, TTransport.TTransportException.END_OF_FILE)
+        self.assertFalse(socket_transport.isOpen())
+        socket_transport.setHandle(mock.Mock(**{'recv_into.side_effect': reset}))
+        with mock.patch('sys.platform', 'linux2'), self.assertRaises(socket.error):
+            transport.read(1)
@@ -0,0 +1,98 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+
+import mock
+from thrift.Thrift import TType
+
+from thriftcli import ThriftJSONWriter, dump_json
+
+
+class SampleStruct(object):
+    thrift_spec = (
+        None,
+        (1, TType.STRING, 'name', None, None),
+        (2, TType.LIST, 'scores', (TType.I32, None, False), None),
+        (3, TType.MAP, 'weights', (TType.STRING, None, TType.DOUBLE, None, False), None),
+        (4, TType.SET, 'tags', (TType.STRING, None, False), None),
+        (5, TType.STRUCT, 'child', None, None),
+    )
+
+    def __init__(self, name=None, scores=None, weights=None, tags=None, child=None):
+        self.name = name
+        self.scores = scores
+        self.weights = weights
+        self.tags = tags
+        self.child = child
+
+
+class SampleObject(object):
+    def __init__(self):
+        self.message = u'caf\xe9 "quoted"'
+        self.values = [1.5, float('inf'), None, True]
+
+
+def _default_json_handler(obj):
+    if isinstance(obj, set) or isinstance(obj, frozenset):
+        return list(obj)
+    else:
+        return obj.__dict__
+
+
+SAMPLE_RESULT = SampleStruct(name='parent', scores=[1, 2, 3], weights={'b': 0.5, 'a': 2.0}, tags={'tag'},
+                             child=SampleStruct(name='child', scores=[], weights={}, child=SampleObject()))
+
+
+class TestThriftJSONWriter(unittest.TestCase):
+    def test_matches_json_dumps(self):
+        expected = json.dumps(SAMPLE_RESULT, default=_default_json_handler, sort_keys=True, indent=4,
+                              separators=(',', ': '))
+        self.assertEqual(dump_json(SAMPLE_RESULT, indent=4, sort_keys=True), expected)
+        self.assertEqual(dump_json([{1: SAMPLE_RESULT}, None], indent=2, sort_keys=True),
+                         json.dumps([{1: SAMPLE_RESULT}, None], default=_default_json_handler, sort_keys=True,
+                                    indent=2, separators=(',', ': ')))
+
+    def test_compact_declaration_order(self):
+        result = SampleStruct(name='parent', scores=[1, 2], weights={'a': 2.0}, tags={'tag'}, child=SampleStruct())
+        self.assertEqual(dump_json(result),
+                         '{"name":"parent","scores":[1,2],"weights":{"a":2.0},"tags":["tag"],"child":'
+                         '{"name":null,"scores":null,"weights":null,"tags":null,"child":null}}')
+
+    @mock.patch('thriftcli.thrift_json_writer.C_ENCODER_BATCH_SIZE', 2)
+    def test_compact_batches(self):
+        results = [[SAMPLE_RESULT] * 5, [], [[1, {2}]] * 3]
+        for result in results:
+            expected = json.dumps(result, default=_default_json_handler)
+            self.assertEqual(json.loads(dump_json(result)), json.loads(expected))
+
+    @mock.patch('thriftcli.thrift_json_writer.C_ENCODER_BATCH_SIZE', 2)
+    @mock.patch('thriftcli.thrift_json_writer.WRITE_SIZE', 16)
+    def test_compact_writes_plain_lists_in_batches(self):
+        output = mock.Mock()
+        result = SampleStruct(name='parent', scores=range(1000, 1100), weights={'a': 2.0})
+        ThriftJSONWriter(output).write(result)
+        chunks = [call[0][0] for call in output.write.call_args_list]
+        # The list of scores is written a few elements at a time, rather than as one string
+        self.assertLess(max(len(chunk) for chunk in chunks), 32)
+        self.assertEqual(json.loads(''.join(chunks)), json.loads(json.dumps(result, default=_default_json_handler)))
+
+    @mock.patch('thriftcli.thrift_json_writer.WRITE_SIZE', 16)
+    def test_writes_incrementally(self):
+        output = mock.Mock()
+        ThriftJSONWriter(output, indent=4, sort_keys=True).write(SAMPLE_RESULT)
+        chunks = [call[0][0] for call in output.write.call_args_list]
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunks), dump_json(SAMPLE_RESULT, indent=4, sort_keys=True))
+        with self.assertRaises(TypeError):
+            dump_json({(1, 2): 'tuple keys are not JSON'})
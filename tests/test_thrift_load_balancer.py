@@ -0,0 +1,80 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import unittest
+
+import mock
+
+from thriftcli import LeastOutstandingPolicy, PowerOfTwoChoicesPolicy, RoundRobinPolicy, ThriftCLIError, \
+    ThriftLoadBalancer, make_policy
+
+ADDRESSES = ['host1:9090', 'host2:9090', 'host3:9090']
+
+
+class TestLoadBalancingPolicies(unittest.TestCase):
+    def test_round_robin(self):
+        policy = RoundRobinPolicy()
+        self.assertEqual([policy.choose(ADDRESSES, {}) for _ in range(4)], ADDRESSES + ADDRESSES[:1])
+
+    def test_least_outstanding(self):
+        policy = LeastOutstandingPolicy(seed=1)
+        outstanding = {'host1:9090': 3, 'host2:9090': 1, 'host3:9090': 2}
+        self.assertEqual(set(policy.choose(ADDRESSES, outstanding) for _ in range(10)), set(['host2:9090']))
+        outstanding['host3:9090'] = 1
+        self.assertEqual(set(policy.choose(ADDRESSES, outstanding) for _ in range(50)),
+                         set(['host2:9090', 'host3:9090']))
+
+    def test_power_of_two_choices(self):
+        policy = PowerOfTwoChoicesPolicy(seed=1)
+        outstanding = {'host1:9090': 10, 'host2:9090': 0, 'host3:9090': 0}
+        choices = [policy.choose(ADDRESSES, outstanding) for _ in range(100)]
+        # The most loaded member is never the less loaded of two, while the others are both picked
+        self.assertNotIn('host1:9090', choices)
+        self.assertEqual(set(choices), set(['host2:9090', 'host3:9090']))
+        self.assertEqual(policy.choose(ADDRESSES[:1], outstanding), 'host1:9090')
+
+    def test_make_policy(self):
+        self.assertIsInstance(make_policy('round_robin'), RoundRobinPolicy)
+        custom_policy = mock.Mock()
+        self.assertIs(make_policy(custom_policy), custom_policy)
+        with self.assertRaises(ThriftCLIError):
+            make_policy('random')
+
+
+class TestThriftLoadBalancer(unittest.TestCase):
+    def test_acquire(self):
+        load_balancer = ThriftLoadBalancer(ADDRESSES, 'least_outstanding', seed=1)
+        acquired = [load_balancer.acquire() for _ in range(6)]
+        self.assertEqual(sorted(acquired), sorted(ADDRESSES * 2))
+        load_balancer.release('host2:9090')
+        self.assertEqual(load_balancer.acquire(), 'host2:9090')
+
+    def test_eject(self):
+        load_balancer = ThriftLoadBalancer(ADDRESSES, 'round_robin', ejection_seconds=30)
+        load_balancer.eject('host2:9090')
+        self.assertEqual(load_balancer.get_available(), ['host1:9090', 'host3:9090'])
+        self.assertNotIn('host2:9090', [load_balancer.acquire() for _ in range(4)])
+        with mock.patch('time.time', return_value=time.time() + 31):
+            self.assertEqual(load_balancer.get_available(), ADDRESSES)
+
+    def test_eject_every_member(self):
+        load_balancer = ThriftLoadBalancer(ADDRESSES[:2], 'round_robin')
+        for address in ADDRESSES[:2]:
+            load_balancer.eject(address)
+        self.assertEqual(load_balancer.get_available(), [])
+        # With every member ejected, requests are still spread over all of them
+        self.assertEqual(sorted(load_balancer.acquire() for _ in range(2)), ADDRESSES[:2])
+
+    def test_requires_addresses(self):
+        with self.assertRaises(ThriftCLIError):
+            ThriftLoadBalancer([])
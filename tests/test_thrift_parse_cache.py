@@ -0,0 +1,78 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from tests import data
+from thriftcli import ThriftParseCache, ThriftParser
+
+
+class TestThriftParseCache(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._thrift_path = os.path.join(self._temp_dir, 'Including.thrift')
+        self._included_path = os.path.join(self._temp_dir, 'Included.thrift')
+        self._write_thrift(self._thrift_path, data.TEST_THRIFT_INCLUDING_CONTENT)
+        self._write_thrift(self._included_path, data.TEST_THRIFT_INCLUDED_CONTENT)
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    @staticmethod
+    def _write_thrift(path, content):
+        with open(path, 'w') as thrift_file:
+            thrift_file.write(content)
+
+    def test_get_after_save(self):
+        cache = ThriftParseCache(self._temp_dir)
+        self.assertIsNone(cache.get(self._thrift_path))
+        cache.put(self._thrift_path, data.TEST_THRIFT_INCLUDING_CONTENT, 'parsed')
+        cache.save()
+        self.assertEqual(ThriftParseCache(self._temp_dir).get(self._thrift_path), 'parsed')
+
+    def test_get_after_modification(self):
+        cache = ThriftParseCache(self._temp_dir)
+        cache.put(self._thrift_path, data.TEST_THRIFT_INCLUDING_CONTENT, 'parsed')
+        cache.put(self._included_path, data.TEST_THRIFT_INCLUDED_CONTENT, 'parsed included')
+        self._write_thrift(self._included_path, data.TEST_THRIFT_INCLUDED_CONTENT + '\ntypedef i32 Extra')
+        self.assertIsNone(cache.get(self._included_path))
+        self.assertEqual(cache.get(self._thrift_path), 'parsed')
+
+    def test_get_after_touch(self):
+        cache = ThriftParseCache(self._temp_dir)
+        cache.put(self._thrift_path, data.TEST_THRIFT_INCLUDING_CONTENT, 'parsed')
+        cache.save()
+        os.utime(self._thrift_path, (0, 0))
+        cache = ThriftParseCache(self._temp_dir)
+        self.assertEqual(cache.get(self._thrift_path), 'parsed')
+        with mock.patch('thriftcli.thrift_parse_cache._hash_file') as mock_hash_file:
+            self.assertEqual(cache.get(self._thrift_path), 'parsed')
+            self.assertFalse(mock_hash_file.called)
+
+    def test_load_is_lazy(self):
+        with mock.patch('cPickle.load') as mock_load:
+            cache = ThriftParseCache(self._temp_dir)
+            cache.save()
+            self.assertFalse(mock_load.called)
+
+    def test_parse_with_cache(self):
+        expected_result = ThriftParser(self._thrift_path, [self._temp_dir]).parse()
+        ThriftParser(self._thrift_path, [self._temp_dir], ThriftParseCache(self._temp_dir)).parse()
+        with mock.patch('thriftcli.ThriftParser._parse_definitions') as mock_parse_definitions:
+            result = ThriftParser(self._thrift_path, [self._temp_dir], ThriftParseCache(self._temp_dir)).parse()
+            self.assertFalse(mock_parse_definitions.called)
+        self.assertEqual(result, expected_result)
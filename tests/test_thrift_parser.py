@@ -10,12 +10,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import multiprocessing
+import os
+import shutil
+import tempfile
+import textwrap
 import unittest
 
 import mock
 
 from tests import data
-from thriftcli import ThriftParser, ThriftParseResult, ThriftCLIError
+from thriftcli import ThriftParser, ThriftCLIError, ThriftService, ThriftStruct, ThriftType
 
 
 class TestThriftParser(unittest.TestCase):
@@ -40,86 +45,224 @@ class TestThriftParser(unittest.TestCase):
         self.assertEqual(mock_load_file.call_args_list, expected_call_args_list)
         self.assertEqual(parse_result, expected_parse_result)
 
+    @mock.patch('os.path.isfile')
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def test_parse_diamond_includes(self, mock_load_file, mock_is_file):
+        contents = {
+            '/thrifts/Top.thrift': 'include "Left.thrift"\ninclude "Right.thrift"\n',
+            '/thrifts/Left.thrift': 'include "Common.thrift"\nstruct LeftStruct {\n1: Common.CommonStruct c\n}\n',
+            '/thrifts/Right.thrift': 'include "Common.thrift"\nstruct RightStruct {\n1: Common.CommonStruct c\n}\n',
+            '/thrifts/Common.thrift': 'struct CommonStruct {\n1: i32 value\n}\n'
+        }
+        mock_load_file.side_effect = contents.get
+        mock_is_file.side_effect = lambda path: path in contents
+        parse_result = ThriftParser('/thrifts/Top.thrift').parse()
+        self.assertEqual(mock_load_file.call_count, len(contents))
+        self.assertEqual(set(parse_result.structs), {'Left.LeftStruct', 'Right.RightStruct', 'Common.CommonStruct'})
+
+    @mock.patch('os.path.isfile')
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def test_parse_circular_includes(self, mock_load_file, mock_is_file):
+        contents = {
+            '/thrifts/First.thrift': 'include "Second.thrift"\n',
+            '/thrifts/Second.thrift': 'include "First.thrift"\n'
+        }
+        mock_load_file.side_effect = contents.get
+        mock_is_file.side_effect = lambda path: path in contents
+        with self.assertRaises(ThriftCLIError):
+            ThriftParser('/thrifts/First.thrift').parse()
+
+    def test_parse_in_parallel(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        names = ['Leaf%d' % index for index in range(ThriftParser.MIN_FILES_PER_POOL)]
+        with open(os.path.join(temp_dir, 'Root.thrift'), 'w') as thrift_file:
+            thrift_file.write(''.join('include "%s.thrift"\n' % name for name in names))
+        for name in names:
+            with open(os.path.join(temp_dir, '%s.thrift' % name), 'w') as thrift_file:
+                thrift_file.write('include "Common.thrift"\nstruct %sStruct {\n1: Common.CommonStruct c\n}\n' % name)
+        with open(os.path.join(temp_dir, 'Common.thrift'), 'w') as thrift_file:
+            thrift_file.write('struct CommonStruct {\n1: i32 value\n}\n')
+        thrift_path = os.path.join(temp_dir, 'Root.thrift')
+        with mock.patch('multiprocessing.Pool') as mock_pool:
+            # Without opting in, the includes are parsed in process
+            expected_parse_result = ThriftParser(thrift_path).parse()
+            self.assertFalse(mock_pool.called)
+        with mock.patch('multiprocessing.Pool', wraps=multiprocessing.Pool) as mock_pool:
+            parser = ThriftParser(thrift_path, processes=2)
+            parse_result = parser.parse()
+            mock_pool.assert_called_once_with(2)
+        self.assertEqual(parse_result, expected_parse_result)
+        self.assertEqual(len(parse_result.structs), len(names) + 1)
+        self.assertEqual(parser._apply_namespace('Leaf0.Leaf0Struct'), 'Leaf0.Leaf0Struct')
+
     @mock.patch('thriftcli.ThriftParser._load_file')
     def test_parse_structs(self, mock_load_file):
         mock_load_file.return_value = data.TEST_THRIFT_CONTENT
-        parser = ThriftParser(data.TEST_THRIFT_PATH)
-        parser._references = data.TEST_THRIFT_REFERENCES
-        expected_structs = data.TEST_THRIFT_STRUCTS
-        structs = parser._parse_structs()
-        self.assertDictEqual(structs, expected_structs)
+        parse_result = ThriftParser(data.TEST_THRIFT_PATH).parse()
+        self.assertDictEqual(parse_result.structs, data.TEST_THRIFT_STRUCTS)
 
     @mock.patch('thriftcli.ThriftParser._load_file')
     def test_parse_services(self, mock_load_file):
         mock_load_file.return_value = data.TEST_THRIFT_CONTENT
-        parser = ThriftParser(data.TEST_THRIFT_PATH)
-        parser._references = data.TEST_THRIFT_REFERENCES
-        parser._result = ThriftParseResult()
-        expected_services = data.TEST_THRIFT_SERVICES
-        services = parser._parse_services()
-        self.assertDictEqual(services, expected_services)
+        parse_result = ThriftParser(data.TEST_THRIFT_PATH).parse()
+        self.assertDictEqual(parse_result.services, data.TEST_THRIFT_SERVICES)
 
     @mock.patch('thriftcli.ThriftParser._load_file')
     def test_parse_enums(self, mock_load_file):
         mock_load_file.return_value = data.TEST_THRIFT_CONTENT
-        parser = ThriftParser(data.TEST_THRIFT_PATH)
-        parser._references = data.TEST_THRIFT_REFERENCES
-        expected_enums = data.TEST_THRIFT_ENUMS
-        enums = parser._parse_enums()
-        self.assertEqual(enums, expected_enums)
+        parse_result = ThriftParser(data.TEST_THRIFT_PATH).parse()
+        self.assertEqual(parse_result.enums, data.TEST_THRIFT_ENUMS)
 
     @mock.patch('thriftcli.ThriftParser._load_file')
     def test_parse_typedefs(self, mock_load_file):
         mock_load_file.return_value = data.TEST_THRIFT_CONTENT
-        parser = ThriftParser(data.TEST_THRIFT_PATH)
-        parser._references = data.TEST_THRIFT_REFERENCES
-        expected_typedefs = data.TEST_THRIFT_TYPEDEFS
-        typedefs = parser._parse_typedefs()
-        self.assertEqual(typedefs, expected_typedefs)
+        parse_result = ThriftParser(data.TEST_THRIFT_PATH).parse()
+        self.assertEqual(parse_result.typedefs, data.TEST_THRIFT_TYPEDEFS)
 
     @mock.patch('thriftcli.ThriftParser._load_file')
-    def test_parse_references(self, mock_load_file):
+    def test_parse_resolves_types(self, mock_load_file):
         mock_load_file.return_value = data.TEST_THRIFT_CONTENT
-        parser = ThriftParser(data.TEST_THRIFT_PATH)
-        expected_references = data.TEST_THRIFT_REFERENCES
-        references = parser._parse_references()
-        self.assertEqual(references, expected_references)
+        parse_result = ThriftParser(data.TEST_THRIFT_PATH).parse()
+        fields = parse_result.structs[data.TEST_THRIFT_STRUCT_REFERENCE3].fields
+        struct_type = ThriftType.get(ThriftType.STRUCT, data.TEST_THRIFT_STRUCT_REFERENCE)
+        struct_type2 = ThriftType.get(ThriftType.STRUCT, data.TEST_THRIFT_STRUCT_REFERENCE2)
+        string_type = ThriftType.get(ThriftType.BASE, 'string')
+        self.assertIs(fields['thing_three'].type_node,
+                      ThriftType.get(ThriftType.MAP, ThriftType.MAP, (string_type, string_type)))
+        self.assertIs(fields['thing_five'].type_node,
+                      ThriftType.get(ThriftType.MAP, ThriftType.MAP, (struct_type, struct_type2)))
+        list_type = ThriftType.get(ThriftType.LIST, ThriftType.LIST, (struct_type2,))
+        self.assertIs(fields['thing_six'].type_node, ThriftType.get(ThriftType.SET, ThriftType.SET, (list_type,)))
 
+    @mock.patch('os.path.isfile')
     @mock.patch('thriftcli.ThriftParser._load_file')
-    def test_parse_endpoints_from_service_definition(self, mock_load_file):
-        mock_load_file.return_value = data.TEST_THRIFT_CONTENT
-        parser = ThriftParser(data.TEST_THRIFT_PATH)
-        parser._references = data.TEST_THRIFT_REFERENCES
-        endpoints = parser._parse_endpoints_from_service_definition(data.TEST_THRIFT_SERVICE_DEFINITION)
-        expected_endpoints = data.TEST_THRIFT_SERVICE_ENDPOINTS
-        self.assertEqual(endpoints, expected_endpoints)
+    def test_parse_resolves_typedefs_across_includes(self, mock_load_file, mock_is_file):
+        mock_load_file.side_effect = [data.TEST_THRIFT_INCLUDING_CONTENT, data.TEST_THRIFT_INCLUDED_CONTENT]
+        mock_is_file.side_effect = lambda path: path == data.TEST_THRIFT_INCLUDED_PATH
+        parse_result = ThriftParser(data.TEST_THRIFT_INCLUDING_PATH, [data.TEST_THRIFT_DIR_PATH]).parse()
+        fields = parse_result.structs[data.TEST_THRIFT_INCLUDING_STRUCT_REFERENCE].fields
+        self.assertIs(fields['included_typedef'].type_node,
+                      ThriftType.get(ThriftType.LIST, ThriftType.LIST, (ThriftType.get(ThriftType.BASE, 'i64'),)))
+        self.assertIs(fields['included_enum'].type_node,
+                      ThriftType.get(ThriftType.ENUM, data.TEST_THRIFT_INCLUDED_ENUM_REFERENCE))
 
     @mock.patch('thriftcli.ThriftParser._load_file')
-    def test_parse_struct_definitions(self, mock_load_file):
+    def test_parse_references(self, mock_load_file):
         mock_load_file.return_value = data.TEST_THRIFT_CONTENT
         parser = ThriftParser(data.TEST_THRIFT_PATH)
-        parser._references = data.TEST_THRIFT_REFERENCES
-        expected_struct_definitions = {
-            data.TEST_THRIFT_STRUCT_REFERENCE: data.TEST_THRIFT_STRUCT_DEFINITION,
-            data.TEST_THRIFT_STRUCT_REFERENCE2: data.TEST_THRIFT_STRUCT_DEFINITION2,
-            data.TEST_THRIFT_STRUCT_REFERENCE3: data.TEST_THRIFT_STRUCT_DEFINITION3
-        }
-        struct_definitions = parser._parse_struct_definitions()
-        self.assertEqual(struct_definitions, expected_struct_definitions)
+        parser.parse()
+        self.assertEqual(parser._references, data.TEST_THRIFT_REFERENCES)
 
     @mock.patch('thriftcli.ThriftParser._load_file')
-    def test_parse_service_definitions(self, mock_load_file):
-        mock_load_file.return_value = data.TEST_THRIFT_CONTENT
+    def test_parse_ignores_comments(self, mock_load_file):
+        mock_load_file.return_value = '\n'.join([
+            '/* struct Commented {',
+            '   1: i32 value } */',
+            '// include "Commented.thrift"',
+            '# enum Commented { A }',
+            'struct Uncommented { // }',
+            '  1: string value # }',
+            '}'
+        ])
         parser = ThriftParser(data.TEST_THRIFT_PATH)
-        parser._references = data.TEST_THRIFT_REFERENCES
-        expected_service_definitions = [
-            (data.TEST_THRIFT_SERVICE_REFERENCE, (data.TEST_THRIFT_SERVICE_DEFINITION, None)),
-            (data.TEST_THRIFT_SERVICE_REFERENCE2, (data.TEST_THRIFT_SERVICE_DEFINITION2, None)),
-            (data.TEST_THRIFT_SERVICE_REFERENCE3, (data.TEST_THRIFT_SERVICE_DEFINITION3,
-                                                   data.TEST_THRIFT_SERVICE_REFERENCE))
-        ]
-        service_definitions = parser._parse_service_definitions()
-        self.assertEqual(service_definitions, expected_service_definitions)
+        parse_result = parser.parse()
+        self.assertEqual(parse_result.structs.keys(), ['%s.Uncommented' % data.TEST_THRIFT_NAMESPACE])
+        self.assertEqual(parse_result.enums, {})
+        self.assertEqual(parser._get_dependency_paths(), [])
+
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def test_parse_unions_and_exceptions(self, mock_load_file):
+        mock_load_file.return_value = textwrap.dedent("""\
+            union SomeUnion {
+                1: i32 number
+                2: string text
+            }
+            exception SomeException {
+                1: string message
+            }
+            service SomeService {
+                SomeUnion get(1: SomeUnion key) throws (1: SomeException error)
+            }""")
+        parse_result = ThriftParser(data.TEST_THRIFT_PATH).parse()
+        union_reference = '%s.SomeUnion' % data.TEST_THRIFT_NAMESPACE
+        self.assertEqual(parse_result.structs[union_reference].fields, {
+            'number': ThriftStruct.Field(1, 'i32', 'number'),
+            'text': ThriftStruct.Field(2, 'string', 'text')
+        })
+        exception_reference = '%s.SomeException' % data.TEST_THRIFT_NAMESPACE
+        self.assertIn(exception_reference, parse_result.structs)
+        endpoint = parse_result.services['%s.SomeService' % data.TEST_THRIFT_NAMESPACE].endpoints['get']
+        self.assertEqual(endpoint, ThriftService.Endpoint(union_reference, 'get', {
+            'key': ThriftStruct.Field(1, union_reference, 'key')
+        }, exceptions={
+            'error': ThriftStruct.Field(1, exception_reference, 'error')
+        }))
+
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def test_parse_nested_braces(self, mock_load_file):
+        mock_load_file.return_value = textwrap.dedent("""\
+            const map<string, list<i32>> LIMITS = {"a": [1, 2], "b": []}
+            struct SomeStruct {
+                1: map<string, map<string, i32>> nested = {"x": {"y": 1}},
+                2: i32 (python.type = "int") annotated (deprecated = "true");
+            } (final = "")
+            struct SomeStruct2 {
+                5: list<SomeStruct> structs
+            }""")
+        parse_result = ThriftParser(data.TEST_THRIFT_PATH).parse()
+        self.assertEqual(parse_result.structs[data.TEST_THRIFT_STRUCT_REFERENCE].fields, {
+            'nested': ThriftStruct.Field(1, 'map<string, map<string, i32>>', 'nested', default='{"x": {"y": 1}}'),
+            'annotated': ThriftStruct.Field(2, 'i32', 'annotated')
+        })
+        self.assertEqual(parse_result.structs[data.TEST_THRIFT_STRUCT_REFERENCE2].fields, {
+            'structs': ThriftStruct.Field(5, 'list<%s>' % data.TEST_THRIFT_STRUCT_REFERENCE, 'structs')
+        })
+
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def test_parse_legacy_syntax(self, mock_load_file):
+        mock_load_file.return_value = textwrap.dedent("""\
+            namespace smalltalk.category "Some.Category"
+            namespace py some.package
+            senum SomeStringEnum {
+                "first",
+                "second"
+            }
+            struct SomeStruct {
+                1: SomeStruct2 &reference
+            }
+            struct SomeStruct2 {
+                1: i32 value
+            }""")
+        parse_result = ThriftParser(data.TEST_THRIFT_PATH).parse()
+        self.assertEqual(parse_result.namespaces, {data.TEST_THRIFT_NAMESPACE: 'some.package'})
+        self.assertEqual(parse_result.structs[data.TEST_THRIFT_STRUCT_REFERENCE].fields, {
+            'reference': ThriftStruct.Field(1, data.TEST_THRIFT_STRUCT_REFERENCE2, 'reference')
+        })
+        self.assertEqual(parse_result.enums, {})
+
+    def test_assign_field_indices(self):
+        fields = [ThriftStruct.Field(5, 'i32', 'five'), ThriftStruct.Field(2, 'i32', 'two'),
+                  ThriftStruct.Field(None, 'i32', 'six')]
+        ThriftParser._assign_field_indices(fields)
+        self.assertEqual([field.index for field in fields], [5, 2, 6])
+
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def test_parse_syntax_error(self, mock_load_file):
+        mock_load_file.return_value = 'struct SomeStruct {\n  1: i32 value\n'
+        with self.assertRaises(ThriftCLIError) as context:
+            ThriftParser(data.TEST_THRIFT_PATH).parse()
+        self.assertIn('line 3', str(context.exception))
+        mock_load_file.return_value = 'struct SomeStruct {\n  1: i32 value = @\n}'
+        with self.assertRaises(ThriftCLIError) as context:
+            ThriftParser(data.TEST_THRIFT_PATH).parse()
+        self.assertIn('line 2', str(context.exception))
+
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def test_tokenize(self, mock_load_file):
+        mock_load_file.return_value = '// The number of things\n1: optional i32 things = -0x10, # done'
+        tokens = ThriftParser(data.TEST_THRIFT_PATH)._tokenize()
+        self.assertEqual(tokens, ['1', ':', 'optional', 'i32', 'things', '=', '-0x10', ',', ''])
 
     def test_split_fields_string(self):
         fields_string = '1:i32 num1, 2:i32 num2, 3:Operation op'
@@ -0,0 +1,62 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import mock
+from thrift.protocol import TBinaryProtocol, TCompactProtocol
+from thrift.transport import TTransport
+
+from thriftcli import TZeroCopyFramedTransport, ThriftCLIError, make_protocol, wrap_transport
+
+
+class TestThriftProtocols(unittest.TestCase):
+    def test_wrap_transport(self):
+        socket_transport = TTransport.TMemoryBuffer()
+        self.assertIsInstance(wrap_transport(socket_transport), TZeroCopyFramedTransport)
+        self.assertIsInstance(wrap_transport(socket_transport, 'buffered', 'compact'), TTransport.TBufferedTransport)
+        # The header protocol frames its own messages
+        self.assertIs(wrap_transport(socket_transport, 'framed', 'header'), socket_transport)
+        with self.assertRaises(ThriftCLIError):
+            wrap_transport(socket_transport, 'zlib')
+
+    def test_make_protocol(self):
+        transport = TTransport.TBufferedTransport(TTransport.TMemoryBuffer())
+        binary = make_protocol(transport, 'binary')
+        self.assertIs(type(binary), TBinaryProtocol.TBinaryProtocol)
+        self.assertIsInstance(make_protocol(transport, 'accelerated-binary'),
+                              TBinaryProtocol.TBinaryProtocolAccelerated)
+        self.assertIsInstance(make_protocol(transport, 'compact'), TCompactProtocol.TCompactProtocolAccelerated)
+        with mock.patch('twitter.common.rpc.finagle.protocol.TFinagleProtocol') as mock_finagle_protocol:
+            make_protocol(transport, 'finagle', 'client')
+        mock_finagle_protocol.assert_called_once_with(transport, client_id='client')
+        with self.assertRaises(ThriftCLIError):
+            make_protocol(transport, 'json')
+
+    def test_make_header_protocol(self):
+        transport = TTransport.TMemoryBuffer()
+        header_module = mock.Mock()
+        with mock.patch.dict('sys.modules', {'thrift.protocol.THeaderProtocol': header_module}):
+            protocol = make_protocol(transport, 'header')
+        header_module.THeaderProtocolFactory.return_value.getProtocol.assert_called_once_with(transport)
+        self.assertIs(protocol, header_module.THeaderProtocolFactory.return_value.getProtocol.return_value)
+        with mock.patch.dict('sys.modules', {'thrift.protocol.THeaderProtocol': None}):
+            with self.assertRaises(ThriftCLIError):
+                make_protocol(transport, 'header')
+
+    def test_compact_round_trip(self):
+        buffer = TTransport.TMemoryBuffer()
+        protocol = make_protocol(buffer, 'compact')
+        protocol.writeMessageBegin('echo', 1, 7)
+        protocol.writeMessageEnd()
+        reader = make_protocol(TTransport.TMemoryBuffer(buffer.getvalue()), 'compact')
+        self.assertEqual(reader.readMessageBegin(), ('echo', 1, 7))
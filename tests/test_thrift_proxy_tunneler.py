@@ -0,0 +1,92 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+import threading
+import unittest
+
+import mock
+
+from thriftcli import ThriftProxyTunneler
+
+
+class FakeProxy(object):
+    """ Answers HTTP CONNECT requests without relaying anything, refusing them while refuse is set. """
+
+    def __init__(self):
+        self._listener = socket.socket()
+        self._listener.bind(('127.0.0.1', 0))
+        self._listener.listen(16)
+        self.port = self._listener.getsockname()[1]
+        self.requests = []
+        self.refuse = False
+        self._sockets = []
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        self._listener.close()
+        for client_socket in self._sockets:
+            client_socket.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client_socket, _ = self._listener.accept()
+            except socket.error:
+                return
+            self._sockets.append(client_socket)
+            request = ''
+            while '\r\n\r\n' not in request:
+                request += client_socket.recv(4096)
+            self.requests.append(request)
+            if self.refuse:
+                client_socket.sendall('HTTP/1.0 407 Proxy Authentication Required\r\n\r\n')
+            else:
+                client_socket.sendall('HTTP/1.0 200 Connection established\r\n\r\n')
+
+
+class TestThriftProxyTunneler(unittest.TestCase):
+    def setUp(self):
+        self._proxy = FakeProxy()
+        self.addCleanup(self._proxy.close)
+        patcher = mock.patch('requests_kerberos.HTTPKerberosAuth')
+        self._mock_auth = patcher.start()
+        self.addCleanup(patcher.stop)
+        self._mock_auth.return_value.generate_request_header.side_effect = ['Negotiate token1', 'Negotiate token2']
+
+    def test_open_tunnel_shares_auth(self):
+        tunneler = ThriftProxyTunneler('127.0.0.1', self._proxy.port)
+        for _ in range(2):
+            tunneler.open_tunnel(('server', 9090)).close()
+        self.assertEqual(self._mock_auth.call_count, 1)
+        self.assertEqual(len(self._proxy.requests), 2)
+        for request in self._proxy.requests:
+            self.assertTrue(request.startswith('CONNECT server:9090 HTTP/1.0\r\n'))
+        # Each tunnel sends a new token, which a proxy with a replay cache would refuse to see twice
+        self.assertIn('Proxy-Authorization: Negotiate token1\r\n', self._proxy.requests[0])
+        self.assertIn('Proxy-Authorization: Negotiate token2\r\n', self._proxy.requests[1])
+        summary = tunneler.summarize()
+        self.assertEqual((summary['tunnels'], summary['auth_headers']), (2, 2))
+        self.assertLessEqual(summary['min'], summary['mean'])
+        self.assertLessEqual(summary['mean'], summary['max'])
+
+    def test_refused_tunnel(self):
+        tunneler = ThriftProxyTunneler('127.0.0.1', self._proxy.port)
+        self._proxy.refuse = True
+        with self.assertRaises(socket.error):
+            tunneler.open_tunnel(('server', 9090))
+        self._proxy.refuse = False
+        tunneler.open_tunnel(('server', 9090)).close()
+        self.assertIn('Proxy-Authorization: Negotiate token2\r\n', self._proxy.requests[-1])
+        self.assertEqual(tunneler.summarize()['tunnels'], 1)
@@ -0,0 +1,136 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+import sys
+import time
+import unittest
+
+import mock
+from thrift.protocol import TCompactProtocol
+from thrift.transport import TTransport
+
+from tests.data.echo_server import ECHO_THRIFT_CONTENT, EchoServer
+from thriftcli import ThriftCLIError, ThriftLoadBalancer, ThriftParser, ThriftReactor, ThriftTypeBuilder
+
+class TestThriftReactor(unittest.TestCase):
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def setUp(self, mock_load_file):
+        mock_load_file.return_value = ECHO_THRIFT_CONTENT
+        modules = mock.patch.dict(sys.modules)
+        modules.start()
+        self.addCleanup(modules.stop)
+        ThriftTypeBuilder(ThriftParser('Echo.thrift').parse()).build()
+        self._service_module = sys.modules['Echo.Echo']
+
+    def _start_server(self, finagle=False, reply_batch=1, protocol_factory=None):
+        server = EchoServer(self._service_module, finagle, reply_batch, protocol_factory)
+        self.addCleanup(server.close)
+        return server
+
+    def test_submit(self):
+        server = self._start_server()
+        reactor = ThriftReactor('127.0.0.1', server.port, 'Echo.Echo')
+        self.addCleanup(reactor.close)
+        self.assertEqual(reactor.submit('echo', {'message': 'hello', 'delay': 0}).result(), 'hello')
+        self.assertEqual(reactor.submit('echo', {'message': 'again', 'delay': 0}).result(), 'again')
+        self.assertEqual(server.connections, 1)
+
+    def test_submit_upgraded(self):
+        server = self._start_server(finagle=True)
+        reactor = ThriftReactor('127.0.0.1', server.port, 'Echo.Echo', client_id='test')
+        self.addCleanup(reactor.close)
+        self.assertIsNone(reactor.submit('ping', {}).result())
+        self.assertEqual(reactor.submit('echo', {'message': 'hello', 'delay': 0}).result(), 'hello')
+
+    def test_submit_concurrently(self):
+        server = self._start_server()
+        reactor = ThriftReactor('127.0.0.1', server.port, 'Echo.Echo', max_connections=4)
+        self.addCleanup(reactor.close)
+        futures = [reactor.submit('echo', {'message': str(index), 'delay': 0.05}) for index in range(12)]
+        started = time.time()
+        self.assertEqual([future.result() for future in futures], [str(index) for index in range(12)])
+        # Three rounds of four requests at once, rather than twelve requests one after another
+        self.assertLess(time.time() - started, 12 * 0.05)
+        self.assertEqual(server.connections, 4)
+        self.assertEqual(server.max_running, 4)
+
+    def test_submit_pipelined(self):
+        server = self._start_server(reply_batch=4)
+        reactor = ThriftReactor('127.0.0.1', server.port, 'Echo.Echo', pipeline_window=4)
+        self.addCleanup(reactor.close)
+        futures = [reactor.submit('echo', {'message': str(index), 'delay': 0}) for index in range(12)]
+        # Replies come back in reverse order within each window, and are matched to their requests by sequence id
+        self.assertEqual([future.result() for future in futures], [str(index) for index in range(12)])
+        self.assertEqual(server.connections, 1)
+
+    def test_submit_pipelined_upgraded(self):
+        server = self._start_server(finagle=True, reply_batch=2)
+        reactor = ThriftReactor('127.0.0.1', server.port, 'Echo.Echo', client_id='test', pipeline_window=2)
+        self.addCleanup(reactor.close)
+        futures = [reactor.submit('echo', {'message': str(index), 'delay': 0}) for index in range(8)]
+        self.assertEqual([future.result() for future in futures], [str(index) for index in range(8)])
+        self.assertEqual(server.connections, 1)
+
+    def test_submit_large_messages(self):
+        server = self._start_server(reply_batch=2)
+        reactor = ThriftReactor('127.0.0.1', server.port, 'Echo.Echo', pipeline_window=2)
+        self.addCleanup(reactor.close)
+        # Replies larger than the receive buffer arrive over many reads, after and before smaller ones
+        messages = ['a' * (3 << 20), 'b' * 100, 'c', 'd' * (1 << 20)]
+        futures = [reactor.submit('echo', {'message': message, 'delay': 0}) for message in messages]
+        self.assertEqual([future.result() for future in futures], messages)
+        self.assertEqual(server.connections, 1)
+
+    def test_submit_invalid_request(self):
+        server = self._start_server()
+        reactor = ThriftReactor('127.0.0.1', server.port, 'Echo.Echo')
+        self.addCleanup(reactor.close)
+        with self.assertRaises(AttributeError):
+            reactor.submit('missing', {}).result()
+        self.assertEqual(reactor.submit('echo', {'message': 'hello', 'delay': 0}).result(), 'hello')
+
+    def test_submit_compact(self):
+        server = self._start_server(reply_batch=2, protocol_factory=TCompactProtocol.TCompactProtocolFactory())
+        reactor = ThriftReactor('127.0.0.1', server.port, 'Echo.Echo', pipeline_window=2, protocol='compact')
+        self.addCleanup(reactor.close)
+        futures = [reactor.submit('echo', {'message': message, 'delay': 0}) for message in ['a', 'b']]
+        self.assertEqual([future.result() for future in futures], ['a', 'b'])
+        with self.assertRaises(ThriftCLIError):
+            ThriftReactor('127.0.0.1', server.port, 'Echo.Echo', protocol='header')
+
+    def test_connection_refused(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        port = listener.getsockname()[1]
+        listener.close()
+        reactor = ThriftReactor('127.0.0.1', port, 'Echo.Echo')
+        with self.assertRaises(TTransport.TTransportException):
+            reactor.submit('echo', {'message': 'hello', 'delay': 0}).result()
+
+    def test_submit_balanced(self):
+        servers = [self._start_server(), self._start_server()]
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        dead_address = '127.0.0.1:%d' % listener.getsockname()[1]
+        listener.close()
+        load_balancer = ThriftLoadBalancer(['127.0.0.1:%d' % server.port for server in servers] + [dead_address],
+                                           'round_robin')
+        reactor = ThriftReactor('127.0.0.1', servers[0].port, 'Echo.Echo', max_connections=4,
+                                load_balancer=load_balancer)
+        self.addCleanup(reactor.close)
+        futures = [reactor.submit('echo', {'message': str(index), 'delay': 0.01}) for index in range(12)]
+        # The requests waiting on the connection that failed to open are sent to the other members instead
+        self.assertEqual([future.result() for future in futures], [str(index) for index in range(12)])
+        self.assertNotIn(dead_address, load_balancer.get_available())
+        self.assertEqual(sum(server.requests for server in servers), 12)
+        self.assertTrue(all(server.requests > 0 for server in servers))
@@ -0,0 +1,108 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import StringIO
+import unittest
+
+import mock
+from thrift.transport import TTransport
+
+from thriftcli import ThriftParser, ThriftShell
+
+SHOP_THRIFT_CONTENT = """
+struct Item {
+    1: string name,
+    2: i32 count
+}
+
+struct Order {
+    1: Item item,
+    2: list<Item> items,
+    3: map<string, Item> itemsByName,
+    4: i64 id
+}
+
+service Shop {
+    Order getOrder(1: Order template, 2: i64 id),
+    oneway void ping()
+}
+"""
+
+
+class TestThriftShell(unittest.TestCase):
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def setUp(self, mock_load_file):
+        mock_load_file.return_value = SHOP_THRIFT_CONTENT
+        parse_result = ThriftParser('Shop.thrift').parse()
+        self._cli = mock.Mock()
+        self._cli.get_parse_result.return_value = parse_result
+        self._cli.get_endpoints.return_value = parse_result.services['Shop.Shop'].endpoints
+        self._cli.get_service_name.return_value = 'Shop'
+        self._output = StringIO.StringIO()
+        self._shell = ThriftShell(self._cli, stdin=StringIO.StringIO(), stdout=self._output)
+
+    def test_get_fields_at(self):
+        def get_field_names(request_body):
+            fields = self._shell.get_fields_at('getOrder', request_body)
+            return sorted(fields) if fields is not None else None
+
+        self.assertEqual(get_field_names('{"'), ['id', 'template'])
+        self.assertEqual(get_field_names('{"template": {"'), ['id', 'item', 'items', 'itemsByName'])
+        self.assertEqual(get_field_names('{"template": {"item": {"'), ['count', 'name'])
+        self.assertEqual(get_field_names('{"template": {"items": [{"name": "a"}, {"'), ['count', 'name'])
+        self.assertEqual(get_field_names('{"template": {"itemsByName": {"a": {"'), ['count', 'name'])
+        self.assertEqual(get_field_names('{"template": {"item": {"name": "{,}"}, "'),
+                         ['id', 'item', 'items', 'itemsByName'])
+        self.assertEqual(get_field_names('{"template": {"itemsByName": {"'), None)
+        self.assertEqual(get_field_names('{"id": 1}'), None)
+        self.assertEqual(get_field_names(''), None)
+
+    def test_complete(self):
+        self.assertEqual(self._shell.completenames('get'), ['getOrder'])
+        self.assertIn('describe', self._shell.completenames(''))
+        self.assertNotIn('EOF', self._shell.completenames(''))
+        line = 'getOrder {"template": {"it'
+        self.assertEqual(self._shell.completedefault('it', line, len(line) - 2, len(line)),
+                         ['item', 'items', 'itemsByName'])
+        self.assertEqual(self._shell.completedefault('it', 'unknown {"it', 10, 12), [])
+        self.assertEqual(self._shell.complete_describe('O', 'describe O', 9, 10), ['Order'])
+
+    def test_run(self):
+        self._cli.run.return_value = '{"id": 1}'
+        self._shell.onecmd('getOrder {"id": 1}')
+        self._cli.run.assert_called_once_with('getOrder', {'id': 1}, True)
+        lines = self._output.getvalue().splitlines()
+        self.assertEqual(lines[0], '{"id": 1}')
+        self.assertRegexpMatches(lines[1], r'^\(\d+\.\d ms\)$')
+
+    def test_run_reconnects(self):
+        self._cli.run.side_effect = [TTransport.TTransportException(message='closed'), None]
+        self._shell.onecmd('ping')
+        self._cli.reconnect.assert_called_once_with()
+        self.assertEqual(self._cli.run.call_args_list, [mock.call('ping', {}, True)] * 2)
+
+    def test_run_errors(self):
+        self._cli.run.side_effect = ValueError('invalid')
+        self._shell.onecmd('getOrder {"id": 1}')
+        self._shell.onecmd('missing {}')
+        self._shell.onecmd('')
+        lines = self._output.getvalue().splitlines()
+        self.assertEqual(lines[0], 'ValueError: invalid')
+        self.assertTrue(lines[2].startswith('Unknown method or command \'missing\''))
+        self.assertEqual(len(lines), 3)
+
+    def test_cmdloop(self):
+        shell = ThriftShell(self._cli, return_json=False, stdin=StringIO.StringIO('json on\ndescribe Item\nexit\n'),
+                            stdout=self._output)
+        shell.cmdloop()
+        self.assertEqual(self._output.getvalue(),
+                         ThriftShell.intro + '\nShop> json is on\nShop> 1:string name\n2:i32 count\nShop> ')
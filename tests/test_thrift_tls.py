@@ -0,0 +1,38 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ssl
+import unittest
+
+import mock
+
+from thriftcli import ThriftTLSContext, get_tls_context
+
+
+class TestThriftTLSContext(unittest.TestCase):
+    def test_get_tls_context_shared(self):
+        tls_context = get_tls_context(None, ssl.CERT_NONE)
+        self.assertIs(get_tls_context(None, ssl.CERT_NONE), tls_context)
+        self.assertIsNot(get_tls_context(None, ssl.CERT_OPTIONAL), tls_context)
+        self.assertIsNot(get_tls_context(None, ssl.CERT_NONE, ssl.PROTOCOL_TLSv1_2), tls_context)
+        self.assertEqual(tls_context.ssl_context.verify_mode, ssl.CERT_NONE)
+
+    def test_wrap_socket(self):
+        tls_context = ThriftTLSContext(None, ssl.CERT_NONE)
+        with mock.patch.object(tls_context, 'ssl_context') as mock_ssl_context:
+            tls_context.wrap_socket(mock.Mock(), 'server')
+            tls_context.wrap_socket(mock.Mock(), 'server', do_handshake_on_connect=False)
+        self.assertEqual(mock_ssl_context.wrap_socket.call_count, 2)
+        # Only the handshake done on connect is counted, the other is counted by the caller once it completes
+        self.assertEqual(tls_context.summarize(), {'handshakes': 1})
+        tls_context.record_handshake()
+        self.assertEqual(tls_context.summarize(), {'handshakes': 2})
@@ -0,0 +1,42 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import cPickle
+import unittest
+
+from thriftcli import ThriftType
+
+
+class TestThriftType(unittest.TestCase):
+    def test_get_is_interned(self):
+        string_type = ThriftType.get(ThriftType.BASE, 'string')
+        map_type = ThriftType.get(ThriftType.MAP, ThriftType.MAP, (string_type, string_type))
+        self.assertIs(ThriftType.get(ThriftType.BASE, 'string'), string_type)
+        self.assertIs(ThriftType.get(ThriftType.MAP, ThriftType.MAP, (string_type, string_type)), map_type)
+        self.assertIsNot(ThriftType.get(ThriftType.LIST, ThriftType.LIST, (string_type,)),
+                         ThriftType.get(ThriftType.SET, ThriftType.SET, (string_type,)))
+
+    def test_immutable(self):
+        string_type = ThriftType.get(ThriftType.BASE, 'string')
+        with self.assertRaises(AttributeError):
+            string_type.name = 'i64'
+
+    def test_pickle_is_interned(self):
+        struct_type = ThriftType.get(ThriftType.STRUCT, 'package.Struct')
+        list_type = ThriftType.get(ThriftType.LIST, ThriftType.LIST, (struct_type,))
+        self.assertIs(cPickle.loads(cPickle.dumps(list_type, cPickle.HIGHEST_PROTOCOL)), list_type)
+
+    def test_str(self):
+        struct_type = ThriftType.get(ThriftType.STRUCT, 'package.Struct')
+        list_type = ThriftType.get(ThriftType.LIST, ThriftType.LIST, (struct_type,))
+        map_type = ThriftType.get(ThriftType.MAP, ThriftType.MAP, (ThriftType.get(ThriftType.BASE, 'i64'), list_type))
+        self.assertEqual(str(map_type), 'map<i64, list<package.Struct>>')
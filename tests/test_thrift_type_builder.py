@@ -0,0 +1,112 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import textwrap
+import unittest
+
+import mock
+from thrift.Thrift import TException, TMessageType, TType
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+
+from tests import data
+from thriftcli import ThriftParser, ThriftTypeBuilder
+
+
+class TestThriftTypeBuilder(unittest.TestCase):
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def setUp(self, mock_load_file):
+        mock_load_file.return_value = data.TEST_THRIFT_CONTENT
+        self._modules = mock.patch.dict(sys.modules)
+        self._modules.start()
+        self.addCleanup(self._modules.stop)
+        ThriftTypeBuilder(ThriftParser(data.TEST_THRIFT_PATH).parse()).build()
+        self._ttypes = sys.modules['%s.ttypes' % data.TEST_THRIFT_MODULE_NAME]
+
+    def test_build_registers_modules(self):
+        self.assertIs(sys.modules['%s.ttypes' % data.TEST_THRIFT_PY_NAMESPACE], self._ttypes)
+        self.assertTrue(hasattr(sys.modules[data.TEST_THRIFT_SERVICE_REFERENCE], 'Client'))
+        self.assertTrue(hasattr(sys.modules['%s.constants' % data.TEST_THRIFT_MODULE_NAME], '__name__'))
+
+    def test_build_enums(self):
+        enum_class = getattr(self._ttypes, data.TEST_THRIFT_ENUM_NAME2)
+        self.assertEqual(enum_class._NAMES_TO_VALUES, data.TEST_THRIFT_ENUMS[data.TEST_THRIFT_ENUM_REFERENCE2])
+        self.assertEqual(enum_class._VALUES_TO_NAMES[4], 'X')
+        self.assertEqual(enum_class.Y, 0xf2a)
+
+    def test_build_struct_thrift_spec(self):
+        struct_class = getattr(self._ttypes, data.TEST_THRIFT_STRUCT_NAME)
+        struct_class3 = getattr(self._ttypes, data.TEST_THRIFT_STRUCT_NAME3)
+        self.assertEqual(struct_class.thrift_spec[2], (2, TType.DOUBLE, 'thing_two', None, 2.0))
+        self.assertEqual(struct_class3.thrift_spec[6],
+                         (6, TType.SET, 'thing_six',
+                          (TType.LIST, (TType.STRUCT, [getattr(self._ttypes, data.TEST_THRIFT_STRUCT_NAME2),
+                                                       getattr(self._ttypes, data.TEST_THRIFT_STRUCT_NAME2).thrift_spec],
+                                        False), False),
+                          None))
+        self.assertEqual(struct_class().thing_two, 2.0)
+
+    def test_struct_round_trip(self):
+        struct_class = getattr(self._ttypes, data.TEST_THRIFT_STRUCT_NAME)
+        struct_class3 = getattr(self._ttypes, data.TEST_THRIFT_STRUCT_NAME3)
+        struct = struct_class3(thing_one=['a', 'b'], thing_three={'k': 'v'},
+                               thing_four=[struct_class(thing_one='x', thing_three=True)])
+        for protocol_class in (TBinaryProtocol.TBinaryProtocol, TBinaryProtocol.TBinaryProtocolAccelerated):
+            buf = TTransport.TMemoryBuffer()
+            struct.write(protocol_class(buf))
+            read_struct = struct_class3()
+            read_struct.read(protocol_class(TTransport.TMemoryBuffer(buf.getvalue())))
+            self.assertEqual(read_struct.thing_one, ['a', 'b'])
+            self.assertEqual(read_struct.thing_three, {'k': 'v'})
+            self.assertEqual(read_struct.thing_four, [struct_class(thing_one='x', thing_two=2.0, thing_three=True)])
+
+    def test_client_call(self):
+        service_module = sys.modules[data.TEST_THRIFT_SERVICE_REFERENCE]
+        reply_buffer = TTransport.TMemoryBuffer()
+        reply_protocol = TBinaryProtocol.TBinaryProtocol(reply_buffer)
+        reply_protocol.writeMessageBegin('doSomething1', TMessageType.REPLY, 0)
+        service_module.doSomething1_result(success=7).write(reply_protocol)
+        reply_protocol.writeMessageEnd()
+        request_buffer = TTransport.TMemoryBuffer()
+        client = service_module.Client(TBinaryProtocol.TBinaryProtocol(TTransport.TMemoryBuffer(reply_buffer.getvalue())),
+                                       TBinaryProtocol.TBinaryProtocol(request_buffer))
+        self.assertEqual(client.doSomething1(num1=3, num2=4, op=0), 7)
+        request_protocol = TBinaryProtocol.TBinaryProtocol(TTransport.TMemoryBuffer(request_buffer.getvalue()))
+        self.assertEqual(request_protocol.readMessageBegin(), ('doSomething1', TMessageType.CALL, 0))
+        request_args = service_module.doSomething1_args()
+        request_args.read(request_protocol)
+        self.assertEqual(request_args, service_module.doSomething1_args(num1=3, num2=4, op=0))
+
+    @mock.patch('thriftcli.ThriftParser._load_file')
+    def test_client_raises_declared_exception(self, mock_load_file):
+        mock_load_file.return_value = textwrap.dedent("""\
+            exception SomeException {
+                1: string reason
+            }
+            service SomeService {
+                i32 get(1: i32 key) throws (1: SomeException error)
+            }""")
+        ThriftTypeBuilder(ThriftParser(data.TEST_THRIFT_PATH).parse()).build()
+        exception_class = getattr(sys.modules['%s.ttypes' % data.TEST_THRIFT_MODULE_NAME], 'SomeException')
+        self.assertTrue(issubclass(exception_class, TException))
+        service_module = sys.modules['%s.SomeService' % data.TEST_THRIFT_MODULE_NAME]
+        reply_buffer = TTransport.TMemoryBuffer()
+        reply_protocol = TBinaryProtocol.TBinaryProtocol(reply_buffer)
+        reply_protocol.writeMessageBegin('get', TMessageType.REPLY, 0)
+        service_module.get_result(error=exception_class(reason='not found')).write(reply_protocol)
+        reply_protocol.writeMessageEnd()
+        client = service_module.Client(TBinaryProtocol.TBinaryProtocol(TTransport.TMemoryBuffer(reply_buffer.getvalue())),
+                                       TBinaryProtocol.TBinaryProtocol(TTransport.TMemoryBuffer()))
+        with self.assertRaises(exception_class) as context:
+            client.get(key=1)
+        self.assertEqual(context.exception.reason, 'not found')
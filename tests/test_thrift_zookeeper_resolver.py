@@ -10,50 +10,197 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import shutil
+import tempfile
+import time
 import unittest
 
 import mock
+from kazoo.exceptions import NoNodeError
 
 from tests import data
-from thriftcli import ThriftCLIError
-from thriftcli.thrift_zookeeper_resolver import get_server_address, _get_znode_from_zookeeper_host
+from thriftcli import ThriftCLIError, ThriftServerSetCache, ThriftZookeeperResolver
+from thriftcli.thrift_zookeeper_resolver import get_server_address, get_server_addresses, _get_members_from_zookeeper_host
+
+TEST_ZOOKEEPER_HOST = 'zookeeper:2181'
+TEST_ZOOKEEPER_ADDRESS = TEST_ZOOKEEPER_HOST + data.TEST_ZOOKEEPER_PATH
+
+
+def _make_member(hostname, port):
+    return '{"additionalEndpoints": {"%s": {"host": "%s", "port": %s}}, "status": "ALIVE"}' % (
+        data.TEST_THRIFT_SERVICE_NAME, hostname, port)
+
+
+class FakeZookeeper(object):
+    """ Stands in for a Zookeeper host, holding server sets and calling back the child watches on them. """
+
+    def __init__(self):
+        self.nodes = {}
+        self.watches = {}
+        self.clients_started = 0
+        self.gets = 0
+        # The number of gets sent when the result of the first one was waited on
+        self.gets_before_wait = None
+
+    def set_members(self, path, members):
+        for child in [child for child in self.nodes if os.path.dirname(child) == path]:
+            del self.nodes[child]
+        for child, member in members.iteritems():
+            self.nodes[os.path.join(path, child)] = member
+        for func in self.watches.get(path, []):
+            func(self.get_children(path))
+
+    def get_children(self, path):
+        return sorted(os.path.basename(child) for child in self.nodes if os.path.dirname(child) == path)
+
+    def make_client(self, hosts):
+        assert hosts == TEST_ZOOKEEPER_HOST
+        return _FakeKazooClient(self)
+
+
+class _FakeKazooClient(object):
+    def __init__(self, zookeeper):
+        self._zookeeper = zookeeper
+
+    def start(self):
+        self._zookeeper.clients_started += 1
+
+    def stop(self):
+        pass
+
+    def close(self):
+        pass
+
+    def get_children(self, path):
+        return self._zookeeper.get_children(path)
+
+    def get_async(self, path):
+        self._zookeeper.gets += 1
+        return _FakeAsyncResult(self._zookeeper, path)
+
+    def ChildrenWatch(self, path, func):
+        func(self._zookeeper.get_children(path))
+        self._zookeeper.watches.setdefault(path, []).append(func)
+
+
+class _FakeAsyncResult(object):
+    def __init__(self, zookeeper, path):
+        self._zookeeper = zookeeper
+        self._path = path
+
+    def get(self):
+        if self._zookeeper.gets_before_wait is None:
+            self._zookeeper.gets_before_wait = self._zookeeper.gets
+        if self._path not in self._zookeeper.nodes:
+            raise NoNodeError()
+        return self._zookeeper.nodes[self._path], None
 
 
 class TestThriftZookeeperResolver(unittest.TestCase):
-    @mock.patch('thriftcli.thrift_zookeeper_resolver._get_znode_from_zookeeper_host')
-    def test_get_server_address(self, mock_get_znode):
-        mock_get_znode.return_value = data.TEST_ZNODE
+    @mock.patch('thriftcli.thrift_zookeeper_resolver._get_members_from_zookeeper_host')
+    def test_get_server_address(self, mock_get_members):
+        mock_get_members.return_value = [data.TEST_ZNODE[0]]
         address = get_server_address(data.TEST_ZOOKEEPER_SERVER_ADDRESS, data.TEST_THRIFT_SERVICE_NAME)
         expected_address = '%s:%s' % (data.TEST_SERVER_HOSTNAME2, data.TEST_SERVER_PORT2)
         self.assertEqual(address, expected_address)
 
-    @mock.patch('thriftcli.thrift_zookeeper_resolver._get_znode_from_zookeeper_host')
-    def test_get_server_address_invalid_service(self, mock_get_znode):
-        mock_get_znode.return_value = data.TEST_ZNODE
+    @mock.patch('thriftcli.thrift_zookeeper_resolver._get_members_from_zookeeper_host')
+    def test_get_server_address_invalid_service(self, mock_get_members):
+        mock_get_members.return_value = [data.TEST_ZNODE[0]]
         with self.assertRaises(ThriftCLIError):
             get_server_address(data.TEST_ZOOKEEPER_SERVER_ADDRESS, data.TEST_THRIFT_SERVICE_NAME2)
 
     @mock.patch('kazoo.client.KazooClient.stop')
-    @mock.patch('kazoo.client.KazooClient.get')
+    @mock.patch('kazoo.client.KazooClient.get_async')
     @mock.patch('kazoo.client.KazooClient.get_children')
     @mock.patch('kazoo.client.KazooClient.start')
-    def test_get_znode_from_zookeeper_host(self, mock_start, mock_get_children, mock_get, mock_stop):
+    def test_get_members_from_zookeeper_host(self, mock_start, mock_get_children, mock_get_async, mock_stop):
         mock_get_children.return_value = [data.TEST_ZOOKEEPER_CHILD_NAME]
-        mock_get.return_value = data.TEST_ZNODE
-        znode = _get_znode_from_zookeeper_host(data.TEST_SERVER_ADDRESS, data.TEST_ZOOKEEPER_PATH)
-        expected_znode = data.TEST_ZNODE
-        self.assertEqual(znode, expected_znode)
+        mock_get_async.return_value.get.return_value = data.TEST_ZNODE
+        members = _get_members_from_zookeeper_host(data.TEST_SERVER_ADDRESS, data.TEST_ZOOKEEPER_PATH)
+        self.assertEqual(members, [data.TEST_ZNODE[0]])
         self.assertTrue(mock_start.called)
         mock_get_children.assert_called_with(data.TEST_ZOOKEEPER_PATH)
-        mock_get.assert_called_with(data.TEST_ZOOKEEPER_CHILD_PATH)
+        mock_get_async.assert_called_with(data.TEST_ZOOKEEPER_CHILD_PATH)
         self.assertTrue(mock_stop.called)
 
     @mock.patch('kazoo.client.KazooClient.stop')
     @mock.patch('kazoo.client.KazooClient.get_children')
     @mock.patch('kazoo.client.KazooClient.start')
-    def test_get_znode_from_zookeeper_host_invalid_path(self, mock_start, mock_get_children, mock_stop):
-        mock_start.side_effect = None
-        mock_stop.side_effect = None
+    def test_get_server_address_invalid_path(self, mock_start, mock_get_children, mock_stop):
         mock_get_children.return_value = []
         with self.assertRaises(ThriftCLIError):
-            _get_znode_from_zookeeper_host(data.TEST_SERVER_ADDRESS, data.TEST_ZOOKEEPER_PATH)
+            get_server_address(TEST_ZOOKEEPER_ADDRESS, data.TEST_THRIFT_SERVICE_NAME)
+        self.assertTrue(mock_stop.called)
+
+
+class TestThriftZookeeperResolverCache(unittest.TestCase):
+    def setUp(self):
+        self._cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._cache_dir)
+        self._zookeeper = FakeZookeeper()
+        patcher = mock.patch('kazoo.client.KazooClient', side_effect=self._zookeeper.make_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cache(self):
+        self._zookeeper.set_members(data.TEST_ZOOKEEPER_PATH, {'member_1': _make_member('host1', 9090)})
+        resolver = ThriftZookeeperResolver(ThriftServerSetCache(self._cache_dir))
+        for _ in range(2):
+            self.assertEqual(resolver.get_server_address(TEST_ZOOKEEPER_ADDRESS, data.TEST_THRIFT_SERVICE_NAME),
+                             'host1:9090')
+        # Another process reuses the cached server set without asking Zookeeper
+        resolver = ThriftZookeeperResolver(ThriftServerSetCache(self._cache_dir))
+        resolver.get_server_address(TEST_ZOOKEEPER_ADDRESS, data.TEST_THRIFT_SERVICE_NAME)
+        self.assertEqual(self._zookeeper.clients_started, 1)
+
+    def test_get_server_addresses(self):
+        members = dict(('member_%03d' % i, _make_member('host%03d' % i, 9090)) for i in range(200))
+        members['member_other'] = '{"additionalEndpoints": {}, "status": "ALIVE"}'
+        self._zookeeper.set_members(data.TEST_ZOOKEEPER_PATH, members)
+        addresses = get_server_addresses(TEST_ZOOKEEPER_ADDRESS, data.TEST_THRIFT_SERVICE_NAME)
+        self.assertEqual(addresses, ['host%03d:9090' % i for i in range(200)])
+        # Every member is requested before waiting on any of them
+        self.assertEqual(self._zookeeper.gets_before_wait, 201)
+        with self.assertRaises(ThriftCLIError):
+            get_server_addresses(TEST_ZOOKEEPER_ADDRESS, data.TEST_THRIFT_SERVICE_NAME2)
+
+    def test_cache_ttl(self):
+        cache = ThriftServerSetCache(self._cache_dir, ttl=60)
+        cache.put(TEST_ZOOKEEPER_HOST, data.TEST_ZOOKEEPER_PATH, ['member'])
+        self.assertEqual(cache.get(TEST_ZOOKEEPER_HOST, data.TEST_ZOOKEEPER_PATH), ['member'])
+        self.assertIsNone(cache.get(TEST_ZOOKEEPER_HOST, '/other_path'))
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertIsNone(cache.get(TEST_ZOOKEEPER_HOST, data.TEST_ZOOKEEPER_PATH))
+        cache.invalidate(TEST_ZOOKEEPER_HOST, data.TEST_ZOOKEEPER_PATH)
+        self.assertIsNone(cache.get(TEST_ZOOKEEPER_HOST, data.TEST_ZOOKEEPER_PATH))
+
+    def test_watch(self):
+        cache = ThriftServerSetCache(self._cache_dir)
+        path = data.TEST_ZOOKEEPER_PATH
+        self._zookeeper.set_members(path, {'member_1': _make_member('host1', 9090)})
+        resolver = ThriftZookeeperResolver(cache, watch=True)
+        self.assertEqual(resolver.get_server_address(TEST_ZOOKEEPER_ADDRESS, data.TEST_THRIFT_SERVICE_NAME),
+                         'host1:9090')
+        self.assertEqual(cache.get(TEST_ZOOKEEPER_HOST, path), [_make_member('host1', 9090)])
+
+        # A member joining invalidates the cache, and is fetched by the next resolution
+        self._zookeeper.set_members(path, {'member_1': _make_member('host1', 9090),
+                                           'member_2': _make_member('host2', 9090)})
+        self.assertIsNone(cache.get(TEST_ZOOKEEPER_HOST, path))
+        self.assertEqual(sorted(resolver.get_members(TEST_ZOOKEEPER_HOST, path)),
+                         [_make_member('host1', 9090), _make_member('host2', 9090)])
+        self.assertEqual(self._zookeeper.gets, 2)
+
+        # A member leaving is dropped without asking Zookeeper, and the cache is kept current
+        self._zookeeper.set_members(path, {'member_2': _make_member('host2', 9090)})
+        self.assertEqual(cache.get(TEST_ZOOKEEPER_HOST, path), [_make_member('host2', 9090)])
+        for _ in range(5):
+            self.assertEqual(resolver.get_server_address(TEST_ZOOKEEPER_ADDRESS, data.TEST_THRIFT_SERVICE_NAME),
+                             'host2:9090')
+        self.assertEqual((self._zookeeper.clients_started, self._zookeeper.gets), (1, 2))
+
+        resolver.close()
+        self._zookeeper.set_members(path, {})
+        self.assertEqual(self._zookeeper.watches[path][0]([]), False)
@@ -11,11 +11,25 @@
 # limitations under the License.
 
 from .thrift_argument_converter import *
+from .thrift_bench import *
 from .thrift_cli import *
 from .thrift_cli_error import *
+from .thrift_codegen_cache import *
+from .thrift_daemon import *
 from .thrift_executor import *
+from .thrift_framed_transport import *
+from .thrift_json_writer import *
+from .thrift_load_balancer import *
+from .thrift_parse_cache import *
 from .thrift_parser import *
+from .thrift_protocols import *
+from .thrift_proxy_tunneler import *
+from .thrift_reactor import *
 from .thrift_service import *
+from .thrift_shell import *
 from .thrift_struct import *
+from .thrift_tls import *
+from .thrift_type import *
+from .thrift_type_builder import *
 from .thrift_zookeeper_resolver import *
 
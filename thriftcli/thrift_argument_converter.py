@@ -12,17 +12,36 @@
 
 import json
 import sys
+import threading
 
 from .thrift_cli_error import ThriftCLIError
 from .thrift_parser import ThriftParser
+from .thrift_type import ThriftType
 
 
 class ThriftArgumentConverter(object):
-    """ Converts a json request body into the corresponding Python object generated by thrift. """
+    """ Converts a json request body into the corresponding Python object generated by thrift.
 
-    def __init__(self, thrift_path, thrift_dir_paths=None):
-        thrift_parser = ThriftParser(thrift_path, thrift_dir_paths)
+    The first request to an endpoint compiles a tree of converter functions from the types of its arguments, with
+    typedefs and generated classes already looked up. Later requests to the endpoint reuse the tree, so converting a
+    value only does the work its type requires. Trees are compiled under a lock, so requests may be converted from
+    several threads at once.
+
+    """
+
+    # The conversions of base types, by type name. Other base types are converted to integers when possible.
+    BASE_TYPE_CONVERTERS = {
+        'string': str,
+        'double': float,
+        'bool': bool,
+    }
+
+    def __init__(self, thrift_path, thrift_dir_paths=None, parse_cache=None):
+        thrift_parser = ThriftParser(thrift_path, thrift_dir_paths, parse_cache)
         self._parse_result = thrift_parser.parse()
+        self._endpoint_converters = {}
+        self._type_converters = {}
+        self._compile_lock = threading.Lock()
 
     def convert_args(self, service_reference, method_name, data):
         """ Converts json request body into keyword arguments for a service's method.
@@ -37,174 +56,158 @@ class ThriftArgumentConverter(object):
         :rtype: dict
 
         """
-        fields = self._parse_result.get_fields_for_endpoint(service_reference, method_name)
-        return self._convert_dict_to_args_given_fields(fields, data)
+        key = (service_reference, method_name)
+        convert = self._endpoint_converters.get(key)
+        if convert is None:
+            with self._compile_lock:
+                convert = self._endpoint_converters.get(key)
+                if convert is None:
+                    fields = self._parse_result.get_fields_for_endpoint(service_reference, method_name)
+                    convert = self._endpoint_converters[key] = self._compile_fields(fields)
+        return convert(data)
 
-    def _convert_dict_to_args_given_fields(self, fields, data):
-        """ Converts a request body into a Python object, given the fields each key value pair should convert into.
+    def _compile_fields(self, fields):
+        """ Returns a function converting a request body into a dict of arguments, given the fields it may contain.
+
+        When there is only one field, the request body may also be the value of that field by itself.
 
         :param fields: a flat dictionary of field names to ThriftStruct.Fields
         :type fields: dict of str to ThriftStruct.Field
-        :param data: a JSON object that represents the desired Python primitive or object
-        :type data: JSON
-        :returns: a flat dictionary of field names to their values
-        :rtype: dict
+        :returns: a function from a JSON object to a flat dictionary of field names to their values
+        :rtype: callable
 
         """
-        if len(fields) == 1:
-            field = fields.values()[0]
-            if field.name not in data:
-                data = {field.name: data}
-        args = {field_name: self._convert_dict_entry_to_arg(fields[field_name].field_type, value)
-                for field_name, value in data.items()}
-        return args
-
-    def _convert_dict_entry_to_arg(self, field_type, value):
-        """ Converts a request body item into an argument for the Python object.
-
-        :param field_type: the type of the field being converted
-        :type field_type: str
-        :param value: a JSON object that represents the desired Python primitive or object
-        :type value: JSON
-        :returns: the Python primitive or object represented by value given the field type
+        converters = {field_name: self._compile_type(field.type_node) for field_name, field in fields.items()}
+        only_field_name = fields.keys()[0] if len(fields) == 1 else None
 
-        """
-        field_type = self._parse_result.unalias_type(field_type)
-        if self._parse_result.get_struct(field_type) is not None:
-            fields = self._parse_result.get_fields_for_struct_name(field_type)
-            value = self._convert_dict_to_args_given_fields(fields, value)
-        arg = self._construct_arg(field_type, value)
-        return arg
+        def convert_fields(data):
+            if only_field_name is not None and (not isinstance(data, dict) or only_field_name not in data):
+                data = {only_field_name: data}
+            if not isinstance(data, dict):
+                raise ThriftCLIError('Request body should be a JSON object, given: %s' % json.dumps(data))
+            return {field_name: converters[field_name](value) for field_name, value in data.items()}
 
-    def _construct_arg(self, field_type, value):
-        """ Converts a simple request body item into an argument for the Python object.
+        return convert_fields
 
-        A request body item is simple when it is not a struct that has another struct as a field.
+    def _compile_type(self, type_node):
+        """ Returns the function converting request body items of a type, compiling it the first time.
 
-        :param field_type: the type of the field being converted
-        :type field_type: str
-        :param value: a flat dictionary that represents the desired Python primitive or object
-        :type value: dict
-        :returns: the Python primitive or object represented by value given the field type
+        :param type_node: the resolved type of the items being converted
+        :type type_node: ThriftType
+        :returns: a function from a JSON value to the Python primitive or object it represents
+        :rtype: callable
 
         """
-        if self._parse_result.get_struct(field_type) is not None:
-            return self._construct_struct_arg(field_type, value)
-        elif self._parse_result.has_enum(field_type):
-            return self._construct_enum_arg(field_type, value)
-        elif field_type.startswith('list<'):
-            return self._construct_list_arg(field_type, value)
-        elif field_type.startswith('set<'):
-            return self._construct_set_arg(field_type, value)
-        elif field_type.startswith('map<'):
-            return self._construct_map_arg(field_type, value)
-        elif field_type == 'string':
-            return str(value)
-        elif field_type == 'double':
-            return float(value)
-        elif field_type == 'bool':
-            return bool(value)
-        try:
-            return long(value)
-        except ValueError:
-            return value
+        convert = self._type_converters.get(type_node)
+        if convert is None:
+            kind = type_node.kind
+            if kind == ThriftType.STRUCT:
+                convert = self._compile_struct(type_node)
+            elif kind == ThriftType.ENUM:
+                convert = self._compile_enum(type_node)
+            elif kind == ThriftType.LIST:
+                convert = self._compile_list(type_node)
+            elif kind == ThriftType.SET:
+                convert = self._compile_set(type_node)
+            elif kind == ThriftType.MAP:
+                convert = self._compile_map(type_node)
+            else:
+                convert = self.BASE_TYPE_CONVERTERS.get(type_node.name, _convert_integer)
+            self._type_converters[type_node] = convert
+        return convert
+
+    def _compile_struct(self, type_node):
+        """ Returns a function constructing the generated class of a struct from a JSON object of its fields.
+
+        The function is cached before the struct's fields are compiled, so structs may contain themselves.
+
+        :param type_node: the type of the struct
+        :type type_node: ThriftType
+        :rtype: callable
 
-    @staticmethod
-    def _get_type_class(package, type_name):
-        """ Gets the generated Python class corresponding to a type definition.
+        """
+        package, struct = self._split_field_type(type_node.name)
+        constructor = self._get_type_class(package, struct)
 
-        :param package: the name of the package containing the class
-        :type package: str
-        :param type_name: the name of the class to retrieve
-        :type type_name: str
-        :returns: the class defining the desired type name in the given package
+        def convert_struct(value):
+            return constructor(**convert_fields(value))
 
-        """
-        return getattr(sys.modules['%s.ttypes' % package], type_name)
+        self._type_converters[type_node] = convert_struct
+        convert_fields = self._compile_fields(self._parse_result.get_fields_for_struct_name(type_node.name))
+        return convert_struct
 
-    @staticmethod
-    def _construct_struct_arg(field_type, value):
-        """ Returns the Python object corresponding to a struct.
+    def _compile_enum(self, type_node):
+        """ Returns a function converting an enum value's name or integer value into its integer value.
 
-        :param field_type: the type of the struct being constructed
-        :type field_type: str
-        :param value: a flat dictionary that represents the desired Python struct
-        :type value: dict
-        :returns: the Python struct represented by value given the field type
+        :param type_node: the type of the enum
+        :type type_node: ThriftType
+        :rtype: callable
 
         """
-        package, struct = ThriftArgumentConverter._split_field_type(field_type)
-        constructor = ThriftArgumentConverter._get_type_class(package, struct)
-        return constructor(**value)
+        package, enum = self._split_field_type(type_node.name)
+        names_to_values = self._get_type_class(package, enum)._NAMES_TO_VALUES
 
-    @staticmethod
-    def _construct_enum_arg(field_type, value):
-        """ Returns the value corresponding to an enum.
+        def convert_enum(value):
+            if isinstance(value, (int, long)):
+                return value
+            elif isinstance(value, basestring):
+                return names_to_values[value]
+            raise ThriftCLIError('Invalid value provided for enum %s: %s' % (type_node.name, str(value)))
 
-        :param field_type: the type of the enum being constructed
-        :type field_type: str
-        :param value: a string or integer mapping to an enum value
-        :type value: str or int
-        :returns: the integer representing the desired enum value
-        :rtype: int
+        return convert_enum
+
+    def _compile_list(self, type_node):
+        """ Returns a function converting a JSON array into a tuple, the Python value of a thrift list.
+
+        :param type_node: the type of the list
+        :type type_node: ThriftType
+        :rtype: callable
 
         """
-        package, enum = ThriftArgumentConverter._split_field_type(field_type)
-        enum_class = ThriftArgumentConverter._get_type_class(package, enum)
-        if isinstance(value, (int, long)):
-            return value
-        elif isinstance(value, basestring):
-            return enum_class._NAMES_TO_VALUES[value]
-        raise ThriftCLIError('Invalid value provided for enum %s: %s' % (field_type.str(value)))
-
-    def _construct_list_arg(self, field_type, value):
-        """ Returns the Python list corresponding to a JSON array in the request body.
-
-        :param field_type: the type of the list being constructed
-        :type field_type: str
-        :param value: a JSON array representing the desired Python list
-        :type value: JSON array
-        :returns: the desired Python list
-        :rtype: list
+        convert_elem = self._compile_type(type_node.args[0])
+        return lambda value: tuple(map(convert_elem, value))
+
+    def _compile_set(self, type_node):
+        """ Returns a function converting a JSON array into a frozenset, the Python value of a thrift set.
+
+        :param type_node: the type of the set
+        :type type_node: ThriftType
+        :rtype: callable
 
         """
-        elem_type = field_type[field_type.index('<') + 1: field_type.rindex('>')]
-        return tuple([self._convert_dict_entry_to_arg(elem_type, elem) for elem in value])
+        convert_elem = self._compile_type(type_node.args[0])
+        return lambda value: frozenset(map(convert_elem, value))
 
-    def _construct_set_arg(self, field_type, value):
-        """ Returns the Python set corresponding to a JSON array in the request body.
+    def _compile_map(self, type_node):
+        """ Returns a function converting a JSON object into a dict.
 
-        :param field_type: the type of the set being constructed
-        :type field_type: str
-        :param value: a JSON array representing the desired Python set
-        :type value: JSON array
-        :returns: the desired Python set
-        :rtype: set
+        JSON object keys are always strings, so struct keys are decoded from JSON before they are converted.
+
+        :param type_node: the type of the map
+        :type type_node: ThriftType
+        :rtype: callable
 
         """
-        elem_type = field_type[field_type.index('<') + 1: field_type.rindex('>')]
-        return frozenset([self._convert_dict_entry_to_arg(elem_type, elem) for elem in value])
+        key_type, elem_type = type_node.args
+        convert_key = self._compile_type(key_type)
+        convert_elem = self._compile_type(elem_type)
+        if key_type.kind == ThriftType.STRUCT:
+            convert_struct_key = convert_key
+            convert_key = lambda key: convert_struct_key(json.loads(key))
+        return lambda value: {convert_key(key): convert_elem(elem) for key, elem in value.iteritems()}
 
-    def _construct_map_arg(self, field_type, value):
-        """ Returns the Python dict corresponding to a JSON object in the request body.
+    @staticmethod
+    def _get_type_class(package, type_name):
+        """ Gets the generated Python class corresponding to a type definition.
 
-        :param field_type: the type of the map being constructed
-        :type field_type: str
-        :param value: a JSON object representing the desired Python dict
-        :type value: JSON
-        :returns: the desired Python dict
-        :rtype: dict
+        :param package: the name of the package containing the class
+        :type package: str
+        :param type_name: the name of the class to retrieve
+        :type type_name: str
+        :returns: the class defining the desired type name in the given package
 
         """
-        types_string = field_type[field_type.index('<') + 1: field_type.rindex('>')]
-        split_index = ThriftParser.calc_map_types_split_index(types_string)
-        if split_index == -1:
-            raise ThriftCLIError('Invalid type formatting for map - \'%s\'' % types_string)
-        key_type = types_string[:split_index].strip()
-        elem_type = types_string[split_index + 1:].strip()
-        prep = lambda x: x if self._parse_result.get_struct(key_type) is None else json.loads(x)
-        return {self._convert_dict_entry_to_arg(key_type, prep(key)): self._convert_dict_entry_to_arg(elem_type, elem)
-                for key, elem in value.items()}
+        return getattr(sys.modules['%s.ttypes' % package], type_name)
 
     @staticmethod
     def _split_field_type(field_type):
@@ -223,3 +226,11 @@ class ThriftArgumentConverter(object):
         if not split or len(split) != 2:
             raise ThriftCLIError('Field type should be in format \'Namespace.type\', given \'%s\'' % field_type)
         return split
+
+
+def _convert_integer(value):
+    """ Converts a value of an integer type, or of an undeclared type, into a long if it represents one. """
+    try:
+        return long(value)
+    except ValueError:
+        return value
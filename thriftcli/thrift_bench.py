@@ -0,0 +1,376 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import itertools
+import math
+import random
+import threading
+import time
+
+from .thrift_cli_error import ThriftCLIError
+from .thrift_reactor import wait_first
+
+# The percentiles reported in a benchmark summary, by name.
+SUMMARY_PERCENTILES = [('p50', 50.0), ('p90', 90.0), ('p99', 99.0), ('p999', 99.9)]
+# The shapes of request timeline a rate-limited benchmark can follow.
+CONSTANT_SCHEDULE = 'constant'
+POISSON_SCHEDULE = 'poisson'
+RAMP_SCHEDULE = 'ramp'
+SCHEDULES = [CONSTANT_SCHEDULE, POISSON_SCHEDULE, RAMP_SCHEDULE]
+
+
+def make_schedule(schedule, rate, duration=None, ramp_to=None, seed=None):
+    """ Returns the times at which to send requests, in seconds from the start of a benchmark.
+
+    A constant schedule sends requests evenly spaced at the rate. A poisson schedule sends them at random times,
+    averaging the rate, the way independent clients would. A ramp schedule changes the rate linearly from rate to
+    ramp_to over the duration.
+
+    :param schedule: one of SCHEDULES
+    :type schedule: str
+    :param rate: the number of requests per second, or the starting rate of a ramp
+    :type rate: float
+    :param duration: the number of seconds a ramp lasts, which ramp schedules require
+    :type duration: float
+    :param ramp_to: the rate a ramp ends at, which ramp schedules require
+    :type ramp_to: float
+    :param seed: the seed of a poisson schedule's random times, or None to vary them between runs
+    :type seed: int
+    :returns: the send times, in increasing order and without end
+    :rtype: iterator of float
+    :raises: ThriftCLIError
+
+    """
+    if schedule == CONSTANT_SCHEDULE:
+        return (index / float(rate) for index in itertools.count())
+    if schedule == POISSON_SCHEDULE:
+        return _poisson_schedule(rate, random.Random(seed))
+    if schedule == RAMP_SCHEDULE:
+        if duration is None or ramp_to is None:
+            raise ThriftCLIError('A ramp schedule needs a duration and a rate to ramp to')
+        return _ramp_schedule(float(rate), float(ramp_to), float(duration))
+    raise ThriftCLIError('Unknown schedule \'%s\', expected one of: %s' % (schedule, ', '.join(SCHEDULES)))
+
+
+def _poisson_schedule(rate, generator):
+    send_time = 0.0
+    while True:
+        yield send_time
+        send_time += generator.expovariate(rate)
+
+
+def _ramp_schedule(start_rate, end_rate, duration):
+    # The index-th request is sent once start_rate * t + (end_rate - start_rate) * t ** 2 / (2 * duration) requests
+    # have been, so t is the positive root of that quadratic. After the ramp, requests continue at end_rate.
+    acceleration = (end_rate - start_rate) / duration
+    ramp_requests = (start_rate + end_rate) * duration / 2
+    for index in itertools.count():
+        if index >= ramp_requests:
+            yield duration + (index - ramp_requests) / end_rate
+        elif acceleration == 0:
+            yield index / start_rate
+        else:
+            yield (math.sqrt(start_rate ** 2 + 2 * acceleration * index) - start_rate) / acceleration
+
+
+class LatencyHistogram(object):
+    """ Counts latencies in logarithmic buckets, the way an HDR histogram does, to report percentiles in fixed memory.
+
+    Latencies are recorded in whole microseconds. Values below 2 ** SUB_BUCKET_BITS are counted exactly, and larger
+    values are counted in buckets whose width is under 1 / 2 ** (SUB_BUCKET_BITS - 1) of their value, so percentiles
+    are within 1% of the recorded latencies however large they are.
+
+    """
+
+    SUB_BUCKET_BITS = 8
+
+    def __init__(self):
+        self._counts = collections.defaultdict(int)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        """ Counts a latency.
+
+        :param value: the latency in microseconds
+        :type value: int
+
+        """
+        value = max(int(value), 0)
+        shift = max(value.bit_length() - LatencyHistogram.SUB_BUCKET_BITS, 0)
+        self._counts[value >> shift << shift] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def add(self, other):
+        """ Counts every latency recorded by another histogram.
+
+        :param other: the histogram to add
+        :type other: LatencyHistogram
+
+        """
+        for value, count in other._counts.iteritems():
+            self._counts[value] += count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def percentile(self, percentile):
+        """ Returns the latency that the given percentage of recorded latencies are at or below.
+
+        :param percentile: the percentage, from 0 to 100
+        :type percentile: float
+        :returns: the highest latency counted in the percentile's bucket, no more than the maximum, or None if empty
+        :rtype: int
+
+        """
+        if not self.count:
+            return None
+        # The rank of the latency in sorted order, counting from 1
+        rank = max(int(math.ceil(percentile * self.count / 100.0 - 1e-9)), 1)
+        seen = 0
+        for value in sorted(self._counts):
+            seen += self._counts[value]
+            if seen >= rank:
+                shift = max(value.bit_length() - LatencyHistogram.SUB_BUCKET_BITS, 0)
+                return min(value + (1 << shift) - 1, self.max)
+        return self.max
+
+    def summarize(self):
+        """ Returns the minimum, mean, summary percentiles, and maximum latency in milliseconds.
+
+        :rtype: dict
+
+        """
+        if not self.count:
+            return dict([('min', None), ('mean', None), ('max', None)] +
+                        [(name, None) for name, _ in SUMMARY_PERCENTILES])
+        summary = {'min': self.min / 1000.0, 'mean': self.total / 1000.0 / self.count, 'max': self.max / 1000.0}
+        for name, percentile in SUMMARY_PERCENTILES:
+            summary[name] = self.percentile(percentile) / 1000.0
+        return summary
+
+
+class ThriftBenchmark(object):
+    """ Runs a request repeatedly against a server, recording latencies, throughput, and errors.
+
+    Without a rate, the benchmark is closed-loop: each connection sends its next request as soon as the last one
+    completes. With a rate, it is open-loop: requests are due on a timeline fixed in advance by make_schedule, whatever
+    the server's speed, and each request's latency is measured from when it was due rather than from when it was sent.
+    A server that stalls then shows up in the latencies of every request that was due during the stall, instead of
+    only in the one request that was in flight, so coordinated omission does not hide the tail. Requests that are due
+    while every connection is busy wait for the first free one, and the summary reports how late they were sent.
+
+    The benchmark runs for a duration, a number of requests, or until either is reached. Requests run from a thread
+    per connection, or from the event loop when nonblocking, where each connection has up to the pipeline's number of
+    requests in flight.
+
+    """
+
+    def __init__(self, thrift_executor, method_name, request_args, concurrency=1, nonblocking=False, pipeline=1,
+                 rate=None, duration=None, requests=None, schedule=CONSTANT_SCHEDULE, ramp_to=None, seed=None):
+        """
+        :param thrift_executor: the executor to run the requests with, with a connection for each of the concurrency
+        :type thrift_executor: ThriftExecutor
+        :param method_name: the name of the method to request
+        :type method_name: str
+        :param request_args: keyword arguments to pass into each method call
+        :type request_args: dict
+        :param concurrency: the number of requests to run at once, each over its own connection
+        :type concurrency: int
+        :param nonblocking: whether to run the requests on the event loop instead of a thread per connection
+        :type nonblocking: bool
+        :param pipeline: the number of requests to have in flight on each connection of the event loop
+        :type pipeline: int
+        :param rate: the number of requests to send per second, or None to send them as fast as they complete
+        :type rate: float
+        :param duration: the number of seconds to send requests for, or None to stop after the number of requests
+        :type duration: float
+        :param requests: the number of requests to send, or None to stop after the duration
+        :type requests: int
+        :param schedule: the shape of the timeline requests are sent on when there is a rate, one of SCHEDULES
+        :type schedule: str
+        :param ramp_to: the rate a ramp schedule ends at
+        :type ramp_to: float
+        :param seed: the seed of a poisson schedule's random times, or None to vary them between runs
+        :type seed: int
+        :raises: ThriftCLIError if neither a duration nor a number of requests is given, or the schedule is invalid
+
+        """
+        if duration is None and requests is None:
+            raise ThriftCLIError('A benchmark needs a duration or a number of requests to stop after')
+        self._thrift_executor = thrift_executor
+        self._method_name = method_name
+        self._request_args = request_args
+        self._concurrency = concurrency
+        self._nonblocking = nonblocking
+        self._pipeline = pipeline
+        self._rate = rate
+        self._duration = duration
+        self._requests = requests
+        self._schedule = schedule if rate else None
+        self._send_times = make_schedule(schedule, rate, duration, ramp_to, seed) if rate else None
+        self._lock = threading.Lock()
+        self._results = _BenchmarkResults()
+        self._sent = 0
+        self._start_time = None
+
+    def run(self):
+        """ Runs the benchmark and returns its summary.
+
+        The summary holds the number of requests, the number of errors by exception type, the elapsed seconds, and the
+        throughput in requests per second. For the requests that succeeded, it summarizes in milliseconds their latency
+        from when they were due, their service time from when they were sent, and how late they were sent. With a proxy,
+        it also counts the tunnels opened through it and summarizes how long they took, apart from the requests, and
+        with TLS, it counts the handshakes.
+
+        :rtype: dict
+
+        """
+        self._start_time = time.time()
+        if self._nonblocking:
+            self._run_nonblocking()
+        else:
+            self._run_in_threads()
+        elapsed = time.time() - self._start_time
+        results = self._results
+        requests = results.latencies.count + sum(results.errors.values())
+        return {
+            'requests': requests,
+            'errors': sum(results.errors.values()),
+            'error_types': dict(results.errors),
+            'seconds': elapsed,
+            'throughput': requests / elapsed if elapsed > 0 else None,
+            'concurrency': self._concurrency * (self._pipeline if self._nonblocking else 1),
+            'rate': self._rate,
+            'schedule': self._schedule,
+            'latency_ms': results.latencies.summarize(),
+            'service_time_ms': results.service_times.summarize(),
+            'send_lag_ms': results.send_lags.summarize(),
+            'tunnel_setup_ms': self._thrift_executor.get_tunnel_summary(),
+            'tls_handshakes': self._thrift_executor.get_tls_summary(),
+        }
+
+    def _next_send_time(self):
+        """ Claims the next request to send, returning when it is due, or None once the benchmark is over.
+
+        :rtype: float
+
+        """
+        with self._lock:
+            if self._requests is not None and self._sent >= self._requests:
+                return None
+            if self._send_times is not None:
+                send_time = self._start_time + next(self._send_times)
+            else:
+                send_time = time.time()
+            # Requests are due within the duration even if the benchmark fell behind and sends them after it
+            if self._duration is not None and send_time >= self._start_time + self._duration:
+                return None
+            self._sent += 1
+            return send_time
+
+    def _run_in_threads(self):
+        threads = [threading.Thread(target=self._run_worker) for _ in range(self._concurrency)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            # Joining with a timeout lets the main thread handle KeyboardInterrupt
+            while thread.is_alive():
+                thread.join(1)
+
+    def _run_worker(self):
+        """ Sends requests one at a time until the benchmark is over, recording into results of its own. """
+        results = _BenchmarkResults()
+        while True:
+            due = self._next_send_time()
+            if due is None:
+                break
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            sent = time.time()
+            try:
+                self._thrift_executor.run(self._method_name, self._request_args)
+            except Exception as e:
+                results.record_error(e)
+            else:
+                results.record(due, sent, time.time())
+        with self._lock:
+            self._results.add(results)
+
+    def _run_nonblocking(self):
+        """ Submits requests to the event loop, keeping up to a window of them in flight. """
+        window = self._concurrency * self._pipeline
+        in_flight = set([])
+
+        def on_done(future, due, sent):
+            in_flight.discard(future)
+            if future.exception() is not None:
+                self._results.record_error(future.exception())
+            else:
+                self._results.record(due, sent, time.time())
+
+        due = self._next_send_time()
+        while due is not None or in_flight:
+            if due is not None and len(in_flight) < window and due <= time.time():
+                sent = time.time()
+                if self._send_times is None:
+                    # A closed-loop request is due as soon as there is room for it
+                    due = sent
+                future = self._thrift_executor.run_async(self._method_name, self._request_args)
+                in_flight.add(future)
+                future.add_done_callback(lambda done, due=due, sent=sent: on_done(done, due, sent))
+                due = self._next_send_time()
+            elif in_flight:
+                timeout = None
+                if due is not None and len(in_flight) < window:
+                    timeout = max(due - time.time(), 0)
+                wait_first(in_flight, timeout)
+            else:
+                time.sleep(max(due - time.time(), 0))
+
+
+class _BenchmarkResults(object):
+    """ The latencies and errors recorded by a benchmark, or by one of its threads. """
+
+    def __init__(self):
+        self.latencies = LatencyHistogram()
+        self.service_times = LatencyHistogram()
+        self.send_lags = LatencyHistogram()
+        self.errors = collections.Counter()
+
+    def record(self, due, sent, completed):
+        """ Records a request that succeeded, given when it was due, sent, and completed in seconds since the epoch. """
+        self.latencies.record((completed - due) * 1000000)
+        self.service_times.record((completed - sent) * 1000000)
+        self.send_lags.record((sent - due) * 1000000)
+
+    def record_error(self, exception):
+        self.errors[type(exception).__name__] += 1
+
+    def add(self, other):
+        self.latencies.add(other.latencies)
+        self.service_times.add(other.service_times)
+        self.send_lags.add(other.send_lags)
+        self.errors.update(other.errors)
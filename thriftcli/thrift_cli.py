@@ -11,32 +11,53 @@
 # limitations under the License.
 
 import argparse
+import collections
+import itertools
 import json
 import logging
 import os
+import sys
 
-from thrift_zookeeper_resolver import get_server_address
 from .request_body_converter import convert
 from .thrift_argument_converter import ThriftArgumentConverter
+from .thrift_bench import CONSTANT_SCHEDULE, RAMP_SCHEDULE, SCHEDULES, ThriftBenchmark
 from .thrift_cli_error import ThriftCLIError
+from .thrift_codegen_cache import ThriftCodegenCache
 from .thrift_executor import ThriftExecutor
+from .thrift_json_writer import DEFAULT_JSON_INDENT, ThriftJSONWriter, dump_json
+from .thrift_load_balancer import LOAD_BALANCING_POLICIES, POWER_OF_TWO_CHOICES_POLICY, ThriftLoadBalancer
+from .thrift_parse_cache import ThriftParseCache
 from .thrift_parser import ThriftParser
+from .thrift_protocols import FINAGLE_PROTOCOL, FRAMED_TRANSPORT, PROTOCOLS, TRANSPORTS
+from .thrift_shell import ThriftShell
 
 THRIFT_PATH_ENVIRONMENT_VARIABLE = 'THRIFT_CLI_PATH'
+# The number of seconds to benchmark for when neither a duration nor a number of requests is given.
+DEFAULT_BENCH_DURATION = 10.0
 
 
 class ThriftCLI(object):
     """ Provides an interface for setting up a client, making requests, and cleaning up.
 
     Call init to open a connection with a server and inform ThriftCLI of the available endpoints.
-    Call run to make a request.
+    Call run to make a request, or run_batch to make a request for every line of a JSONL file.
+    Call run_bench to make a request repeatedly and measure its latency and throughput.
     Call cleanup to close the connection and delete the generated python code.
 
     """
 
     def __init__(self, thrift_path, server_address, service_name, tls, tls_key_path, cert_verification_mode, thrift_dir_paths=None, zookeeper=False,
                  client_id=None,
-                 proxy=None):
+                 proxy=None,
+                 use_cache=True,
+                 in_memory=False,
+                 concurrency=1,
+                 nonblocking=False,
+                 pipeline=1,
+                 zookeeper_resolver=None,
+                 load_balancing=None,
+                 protocol=FINAGLE_PROTOCOL,
+                 transport=FRAMED_TRANSPORT):
         """
         :param thrift_path: the path to the thrift file being used.
         :type thrift_path: str
@@ -50,18 +71,62 @@ class ThriftCLI(object):
         :type client_id: str
         :param proxy: [<proxy host>:<proxy port>] to route request through
         :type proxy: str
+        :param use_cache: whether or not to reuse generated code and parse results cached from previous runs.
+        :type use_cache: bool
+        :param in_memory: whether or not to build the thrift types in memory instead of running the thrift compiler.
+        :type in_memory: bool
+        :param concurrency: the number of connections to open and of batch requests to run at once.
+        :type concurrency: int
+        :param nonblocking: whether to run batch requests on a single-threaded event loop instead of a thread pool.
+        :type nonblocking: bool
+        :param pipeline: the number of requests to send on each connection before reading their replies, which runs
+            batch requests on the event loop if above 1.
+        :type pipeline: int
+        :param zookeeper_resolver: the resolver to look up the server address with when zookeeper is set, defaults to
+            one caching server sets if use_cache is set.
+        :type zookeeper_resolver: ThriftZookeeperResolver
+        :param load_balancing: with zookeeper and more than one connection or nonblocking, the policy to spread requests
+            over every member of the server set with, one of LOAD_BALANCING_POLICIES, or None to send them all to one.
+        :type load_balancing: str
+        :param protocol: the protocol to encode requests with, one of PROTOCOLS.
+        :type protocol: str
+        :param transport: the transport to frame or buffer requests with, one of TRANSPORTS.
+        :type transport: str
         """
         self._thrift_path = _find_path(thrift_path)
-        self._thrift_argument_converter = ThriftArgumentConverter(self._thrift_path, thrift_dir_paths)
+        self._thrift_argument_converter = ThriftArgumentConverter(self._thrift_path, thrift_dir_paths,
+                                                                  ThriftParseCache() if use_cache else None)
+        self._service_name = service_name
+        self._concurrency = concurrency
+        # Pipelined requests are only supported by the event loop
+        self._nonblocking = nonblocking or pipeline > 1
+        self._pipeline = pipeline
         self._service_reference = '%s.%s' % (ThriftParser.get_package_name(self._thrift_path), service_name)
+        self._zookeeper_address = server_address if zookeeper else None
         if zookeeper:
-            server_address = get_server_address(server_address, service_name)
+            if zookeeper_resolver is None:
+                from .thrift_zookeeper_resolver import ThriftServerSetCache, ThriftZookeeperResolver
+                zookeeper_resolver = ThriftZookeeperResolver(ThriftServerSetCache() if use_cache else None)
+        load_balancer = None
+        if zookeeper and load_balancing is not None and (concurrency > 1 or self._nonblocking):
+            load_balancer = ThriftLoadBalancer(zookeeper_resolver.get_server_addresses(server_address, service_name),
+                                               load_balancing)
+            server_address = load_balancer.choose()
+        elif zookeeper:
+            server_address = zookeeper_resolver.get_server_address(server_address, service_name)
+        self._zookeeper_resolver = zookeeper_resolver
+        parse_result = self._thrift_argument_converter._parse_result
         self._thrift_executor = ThriftExecutor(self._thrift_path, server_address, self._service_reference,
-                                               self._thrift_argument_converter._parse_result.namespaces,
+                                               parse_result.namespaces,
                                                tls, tls_key_path, cert_verification_mode,
-                                               thrift_dir_paths=thrift_dir_paths, client_id=client_id, proxy=proxy)
-
-    def run(self, method_name, request_body, return_json=False):
+                                               thrift_dir_paths=thrift_dir_paths, client_id=client_id, proxy=proxy,
+                                               codegen_cache=ThriftCodegenCache() if use_cache else None,
+                                               parse_result=parse_result if in_memory else None,
+                                               connections=concurrency, nonblocking=self._nonblocking,
+                                               pipeline=pipeline, load_balancer=load_balancer, protocol=protocol,
+                                               transport=transport)
+
+    def run(self, method_name, request_body, return_json=False, json_indent=DEFAULT_JSON_INDENT, sort_keys=True):
         """ Runs the endpoint on the connected server as defined by the thrift file.
 
         :param method_name: the name of the method to ask the server to run.
@@ -70,6 +135,10 @@ class ThriftCLI(object):
         :type request_body: dict
         :param return_json: returns result in JSON format if True, python object if False.
         :type return_json: bool
+        :param json_indent: the number of spaces to indent the JSON by, or None to return it on one line
+        :type json_indent: int
+        :param sort_keys: whether to sort the fields of the JSON
+        :type sort_keys: bool
         :returns: endpoint result
 
         """
@@ -80,21 +149,249 @@ class ThriftCLI(object):
                 _dump_json(request_args)
             )
         result = self._thrift_executor.run(method_name, request_args)
-        return self.transform_output(result, return_json)
+        return self.transform_output(result, return_json, json_indent, sort_keys)
+
+    def run_async(self, method_name, request_body):
+        """ Submits a request to run on the event loop, and returns its future result.
+
+        Any number of requests may be submitted before waiting on their results. They run concurrently on up to as many
+        non-blocking connections as the concurrency allows, with up to the pipeline's number of requests in flight on
+        each, all from the calling thread.
+
+        :param method_name: the name of the method to ask the server to run.
+        :type method_name: str
+        :param request_body: the arguments to provide as arguments to the endpoint.
+        :type request_body: dict
+        :returns: the future endpoint result, whose result method waits for it
+        :rtype: ThriftFuture
+
+        """
+        request_args = self._thrift_argument_converter.convert_args(self._service_reference, method_name, request_body)
+        return self._thrift_executor.run_async(method_name, request_args)
+
+    def run_batch(self, lines, output, default_method_name=None):
+        """ Runs a request for every line of a JSONL batch over the open connection, writing a result per line.
+
+        Each line is a JSON object such as {"endpoint": "Service.function", "body": {...}}. The endpoint may also be
+        given as just the function name, or left out to use the default method. The body is a JSON object or a string
+        in any format accepted by --body, and defaults to no arguments. Blank lines are skipped.
+
+        A JSON object is written to output for each line, in input order, as soon as its request and every request
+        before it complete. It is either {"line": <number>, "result": <result>} or
+        {"line": <number>, "error": {"type": ..., "message": ...}}. A line that fails does not stop the lines after it.
+        With a concurrency above 1, that many requests run at once, each on its own connection, from a thread pool or
+        from the event loop if the ThriftCLI is nonblocking. With a pipeline above 1, each connection of the event loop
+        has that many requests in flight at once.
+
+        :param lines: the lines of the batch
+        :type lines: iterable of str
+        :param output: the file to write the results to, one JSON object per line
+        :type output: file
+        :param default_method_name: the method to request for lines without an endpoint, or None to require one
+        :type default_method_name: str
+        :returns: the number of lines that failed
+        :rtype: int
+
+        """
+        numbered_lines = ((line_number, line) for line_number, line in enumerate(lines, 1) if line.strip())
+        if self._nonblocking:
+            records = self._run_batch_nonblocking(numbered_lines, default_method_name)
+        else:
+            records = self._run_batch_in_threads(numbered_lines, default_method_name)
+        failures = 0
+        for record in records:
+            failures += 'error' in record
+            output.write(json.dumps(record, default=_default_json_handler, sort_keys=True) + '\n')
+            output.flush()
+        return failures
+
+    def _run_batch_in_threads(self, numbered_lines, default_method_name):
+        """ Runs the lines of a batch on a pool of as many threads as the concurrency, or on this thread.
+
+        :param numbered_lines: the number and text of each line to run
+        :type numbered_lines: iterable of (int, str)
+        :param default_method_name: the method to request for lines without an endpoint
+        :type default_method_name: str
+        :returns: the record of each line's result or error, in input order
+        :rtype: iterator of dict
+
+        """
+        def run_line(numbered_line):
+            line_number, line = numbered_line
+            try:
+                method_name, request_body = self._parse_batch_line(line, default_method_name)
+                return {'line': line_number, 'result': self.run(method_name, request_body)}
+            except Exception as e:
+                return _make_error_record(line_number, e)
+
+        if self._concurrency <= 1:
+            for record in itertools.imap(run_line, numbered_lines):
+                yield record
+            return
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(self._concurrency)
+        try:
+            # imap yields results in input order, however the requests complete
+            for record in pool.imap(run_line, numbered_lines):
+                yield record
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _run_batch_nonblocking(self, numbered_lines, default_method_name):
+        """ Runs the lines of a batch on the event loop, keeping up to twice as many submitted as can be in flight.
+
+        :param numbered_lines: the number and text of each line to run
+        :type numbered_lines: iterable of (int, str)
+        :param default_method_name: the method to request for lines without an endpoint
+        :type default_method_name: str
+        :returns: the record of each line's result or error, in input order
+        :rtype: iterator of dict
+
+        """
+        submitted = collections.deque()
+        numbered_lines = iter(numbered_lines)
+        while True:
+            while len(submitted) < 2 * self._concurrency * self._pipeline:
+                numbered_line = next(numbered_lines, None)
+                if numbered_line is None:
+                    break
+                line_number, line = numbered_line
+                try:
+                    method_name, request_body = self._parse_batch_line(line, default_method_name)
+                    submitted.append((line_number, self.run_async(method_name, request_body)))
+                except Exception as e:
+                    submitted.append((line_number, _make_error_record(line_number, e)))
+            if not submitted:
+                return
+            line_number, future = submitted.popleft()
+            if isinstance(future, dict):
+                yield future
+                continue
+            try:
+                yield {'line': line_number, 'result': future.result()}
+            except Exception as e:
+                yield _make_error_record(line_number, e)
+
+    def run_bench(self, method_name, request_body, rate=None, duration=None, requests=None,
+                  schedule=CONSTANT_SCHEDULE, ramp_to=None, seed=None):
+        """ Runs a request repeatedly, as many at once as the concurrency allows, and returns a summary of the runs.
+
+        The request body is converted once, so only the requests themselves are measured. See ThriftBenchmark for how
+        requests are scheduled and for the summary's contents.
+
+        :param method_name: the name of the method to ask the server to run.
+        :type method_name: str
+        :param request_body: the arguments to provide as arguments to the endpoint.
+        :type request_body: dict
+        :param rate: the number of requests to send per second, or None to send them as fast as they complete.
+        :type rate: float
+        :param duration: the number of seconds to send requests for, or None to stop after the number of requests.
+        :type duration: float
+        :param requests: the number of requests to send, or None to stop after the duration.
+        :type requests: int
+        :param schedule: the shape of the timeline requests are sent on when there is a rate, one of SCHEDULES.
+        :type schedule: str
+        :param ramp_to: the rate a ramp schedule ends at.
+        :type ramp_to: float
+        :param seed: the seed of a poisson schedule's random times, or None to vary them between runs.
+        :type seed: int
+        :returns: the summary of the benchmark
+        :rtype: dict
+
+        """
+        request_args = self._thrift_argument_converter.convert_args(self._service_reference, method_name, request_body)
+        benchmark = ThriftBenchmark(self._thrift_executor, method_name, request_args, self._concurrency,
+                                    self._nonblocking, self._pipeline, rate, duration, requests, schedule, ramp_to,
+                                    seed)
+        return benchmark.run()
+
+    def _parse_batch_line(self, line, default_method_name):
+        """ Extracts the method name and request body from a line of a batch.
+
+        :param line: a JSON object with an optional endpoint and body
+        :type line: str
+        :param default_method_name: the method to request if the line has no endpoint, or None to require one
+        :type default_method_name: str
+        :returns: the method name and request body
+        :rtype: tuple of (str, dict)
+        :raises: ThriftCLIError
+
+        """
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            raise ThriftCLIError('Invalid JSON: %s' % e)
+        if not isinstance(request, dict):
+            raise ThriftCLIError('Each line should be a JSON object, given: %s' % line.strip())
+        endpoint = request.get('endpoint', default_method_name)
+        if not endpoint:
+            raise ThriftCLIError('Line has no endpoint')
+        if '.' in endpoint:
+            service_name, method_name = _split_endpoint(endpoint)
+            if service_name != self._service_name:
+                raise ThriftCLIError('Endpoint \'%s\' is not provided by the \'%s\' service' %
+                                     (endpoint, self._service_name))
+        else:
+            method_name = endpoint
+        request_body = request.get('body', {})
+        if isinstance(request_body, basestring):
+            try:
+                request_body = convert(request_body)
+            except ValueError as e:
+                raise ThriftCLIError(e)
+        return str(method_name), request_body
+
+    def get_service_name(self):
+        return self._service_name
+
+    def get_parse_result(self):
+        """ Returns the result of parsing the thrift file and its includes.
+
+        :rtype: ThriftParseResult
+
+        """
+        return self._thrift_argument_converter._parse_result
+
+    def get_endpoints(self):
+        """ Returns the endpoints declared by the service.
+
+        :returns: the endpoints by method name
+        :rtype: dict of str to ThriftService.Endpoint
+
+        """
+        return self.get_parse_result().services[self._service_reference].endpoints
+
+    def reconnect(self):
+        """ Closes the connection to the server and opens a new one, such as after the server closed it.
+
+        With zookeeper, the server address is resolved again, since the server may have left its server set.
+
+        """
+        if self._zookeeper_address is None:
+            self._thrift_executor.reconnect()
+            return
+        server_address = self._zookeeper_resolver.get_server_address(self._zookeeper_address, self._service_name)
+        self._thrift_executor.reconnect(server_address)
 
     def cleanup(self, remove_generated_src=False):
         """ Deletes the gen-py code and closes the transport with the server. """
         self._thrift_executor.cleanup(remove_generated_src)
 
     @classmethod
-    def transform_output(cls, result, return_json=False):
+    def transform_output(cls, result, return_json=False, json_indent=DEFAULT_JSON_INDENT, sort_keys=True):
         if return_json:
-            result = _dump_json(result)
+            result = dump_json(result, json_indent, sort_keys)
         return result
 
 
+def _make_error_record(line_number, exception):
+    """ Returns the record reporting the error of a batch line. Any error is reported for its line only. """
+    return {'line': line_number, 'error': {'type': type(exception).__name__, 'message': str(exception)}}
+
+
 def _dump_json(obj):
-    return json.dumps(obj, default=_default_json_handler, sort_keys=True, indent=4, separators=(',', ': '))
+    return dump_json(obj, DEFAULT_JSON_INDENT, sort_keys=True)
 
 
 def _default_json_handler(obj):
@@ -191,8 +488,55 @@ def _parse_namespace(args):
     tls = args.tls
     tls_key_path = args.tls_key_path
     cert_verification_mode = args.cert_verification_mode
+    use_cache = not args.no_cache
+    in_memory = args.in_memory
+    batch_path = args.batch
+    concurrency = args.concurrency
+    if concurrency < 1:
+        raise ThriftCLIError('Concurrency should be at least 1, given: %d' % concurrency)
+    nonblocking = args.nonblocking
+    pipeline = args.pipeline
+    if pipeline < 1:
+        raise ThriftCLIError('Pipeline should be at least 1, given: %d' % pipeline)
+    load_balancing = args.load_balancing
+    protocol = args.protocol
+    transport = args.transport
+    if args.json_indent < 0:
+        raise ThriftCLIError('JSON indent should be at least 0, given: %d' % args.json_indent)
+    json_indent = args.json_indent or None
+    sort_keys = not args.no_sort_keys
     return (server_address, endpoint, thrift_path, thrift_dir_paths, request_body, zookeeper, return_json, cleanup,
-            client_id, proxy, tls, tls_key_path, cert_verification_mode)
+            client_id, proxy, tls, tls_key_path, cert_verification_mode, use_cache, in_memory, batch_path, concurrency,
+            nonblocking, pipeline, load_balancing, protocol, transport, json_indent, sort_keys)
+
+
+def _parse_bench_namespace(args):
+    """ Extracts the options of the bench subcommand from the namespace object returned by argparse.
+
+    :param args: the namespace object given by the bench ArgumentParser
+    :type args: Namespace
+    :returns: the keyword arguments to pass to ThriftCLI.run_bench
+    :rtype: dict
+    :raises: ThriftCLIError
+
+    """
+    if args.batch is not None:
+        raise ThriftCLIError('A benchmark runs a single request body, so --batch cannot be used with bench')
+    for name in ['rate', 'duration', 'requests', 'ramp_to']:
+        value = getattr(args, name)
+        if value is not None and value <= 0:
+            raise ThriftCLIError('%s should be positive, given: %s' % (name.capitalize(), value))
+    if args.rate is None and (args.schedule != CONSTANT_SCHEDULE or args.ramp_to is not None):
+        raise ThriftCLIError('A schedule needs a --rate to send requests at')
+    if (args.schedule == RAMP_SCHEDULE) != (args.ramp_to is not None):
+        raise ThriftCLIError('--ramp_to is required by, and only used with, --schedule %s' % RAMP_SCHEDULE)
+    if args.schedule == RAMP_SCHEDULE and args.duration is None:
+        raise ThriftCLIError('A ramp schedule needs a --duration to ramp over')
+    duration = args.duration
+    if duration is None and args.requests is None:
+        duration = DEFAULT_BENCH_DURATION
+    return {'rate': args.rate, 'duration': duration, 'requests': args.requests, 'schedule': args.schedule,
+            'ramp_to': args.ramp_to, 'seed': args.seed}
 
 
 def _make_parser():
@@ -211,16 +555,52 @@ def _make_parser():
                         help='path to thrift file declaring the endpoint')
     parser.add_argument('-I', '--include', type=str, nargs='*', default=[],
                         help='path to directory containing included thrift files')
-    parser.add_argument('-b', '--body', type=str, nargs='?',
-                        help='json string or path to json file encoding the request body')
-    parser.add_argument('-z', '--zookeeper', action='store_true',
-                        help='treat server address as a zookeeper host with a path')
-    parser.add_argument('-p', '--proxy', type=str,
-                        help='access the service via a proxy (for auth reasons) [<proxy host>:<proxy port>]')
+    request_group = parser.add_mutually_exclusive_group()
+    request_group.add_argument('-b', '--body', type=str, nargs='?',
+                               help='json string or path to json file encoding the request body')
+    request_group.add_argument('--batch', type=str, metavar='FILE',
+                               help='path to a JSONL file of requests, or - for stdin, to run over one connection. '
+                                    'Each line holds an endpoint and body, and results are printed as JSON lines')
+    parser.add_argument('--concurrency', type=int, default=1, metavar='N',
+                        help='run up to N requests of a batch at once, each over its own connection')
+    parser.add_argument('--nonblocking', action='store_true',
+                        help='run the requests of a batch on a single-threaded event loop over non-blocking '
+                             'connections instead of a thread pool')
+    parser.add_argument('--pipeline', type=int, default=1, metavar='N',
+                        help='send up to N requests of a batch on each connection before reading their replies, '
+                             'on the event loop')
+    parser.add_argument('--load_balancing', choices=LOAD_BALANCING_POLICIES, default=POWER_OF_TWO_CHOICES_POLICY,
+                        help='with --zookeeper and more than one connection, how to spread the requests of a batch '
+                             'over every member of the server set (default: %(default)s)')
+    _add_connection_arguments(parser)
     parser.add_argument('-c', '--cleanup', action='store_true',
                         help='remove generated code after execution')
     parser.add_argument('-j', '--json', action='store_true',
                         help='print result in JSON format')
+    parser.add_argument('--json_indent', type=int, default=DEFAULT_JSON_INDENT, metavar='N',
+                        help='with --json, indent the result by N spaces, or print it on one line if N is 0 '
+                             '(default: %(default)s)')
+    parser.add_argument('--no_sort_keys', action='store_true',
+                        help='with --json, print fields in the order the thrift file declares them instead of sorting '
+                             'them, which is faster for large results')
+    parser.add_argument('--daemon', action='store_true',
+                        help='forward the request to the client kept warm by a running thriftcli daemon')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='provide detailed logging')
+    return parser
+
+
+def _add_connection_arguments(parser):
+    """ Adds the arguments setting up a ThriftCLI's connection, shared by every subcommand that makes requests.
+
+    :param parser: the ArgumentParser to add the arguments to
+    :type parser: ArgumentParser
+
+    """
+    parser.add_argument('-z', '--zookeeper', action='store_true',
+                        help='treat server address as a zookeeper host with a path')
+    parser.add_argument('-p', '--proxy', type=str,
+                        help='access the service via a proxy (for auth reasons) [<proxy host>:<proxy port>]')
     parser.add_argument('-i', '--client_id', type=str, default=None,
                         help='Finagle client id to send request with')
     parser.add_argument('-t', '--tls', action='store_true', help='Use TLS socket if provided')
@@ -230,14 +610,56 @@ def _make_parser():
     parser.add_argument('-m', '--cert_verification_mode', type=str, default='required',
                         help='defines peer certificate verification mode. Possible values are none, optional, required. '
                              '--tls key must be provided to enable mtls')
-    parser.add_argument('-v', '--verbose', action='store_true',
-                        help='provide detailed logging')
+    parser.add_argument('--no_cache', action='store_true',
+                        help='always regenerate code and reparse thrift files instead of reusing results cached from '
+                             'previous runs')
+    parser.add_argument('--in_memory', action='store_true',
+                        help='build thrift types in memory instead of running the thrift compiler')
+    parser.add_argument('--protocol', choices=PROTOCOLS, default=FINAGLE_PROTOCOL,
+                        help='protocol to encode requests with, where accelerated-binary and compact use thrift\'s C '
+                             'extension if it is installed (default: %(default)s)')
+    parser.add_argument('--transport', choices=TRANSPORTS, default=FRAMED_TRANSPORT,
+                        help='transport to send requests over (default: %(default)s)')
+
+
+def _make_bench_parser():
+    """ Initializes the ArgumentParser for the bench subcommand, which takes the arguments of a single request along
+    with how to repeat it.
+
+    :returns: an ArgumentParser object configured for thriftcli bench
+    :rtype: ArgumentParser
+
+    """
+    parser = _make_parser()
+    parser.prog = '%s bench' % parser.prog
+    parser.description = 'Benchmark a thrift endpoint on a running server, printing a JSON summary of the latencies, ' \
+                         'throughput, and errors.'
+    bench_group = parser.add_argument_group('benchmark arguments')
+    bench_group.add_argument('--rate', type=float, metavar='R',
+                             help='send R requests per second on a fixed timeline, measuring latency from when each '
+                                  'request was due, instead of sending each as soon as a connection is free')
+    bench_group.add_argument('--schedule', choices=SCHEDULES, default=CONSTANT_SCHEDULE,
+                             help='the timeline of a --rate: evenly spaced, poisson arrivals, or a linear ramp from '
+                                  '--rate to --ramp_to over the duration')
+    bench_group.add_argument('--ramp_to', type=float, metavar='R',
+                             help='the rate a ramp schedule ends at')
+    bench_group.add_argument('--seed', type=int,
+                             help='the random seed of a poisson schedule, to repeat its timeline')
+    bench_group.add_argument('--duration', type=float, metavar='SECONDS',
+                             help='stop sending requests after this many seconds (default: %g, unless --requests is '
+                                  'given)' % DEFAULT_BENCH_DURATION)
+    bench_group.add_argument('--requests', type=int, metavar='N',
+                             help='stop after sending N requests')
     return parser
 
 
 def _run_cli(server_address, endpoint_name, thrift_path, thrift_dir_paths, request_body, zookeeper, return_json,
-             remove_generated_src, client_id, proxy, tls, tls_key_path, cert_verification_mode):
-    """ Runs a remote request and prints the result if it is not None.
+             remove_generated_src, client_id, proxy, tls, tls_key_path, cert_verification_mode, use_cache=True,
+             in_memory=False, batch_path=None, concurrency=1, nonblocking=False, pipeline=1,
+             load_balancing=POWER_OF_TWO_CHOICES_POLICY, protocol=FINAGLE_PROTOCOL, transport=FRAMED_TRANSPORT,
+             json_indent=DEFAULT_JSON_INDENT, sort_keys=True, bench=None):
+    """ Runs a remote request and prints the result if it is not None, runs every request in a batch file, or
+    benchmarks the request and prints a summary.
 
     :param server_address: the address of the Thrift server to request
     :type server_address: str
@@ -259,12 +681,42 @@ def _run_cli(server_address, endpoint_name, thrift_path, thrift_dir_paths, reque
     :type proxy: str
     :param verbose: log details
     :type verbose: bool
+    :param use_cache: whether or not to reuse generated code and parse results cached from previous runs
+    :type use_cache: bool
+    :param in_memory: whether or not to build thrift types in memory instead of running the thrift compiler
+    :type in_memory: bool
+    :param batch_path: the path to a JSONL file of requests, '-' for stdin, or None to run a single request
+    :type batch_path: str
+    :param concurrency: the number of requests in the batch to run at once, each over its own connection
+    :type concurrency: int
+    :param nonblocking: whether to run the batch on an event loop instead of a thread pool
+    :type nonblocking: bool
+    :param pipeline: the number of requests in the batch to have in flight on each connection at once
+    :type pipeline: int
+    :param load_balancing: with zookeeper, the policy to spread the requests of a batch or benchmark over every member
+        of the server set with
+    :type load_balancing: str
+    :param protocol: the protocol to encode requests with, one of PROTOCOLS
+    :type protocol: str
+    :param transport: the transport to frame or buffer requests with, one of TRANSPORTS
+    :type transport: str
+    :param json_indent: with return_json, the number of spaces to indent the result by, or None to print it on one line
+    :type json_indent: int
+    :param sort_keys: with return_json, whether to sort the fields of the result
+    :type sort_keys: bool
+    :param bench: the keyword arguments to benchmark the request with, or None to run it once
+    :type bench: dict
+    :returns: the number of requests in the batch or benchmark that failed
+    :rtype: int
 
     """
     [service_name, method_name] = _split_endpoint(endpoint_name)
+    repeated = batch_path is not None or bench is not None
     environment_defined_paths = []
     if os.environ.get(THRIFT_PATH_ENVIRONMENT_VARIABLE):
         environment_defined_paths = os.environ[THRIFT_PATH_ENVIRONMENT_VARIABLE].split(':')
+    # Batches and benchmarks may outlive a server, so its server set is watched for the next one to reconnect to
+    zookeeper_resolver = _make_watching_resolver(use_cache) if zookeeper and repeated else None
     cli = ThriftCLI(
         thrift_path,
         server_address,
@@ -274,14 +726,172 @@ def _run_cli(server_address, endpoint_name, thrift_path, thrift_dir_paths, reque
         zookeeper,
 
         client_id=client_id,
-        proxy=proxy
+        proxy=proxy,
+        use_cache=use_cache,
+        in_memory=in_memory,
+        concurrency=concurrency if repeated else 1,
+        nonblocking=nonblocking,
+        pipeline=pipeline if repeated else 1,
+        zookeeper_resolver=zookeeper_resolver,
+        load_balancing=load_balancing if repeated else None,
+        protocol=protocol,
+        transport=transport
     )
     try:
-        result = cli.run(method_name, request_body, return_json)
+        if batch_path is not None:
+            return _run_batch(cli, batch_path, method_name)
+        if bench is not None:
+            summary = cli.run_bench(method_name, request_body, **bench)
+            summary['endpoint'] = endpoint_name
+            print json.dumps(summary, sort_keys=True, indent=2)
+            return summary['errors']
+        if return_json:
+            # Written as it is encoded, so large results neither wait for nor hold a copy of the whole JSON
+            ThriftJSONWriter(sys.stdout, json_indent, sort_keys).write(cli.run(method_name, request_body))
+            sys.stdout.write('\n')
+            return 0
+        result = cli.run(method_name, request_body)
         if result is not None:
             print result
+        return 0
     finally:
         cli.cleanup(remove_generated_src)
+        if zookeeper_resolver is not None:
+            zookeeper_resolver.close()
+
+
+def _make_watching_resolver(use_cache):
+    """ Returns a zookeeper resolver that keeps the server sets it resolves current while the process runs.
+
+    :param use_cache: whether to cache the server sets on disk for other runs
+    :type use_cache: bool
+    :rtype: ThriftZookeeperResolver
+
+    """
+    from .thrift_zookeeper_resolver import ThriftServerSetCache, ThriftZookeeperResolver
+    return ThriftZookeeperResolver(ThriftServerSetCache() if use_cache else None, watch=True)
+
+
+def _make_shell_parser():
+    """ Initializes the ArgumentParser for the shell subcommand.
+
+    :returns: an ArgumentParser object configured for thriftcli shell
+    :rtype: ArgumentParser
+
+    """
+    parser = argparse.ArgumentParser(prog='thriftcli shell',
+                                     description='Make requests to a thrift service from an interactive shell.')
+    parser.add_argument('server_address', type=str,
+                        help='address of running server that implements the service')
+    parser.add_argument('service', type=str,
+                        help='name of the service to make requests to')
+    parser.add_argument('thrift_path', type=str,
+                        help='path to thrift file declaring the service')
+    parser.add_argument('-I', '--include', type=str, nargs='*', default=[],
+                        help='path to directory containing included thrift files')
+    _add_connection_arguments(parser)
+    parser.add_argument('--no_json', action='store_true',
+                        help='print results as python objects instead of in JSON format')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='provide detailed logging')
+    return parser
+
+
+def _run_shell(argv):
+    """ Runs an interactive shell making requests to a service, until it is exited.
+
+    :param argv: the arguments following 'shell' on the command line
+    :type argv: list of str
+
+    """
+    args = _make_shell_parser().parse_args(argv)
+    configure_logging(args.verbose)
+    environment_defined_paths = []
+    if os.environ.get(THRIFT_PATH_ENVIRONMENT_VARIABLE):
+        environment_defined_paths = os.environ[THRIFT_PATH_ENVIRONMENT_VARIABLE].split(':')
+    zookeeper_resolver = _make_watching_resolver(not args.no_cache) if args.zookeeper else None
+    cli = ThriftCLI(args.thrift_path, args.server_address, args.service, args.tls, args.tls_key_path,
+                    args.cert_verification_mode, args.include + environment_defined_paths, args.zookeeper,
+                    client_id=args.client_id, proxy=args.proxy, use_cache=not args.no_cache, in_memory=args.in_memory,
+                    zookeeper_resolver=zookeeper_resolver, protocol=args.protocol, transport=args.transport)
+    try:
+        ThriftShell(cli, return_json=not args.no_json).cmdloop()
+    except KeyboardInterrupt:
+        print
+    finally:
+        cli.cleanup()
+        if zookeeper_resolver is not None:
+            zookeeper_resolver.close()
+
+
+def _run_in_daemon(server_address, endpoint_name, thrift_path, thrift_dir_paths, request_body, zookeeper, return_json,
+                   remove_generated_src, client_id, proxy, tls, tls_key_path, cert_verification_mode, use_cache=True,
+                   in_memory=False, batch_path=None, concurrency=1, nonblocking=False, pipeline=1,
+                   load_balancing=POWER_OF_TWO_CHOICES_POLICY, protocol=FINAGLE_PROTOCOL, transport=FRAMED_TRANSPORT,
+                   json_indent=DEFAULT_JSON_INDENT, sort_keys=True):
+    """ Forwards a remote request to the thriftcli daemon and prints the result if it is not None.
+
+    Takes the same arguments as _run_cli. Paths are resolved here, since the daemon runs in its own directory and
+    environment. Generated code is kept by the daemon, so remove_generated_src is ignored, and batches are not
+    forwarded.
+
+    :returns: the number of requests that failed
+    :rtype: int
+    :raises: ThriftCLIError if there is no daemon, or the request failed
+
+    """
+    # The daemon module imports this one, so it is only imported when needed
+    from .thrift_daemon import ThriftDaemonClient
+    if batch_path is not None:
+        raise ThriftCLIError('Batches cannot be forwarded to the daemon')
+    [service_name, method_name] = _split_endpoint(endpoint_name)
+    environment_defined_paths = []
+    if os.environ.get(THRIFT_PATH_ENVIRONMENT_VARIABLE):
+        environment_defined_paths = os.environ[THRIFT_PATH_ENVIRONMENT_VARIABLE].split(':')
+    options = {
+        'thrift_path': os.path.abspath(_find_path(thrift_path)),
+        'server_address': server_address,
+        'service_name': service_name,
+        'tls': tls,
+        'tls_key_path': os.path.abspath(tls_key_path) if tls_key_path else tls_key_path,
+        'cert_verification_mode': cert_verification_mode,
+        'thrift_dir_paths': [os.path.abspath(path) for path in thrift_dir_paths + environment_defined_paths],
+        'zookeeper': zookeeper,
+        'client_id': client_id,
+        'proxy': proxy,
+        'use_cache': use_cache,
+        'in_memory': in_memory,
+        'protocol': protocol,
+        'transport': transport,
+        'method_name': method_name,
+        'request_body': request_body,
+        'return_json': return_json,
+        'json_indent': json_indent,
+        'sort_keys': sort_keys,
+    }
+    result = ThriftDaemonClient().run(options)
+    if result is not None:
+        print result
+    return 0
+
+
+def _run_batch(cli, batch_path, default_method_name):
+    """ Runs every request in a batch file and prints the results as JSON lines.
+
+    :param cli: the ThriftCLI to run the requests with
+    :type cli: ThriftCLI
+    :param batch_path: the path to a JSONL file of requests, or '-' for stdin
+    :type batch_path: str
+    :param default_method_name: the method to request for lines without an endpoint
+    :type default_method_name: str
+    :returns: the number of requests that failed
+    :rtype: int
+
+    """
+    if batch_path == '-':
+        return cli.run_batch(sys.stdin, sys.stdout, default_method_name)
+    with open(batch_path, 'r') as batch_file:
+        return cli.run_batch(batch_file, sys.stdout, default_method_name)
 
 
 def configure_logging(verbose):
@@ -301,7 +911,25 @@ def _parse_args():
 
 
 def main():
-    """ Runs a remote request and prints the result if it is not None. """
-    args = _parse_args()
-    configure_logging(args.verbose)
-    _run_cli(*_parse_namespace(args))
+    """ Runs a remote request and prints the result if it is not None, benchmarks it with thriftcli bench, makes
+    requests interactively with thriftcli shell, or keeps clients warm with thriftcli daemon. """
+    if sys.argv[1:2] == ['shell']:
+        _run_shell(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['daemon']:
+        from .thrift_daemon import run_daemon
+        run_daemon(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['bench']:
+        args = _make_bench_parser().parse_args(sys.argv[2:])
+        configure_logging(args.verbose)
+        failures = _run_cli(*_parse_namespace(args), bench=_parse_bench_namespace(args))
+    else:
+        args = _parse_args()
+        configure_logging(args.verbose)
+        if args.daemon:
+            failures = _run_in_daemon(*_parse_namespace(args))
+        else:
+            failures = _run_cli(*_parse_namespace(args))
+    if failures:
+        sys.exit(1)
@@ -0,0 +1,241 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from distutils.spawn import find_executable
+
+from .thrift_cli_error import ThriftCLIError
+from .thrift_parser import ThriftParser
+
+CACHE_DIR_ENVIRONMENT_VARIABLE = 'THRIFT_CLI_CACHE_DIR'
+DEFAULT_MAX_CACHE_SIZE = 256 * 1024 * 1024
+
+
+def get_cache_dir():
+    """ Returns the per-user directory that thriftcli keeps its caches in.
+
+    The directory is $THRIFT_CLI_CACHE_DIR if set, otherwise $XDG_CACHE_HOME/thriftcli or ~/.cache/thriftcli.
+
+    :returns: the path to the cache directory, which may not exist yet
+    :rtype: str
+
+    """
+    cache_dir = os.environ.get(CACHE_DIR_ENVIRONMENT_VARIABLE)
+    if cache_dir:
+        return cache_dir
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'thriftcli')
+
+
+def hash_include_graph(thrift_path, thrift_dir_paths, parse_cache=None):
+    """ Hashes the content of a thrift file and of every file it includes, directly or transitively.
+
+    :param thrift_path: the path to the thrift file
+    :type thrift_path: str
+    :param thrift_dir_paths: directories to search for included thrift files in
+    :type thrift_dir_paths: list of str
+    :param parse_cache: a ThriftParseCache to find the includes of unchanged files in, or None to parse every file
+    :type parse_cache: ThriftParseCache
+    :returns: a hex digest that changes whenever any file in the include graph does
+    :rtype: str
+
+    """
+    key = hashlib.sha1()
+    for file_digest in _get_file_digests(thrift_path, thrift_dir_paths, parse_cache):
+        key.update(file_digest)
+    return key.hexdigest()
+
+
+class ThriftCodegenCache(object):
+    """ Caches the python code generated by the thrift compiler.
+
+    Each entry is a directory of generated packages, named by a hash of the compiler version and the content of every
+    thrift file in the include graph. Entries are written to a staging directory and renamed into place, so concurrent
+    processes never observe a partially generated entry. When the cache grows past its size limit, the least recently
+    used entries are evicted.
+
+    """
+
+    GENERATOR = 'py'
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_CACHE_SIZE):
+        """
+        :param cache_dir: the directory to keep the cache in, defaults to get_cache_dir()
+        :type cache_dir: str
+        :param max_size: the number of bytes the cache may hold before entries are evicted
+        :type max_size: int
+
+        """
+        self._cache_dir = os.path.join(cache_dir or get_cache_dir(), 'gen-py')
+        self._max_size = max_size
+
+    def get_package_root(self, thrift_path, thrift_dir_paths, generate):
+        """ Returns the directory containing the packages generated for a thrift file, generating them on a miss.
+
+        :param thrift_path: the path to the thrift file being generated
+        :type thrift_path: str
+        :param thrift_dir_paths: directories to search for included thrift files in
+        :type thrift_dir_paths: list of str
+        :param generate: a callable that runs the thrift compiler, writing its output into the directory it is given
+        :type generate: callable
+        :returns: the directory to add to sys.path before importing the generated packages
+        :rtype: str
+
+        """
+        key = self._compute_key(thrift_path, thrift_dir_paths)
+        entry_path = os.path.join(self._cache_dir, key)
+        if os.path.isdir(entry_path):
+            os.utime(entry_path, None)
+            return entry_path
+        _make_dirs(self._cache_dir)
+        staging_path = tempfile.mkdtemp(prefix='.%s.' % key, dir=self._cache_dir)
+        try:
+            generate(staging_path)
+            try:
+                os.rename(staging_path, entry_path)
+            except OSError:
+                # Another process generated the same entry first
+                if not os.path.isdir(entry_path):
+                    raise
+        finally:
+            _remove_dir(staging_path)
+        self._evict(entry_path)
+        return entry_path
+
+    def _compute_key(self, thrift_path, thrift_dir_paths):
+        """ Hashes the compiler version together with every thrift file reachable from thrift_path.
+
+        :returns: a hex digest identifying the generated code
+        :rtype: str
+
+        """
+        key = hashlib.sha1(self._get_compiler_version())
+        key.update(self.GENERATOR)
+        for file_digest in _get_file_digests(thrift_path, thrift_dir_paths):
+            key.update(file_digest)
+        return key.hexdigest()
+
+    def _get_compiler_version(self):
+        """ Returns the version string of the thrift compiler on the PATH.
+
+        The version is remembered per compiler binary, so a cache hit does not need to run the compiler at all.
+
+        :rtype: str
+        :raises: ThriftCLIError
+
+        """
+        compiler_path = find_executable('thrift')
+        if compiler_path is None:
+            raise ThriftCLIError('Thrift compiler not found on the PATH')
+        compiler_path = os.path.realpath(compiler_path)
+        stat = os.stat(compiler_path)
+        stamp = [stat.st_size, stat.st_mtime]
+        versions_path = os.path.join(self._cache_dir, 'compilers.json')
+        try:
+            with open(versions_path, 'r') as versions_file:
+                versions = json.load(versions_file)
+        except (IOError, ValueError):
+            versions = {}
+        known = versions.get(compiler_path)
+        if known is not None and known[:2] == stamp:
+            return str(known[2])
+        version = subprocess.check_output([compiler_path, '--version']).strip()
+        versions[compiler_path] = stamp + [version]
+        _make_dirs(self._cache_dir)
+        _write_atomically(versions_path, json.dumps(versions))
+        return version
+
+    def _evict(self, kept_path):
+        """ Removes the least recently used entries until the cache fits within its size limit.
+
+        The entry at kept_path is about to be imported from, so it is never removed, even if it alone is over the limit.
+
+        :param kept_path: the path to the entry that was just generated
+        :type kept_path: str
+
+        """
+        entries = []
+        for name in os.listdir(self._cache_dir):
+            path = os.path.join(self._cache_dir, name)
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+            entries.append((os.path.getmtime(path), _get_dir_size(path), path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self._max_size:
+                break
+            if path == kept_path:
+                continue
+            _remove_dir(path)
+            total_size -= size
+
+
+def _get_file_digests(thrift_path, thrift_dir_paths, parse_cache=None):
+    """ Returns the sorted hashes of the name and content of each file in a thrift file's include graph. """
+    return sorted(hashlib.sha1('%s\0%s' % (os.path.basename(path), content)).hexdigest()
+                  for path, content in _load_include_graph(thrift_path, thrift_dir_paths, parse_cache))
+
+
+def _load_include_graph(thrift_path, thrift_dir_paths, parse_cache=None):
+    """ Returns the path and content of a thrift file and everything it includes, directly or transitively.
+
+    :rtype: list of (str, str)
+
+    """
+    loaded = []
+    visited = set([])
+    parsers = [ThriftParser(thrift_path, list(thrift_dir_paths), parse_cache)]
+    while parsers:
+        parser = parsers.pop()
+        if parser._thrift_path in visited:
+            continue
+        visited.add(parser._thrift_path)
+        loaded.append((parser._thrift_path, parser._thrift_content))
+        parsers.extend(ThriftParser(path, parser._thrift_dir_paths, parse_cache)
+                       for path in parser._get_dependency_paths() if path not in visited)
+    return loaded
+
+
+def _get_dir_size(path):
+    """ Returns the total size in bytes of the files under a directory. """
+    return sum(os.path.getsize(os.path.join(dir_path, file_name))
+               for dir_path, _, file_names in os.walk(path) for file_name in file_names)
+
+
+def _make_dirs(path):
+    """ Creates a directory and its parents, ignoring if it already exists. """
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+
+def _remove_dir(path):
+    """ Recursively removes a directory and ignores if it didn't exist. """
+    try:
+        shutil.rmtree(path)
+    except OSError:
+        pass
+
+
+def _write_atomically(path, content):
+    """ Writes a file through a temporary file in the same directory, so readers never see a partial write. """
+    file_descriptor, temp_path = tempfile.mkstemp(prefix='.', dir=os.path.dirname(path))
+    with os.fdopen(file_descriptor, 'wb') as temp_file:
+        temp_file.write(content)
+    os.rename(temp_path, path)
@@ -0,0 +1,344 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import SocketServer
+import argparse
+import errno
+import json
+import logging
+import os
+import socket
+import threading
+
+from thrift.transport import TTransport
+
+from .thrift_cli import ThriftCLI
+from .thrift_cli_error import ThriftCLIError
+from .thrift_codegen_cache import get_cache_dir, hash_include_graph
+from .thrift_json_writer import DEFAULT_JSON_INDENT
+from .thrift_parse_cache import ThriftParseCache
+from .thrift_protocols import FINAGLE_PROTOCOL, FRAMED_TRANSPORT
+from .thrift_zookeeper_resolver import ThriftServerSetCache, ThriftZookeeperResolver
+
+DAEMON_SOCKET_ENVIRONMENT_VARIABLE = 'THRIFT_CLI_DAEMON_SOCKET'
+# The options of a request that select which warm ThriftCLI runs it.
+CLI_KEY_OPTIONS = ['thrift_path', 'server_address', 'service_name', 'tls', 'tls_key_path', 'cert_verification_mode',
+                   'thrift_dir_paths', 'zookeeper', 'client_id', 'proxy', 'use_cache', 'in_memory', 'protocol',
+                   'transport']
+
+
+def get_daemon_socket_path():
+    """ Returns the path of the Unix domain socket the daemon listens on.
+
+    The path is $THRIFT_CLI_DAEMON_SOCKET if set, otherwise daemon.sock in the per-user cache directory.
+
+    :rtype: str
+
+    """
+    return os.environ.get(DAEMON_SOCKET_ENVIRONMENT_VARIABLE) or os.path.join(get_cache_dir(), 'daemon.sock')
+
+
+class ThriftDaemon(object):
+    """ Keeps ThriftCLI instances warm, and runs requests forwarded to it over a Unix domain socket.
+
+    A ThriftCLI is set up for the first request to each combination of thrift file, server, service, and connection
+    options, then reused for every request after it, so the imports, parsing, code generation, and connection are paid
+    once rather than by every request. Requests to different ThriftCLIs run at once, and requests to the same one take
+    turns on its connection. A request whose connection fails is retried once on a new ThriftCLI, since the server may
+    have closed the connection while it was idle. The server sets of requests with zookeeper are watched while the
+    daemon runs, so a new ThriftCLI connects to a current member without asking Zookeeper. Every request hashes the
+    thrift files its ThriftCLI was set up from, and a ThriftCLI whose thrift files changed is replaced by a new one.
+
+    Each request is a JSON object on a line of its own, answered by a JSON object on a line of its own:
+    - {"command": "run", "options": {...}} is answered by {"output": <printed result or null>}
+    - {"command": "stop"} stops the daemon, and is answered by {}
+    Any request that fails is answered by {"error": {"type": ..., "message": ...}}.
+
+    """
+
+    def __init__(self, socket_path=None):
+        """
+        :param socket_path: the path of the socket to listen on, defaults to get_daemon_socket_path()
+        :type socket_path: str
+
+        """
+        self._socket_path = socket_path or get_daemon_socket_path()
+        self._lock = threading.Lock()
+        # The lock and ThriftCLI of each combination of CLI_KEY_OPTIONS, as [lock, ThriftCLI or None, hash of the
+        # include graph the ThriftCLI was set up from]
+        self._entries = {}
+        # Kept in memory, so the includes of unchanged thrift files are found without parsing them for every request
+        self._parse_cache = ThriftParseCache()
+        self._server = None
+        self._ready = threading.Event()
+        # The resolver watching server sets for the ThriftCLIs that cache them on disk, and for those that don't
+        self._zookeeper_resolvers = {}
+
+    def serve_forever(self):
+        """ Listens on the socket and handles requests until the daemon is stopped.
+
+        :raises: ThriftCLIError if another daemon is already listening on the socket
+
+        """
+        socket_dir = os.path.dirname(self._socket_path)
+        if socket_dir and not os.path.isdir(socket_dir):
+            os.makedirs(socket_dir)
+        if os.path.exists(self._socket_path):
+            try:
+                ThriftDaemonClient(self._socket_path).request({'command': 'ping'})
+            except ThriftCLIError:
+                # The socket was left behind by a daemon that did not exit cleanly
+                os.remove(self._socket_path)
+            else:
+                raise ThriftCLIError('A thriftcli daemon is already listening on %s' % self._socket_path)
+        # Only the user running the daemon may connect to it, since requests run with their credentials
+        previous_umask = os.umask(0o077)
+        try:
+            self._server = _DaemonServer(self._socket_path, _DaemonRequestHandler)
+        finally:
+            os.umask(previous_umask)
+        self._server.daemon = self
+        logging.info('Listening on %s', self._socket_path)
+        self._ready.set()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            os.remove(self._socket_path)
+            self.close()
+
+    def wait_until_ready(self, timeout=None):
+        """ Waits until the daemon listens on its socket, when serve_forever runs on another thread.
+
+        :returns: whether the daemon is listening
+        :rtype: bool
+
+        """
+        return self._ready.wait(timeout)
+
+    def stop(self):
+        """ Makes serve_forever return, from another thread. """
+        self._server.shutdown()
+
+    def handle(self, request):
+        """ Returns the response to a request.
+
+        :param request: the request sent to the daemon
+        :type request: dict
+        :rtype: dict
+
+        """
+        try:
+            command = request.get('command')
+            if command == 'run':
+                return {'output': self.run(request['options'])}
+            if command == 'stop':
+                threading.Thread(target=self.stop).start()
+                return {}
+            if command == 'ping':
+                return {}
+            raise ThriftCLIError('Unknown daemon command: \'%s\'' % command)
+        except Exception as e:
+            logging.debug('Request failed', exc_info=True)
+            return {'error': {'type': type(e).__name__, 'message': str(e)}}
+
+    def run(self, options):
+        """ Runs a request on the warm ThriftCLI for its options, setting one up if there is none.
+
+        :param options: the ThriftCLI options along with method_name, request_body, and return_json
+        :type options: dict
+        :returns: the printed result of the request, or None if it returned nothing
+        :rtype: str
+
+        """
+        key = tuple(json.dumps(options.get(name), sort_keys=True) for name in CLI_KEY_OPTIONS)
+        with self._lock:
+            entry = self._entries.setdefault(key, [threading.Lock(), None, None])
+        with entry[0]:
+            parse_cache = self._parse_cache if options['use_cache'] else None
+            include_graph_hash = hash_include_graph(options['thrift_path'], options['thrift_dir_paths'], parse_cache)
+            if entry[1] is not None and entry[2] != include_graph_hash:
+                logging.info('Reloading %s, which changed', options['thrift_path'])
+                _cleanup_cli(entry[1])
+                entry[1] = None
+            if entry[1] is None:
+                entry[1] = _make_cli(options, self._get_zookeeper_resolver(options['use_cache']))
+                entry[2] = include_graph_hash
+            try:
+                result = _run_request(entry[1], options)
+            except TTransport.TTransportException:
+                logging.info('Reconnecting to %s', options['server_address'])
+                _cleanup_cli(entry[1])
+                # Left unset if a new ThriftCLI cannot be set up, so the next request tries again
+                entry[1] = None
+                entry[1] = _make_cli(options, self._get_zookeeper_resolver(options['use_cache']))
+                result = _run_request(entry[1], options)
+        if result is None:
+            return None
+        return result if isinstance(result, unicode) else str(result)
+
+    def close(self):
+        """ Cleans up every warm ThriftCLI, and stops watching server sets. """
+        with self._lock:
+            entries, self._entries = self._entries.values(), {}
+            zookeeper_resolvers, self._zookeeper_resolvers = self._zookeeper_resolvers.values(), {}
+        for _, cli, _ in entries:
+            if cli is not None:
+                _cleanup_cli(cli)
+        for zookeeper_resolver in zookeeper_resolvers:
+            zookeeper_resolver.close()
+
+    def _get_zookeeper_resolver(self, use_cache):
+        """ Returns the resolver that watches server sets for ThriftCLIs, caching them on disk only with use_cache.
+
+        :param use_cache: whether the server sets may be read from and written to the on-disk cache
+        :type use_cache: bool
+        :rtype: ThriftZookeeperResolver
+
+        """
+        use_cache = bool(use_cache)
+        with self._lock:
+            if use_cache not in self._zookeeper_resolvers:
+                self._zookeeper_resolvers[use_cache] = ThriftZookeeperResolver(
+                    ThriftServerSetCache() if use_cache else None, watch=True)
+            return self._zookeeper_resolvers[use_cache]
+
+
+class ThriftDaemonClient(object):
+    """ Forwards requests to a ThriftDaemon over its Unix domain socket. """
+
+    def __init__(self, socket_path=None):
+        """
+        :param socket_path: the path of the daemon's socket, defaults to get_daemon_socket_path()
+        :type socket_path: str
+
+        """
+        self._socket_path = socket_path or get_daemon_socket_path()
+
+    def run(self, options):
+        """ Runs a request on the daemon, and returns its printed result.
+
+        :param options: the ThriftCLI options along with method_name, request_body, and return_json
+        :type options: dict
+        :returns: the printed result of the request, or None if it returned nothing
+        :rtype: str
+        :raises: ThriftCLIError if the request failed
+
+        """
+        response = self.request({'command': 'run', 'options': options})
+        if 'error' in response:
+            raise ThriftCLIError('%s: %s' % (response['error']['type'], response['error']['message']))
+        return response['output']
+
+    def stop(self):
+        """ Stops the daemon. """
+        self.request({'command': 'stop'})
+
+    def request(self, request):
+        """ Sends a request to the daemon and returns its response.
+
+        :param request: the request to send
+        :type request: dict
+        :rtype: dict
+        :raises: ThriftCLIError if no daemon is listening on the socket
+
+        """
+        client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            try:
+                client_socket.connect(self._socket_path)
+            except socket.error as e:
+                if e.errno not in (errno.ENOENT, errno.ECONNREFUSED):
+                    raise
+                raise ThriftCLIError('No thriftcli daemon is listening on %s, start one with: thriftcli daemon' %
+                                     self._socket_path)
+            client_socket.sendall(json.dumps(request) + '\n')
+            return json.loads(client_socket.makefile('rb').readline())
+        finally:
+            client_socket.close()
+
+
+class _DaemonServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+class _DaemonRequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response = {'error': {'type': 'ValueError', 'message': str(e)}}
+        else:
+            response = self.server.daemon.handle(request)
+        self.wfile.write(json.dumps(response) + '\n')
+
+
+def _make_cli(options, zookeeper_resolver):
+    return ThriftCLI(options['thrift_path'], options['server_address'], options['service_name'], options['tls'],
+                     options['tls_key_path'], options['cert_verification_mode'], options['thrift_dir_paths'],
+                     options['zookeeper'], client_id=options['client_id'], proxy=options['proxy'],
+                     use_cache=options['use_cache'], in_memory=options['in_memory'],
+                     zookeeper_resolver=zookeeper_resolver,
+                     protocol=options.get('protocol', FINAGLE_PROTOCOL),
+                     transport=options.get('transport', FRAMED_TRANSPORT))
+
+
+def _run_request(cli, options):
+    return cli.run(options['method_name'], options['request_body'], options['return_json'],
+                   json_indent=options.get('json_indent', DEFAULT_JSON_INDENT),
+                   sort_keys=options.get('sort_keys', True))
+
+
+def _cleanup_cli(cli):
+    try:
+        cli.cleanup()
+    except Exception:
+        logging.debug('Failed to clean up a ThriftCLI', exc_info=True)
+
+
+def _make_daemon_parser():
+    """ Initializes the ArgumentParser for the daemon subcommand.
+
+    :returns: an ArgumentParser object configured for thriftcli daemon
+    :rtype: ArgumentParser
+
+    """
+    parser = argparse.ArgumentParser(prog='thriftcli daemon',
+                                     description='Keep thriftcli clients warm for requests made with --daemon.')
+    parser.add_argument('--socket', type=str, default=None,
+                        help='path of the Unix domain socket to listen on (default: $%s, or daemon.sock in the '
+                             'cache directory)' % DAEMON_SOCKET_ENVIRONMENT_VARIABLE)
+    parser.add_argument('--stop', action='store_true',
+                        help='stop the daemon listening on the socket')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='provide detailed logging')
+    return parser
+
+
+def run_daemon(argv):
+    """ Runs the daemon subcommand, serving requests until stopped, or stopping a running daemon with --stop.
+
+    :param argv: the arguments following 'daemon' on the command line
+    :type argv: list of str
+
+    """
+    args = _make_daemon_parser().parse_args(argv)
+    logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.DEBUG if args.verbose else logging.INFO)
+    if args.stop:
+        ThriftDaemonClient(args.socket).stop()
+        return
+    daemon = ThriftDaemon(args.socket)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
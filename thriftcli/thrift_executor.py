@@ -10,22 +10,25 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import Queue
 import importlib
+import itertools
 import os
 import shutil
 import ssl
 import subprocess
 import sys
+import threading
 import urlparse
 
-from thrift.transport import TSSLSocket
 from thrift.transport import TSocket
 from thrift.transport import TTransport
-from twitter.common.rpc.finagle.protocol import TFinagleProtocol
 
-from tls_transport import TProxySSLSocket
 from .thrift_cli_error import ThriftCLIError
-from .transport import TProxySocket
+from .thrift_protocols import FINAGLE_PROTOCOL, FRAMED_TRANSPORT, make_protocol, wrap_transport
+from .thrift_proxy_tunneler import ThriftProxyTunneler
+from .thrift_tls import get_tls_context
+from .thrift_type_builder import ThriftTypeBuilder
 
 
 class ThriftExecutor(object):
@@ -34,7 +37,9 @@ class ThriftExecutor(object):
     def __init__(self, thrift_path, server_address, service_reference, basename_to_namespaces,
                  tls=False, tls_key_path=None, cert_verification_mode=None,
                  thrift_dir_paths=None,
-                 client_id=None, proxy=None):
+                 client_id=None, proxy=None, codegen_cache=None, parse_result=None, connections=1,
+                 nonblocking=False, pipeline=1, load_balancer=None, protocol=FINAGLE_PROTOCOL,
+                 transport=FRAMED_TRANSPORT):
         """ Opens a connection with the server and generates then imports the thrift-defined python code.
 
         :param thrift_path: the path to the Thrift file defining the service being requested
@@ -43,6 +48,19 @@ class ThriftExecutor(object):
         :param thrift_dir_paths: a list of paths to directories containing Thrift file dependencies
         :param client_id: Finagle client id for identifying requests
         :param proxy: [<proxy host>:<proxy port>] to route request through
+        :param codegen_cache: a ThriftCodegenCache to reuse generated code from, or None to generate into ./gen-py
+        :param parse_result: if given, the ThriftParseResult to build python types from in memory instead of running
+            the thrift compiler
+        :param connections: the number of connections to open, so that as many requests can run at once from
+            different threads, or from run_async when nonblocking
+        :param nonblocking: whether to run requests from run_async on non-blocking connections instead of opening a
+            pool of connections for threads
+        :param pipeline: the number of calls from run_async to have in flight on each connection at once
+        :param load_balancer: if given, the ThriftLoadBalancer to spread requests over the members of a server set
+            with, instead of sending them all to the server address
+        :param protocol: the protocol to encode requests with, one of PROTOCOLS
+        :param transport: the transport to frame or buffer requests with, one of TRANSPORTS, which must be framed
+            for run_async
         """
         self._thrift_path = thrift_path
         self._server_address = server_address
@@ -55,15 +73,55 @@ class ThriftExecutor(object):
         self._client_id = client_id
         self._service_reference = service_reference
         self._proxy = proxy
+        # Shares the proxy's auth header between connections, and times the tunnels opened through it
+        self._proxy_tunneler = None
+        if proxy:
+            proxy_host, proxy_port = proxy.split(':')
+            self._proxy_tunneler = ThriftProxyTunneler(proxy_host, proxy_port)
         self._tls = tls
         self._tls_key_path = tls_key_path
         self.cert_verification_mode = cert_verification_mode
-        self._open_connection(server_address)
-        self._generate_and_import_packages(basename_to_namespaces)
+        # Shared by every connection, so the key file is loaded and handshakes are counted in one place
+        self._tls_context = None
+        if tls:
+            if proxy:
+                # Connections through a proxy present the key file over TLS 1.2 without verifying the server
+                self._tls_context = get_tls_context(tls_key_path, ssl.CERT_NONE, ssl.PROTOCOL_TLSv1_2)
+            else:
+                self._tls_context = get_tls_context(tls_key_path, self._get_verifier_type(cert_verification_mode))
+        self._codegen_cache = codegen_cache
+        self._load_balancer = load_balancer
+        self._protocol_name = protocol
+        self._transport_name = transport
+        self._connections = connections
+        self._pipeline = pipeline
+        self._reactor = None
+        self._idle_connections = None
+        # The idle connections to each member of the load balancer, opened as requests are sent to the member
+        self._member_connections = None
+        if load_balancer is not None:
+            self._transport = self._protocol = None
+            self._member_connections = dict((address, Queue.Queue()) for address in load_balancer.addresses)
+        else:
+            self._open_connection(server_address)
+        if connections > 1 and not nonblocking and load_balancer is None:
+            self._idle_connections = Queue.Queue()
+            self._idle_connections.put((self._transport, self._protocol))
+            for connection in self._connect_all(server_address, connections - 1):
+                self._idle_connections.put(connection)
+        if parse_result is not None:
+            ThriftTypeBuilder(parse_result).build()
+        else:
+            self._generate_and_import_packages(basename_to_namespaces)
 
     def run(self, method_name, request_args):
         """ Executes a method on the connected server and returns its result.
 
+        With more than one connection, the method runs on the first idle connection, waiting for one if they are all
+        busy. A connection that fails in the middle of a request is closed and replaced by the next request to use it.
+        With a load balancer, the method runs on an idle connection to the member it picks, opening one if there is
+        none.
+
         :param method_name: the name of the method to call
         :type method_name: str
         :param request_args: keyword arguments to pass into method call, acting as a request body
@@ -71,8 +129,82 @@ class ThriftExecutor(object):
         :return: the result of the method call
 
         """
-        method = self._get_method(method_name)
-        return method(**request_args)
+        if self._member_connections is not None:
+            return self._run_balanced(method_name, request_args)
+        if self._idle_connections is None:
+            method = self._get_method(method_name)
+            return method(**request_args)
+        connection = self._idle_connections.get()
+        try:
+            if connection is None:
+                connection = self._connect(self._server_address)
+            method = self._get_method(method_name, connection[1])
+            return method(**request_args)
+        except TTransport.TTransportException:
+            if connection is not None:
+                connection[0].close()
+                connection = None
+            raise
+        finally:
+            self._idle_connections.put(connection)
+
+    def run_async(self, method_name, request_args):
+        """ Submits a method call to run on non-blocking connections, and returns its future result.
+
+        The connections are opened as calls are submitted, up to the number of connections the executor was created
+        with, and each has up to the pipeline's number of calls in flight. Calls only make progress while a future's
+        result is being waited on.
+
+        :param method_name: the name of the method to call
+        :type method_name: str
+        :param request_args: keyword arguments to pass into method call, acting as a request body
+        :type request_args: dict
+        :return: the future result of the method call
+        :rtype: ThriftFuture
+
+        """
+        if self._reactor is None:
+            from .thrift_reactor import ThriftReactor
+            if self._transport_name != FRAMED_TRANSPORT:
+                raise ThriftCLIError('Non-blocking connections need the %s transport, not %s' %
+                                     (FRAMED_TRANSPORT, self._transport_name))
+            (host, port) = self._parse_address_for_hostname_and_port(self._server_address)
+            self._reactor = ThriftReactor(host, port, self._service_reference, self._connections, self._client_id,
+                                          self._proxy, self._tls_context, self._pipeline, self._load_balancer,
+                                          self._proxy_tunneler, self._protocol_name)
+        return self._reactor.submit(method_name, request_args)
+
+    def reconnect(self, server_address=None):
+        """ Closes the connection that run uses and opens a new one.
+
+        With more than one connection, failed connections are already replaced by the next request to use them, so
+        only the single connection is reopened.
+
+        :param server_address: the address to open this and later blocking connections to, defaults to the current one
+        :type server_address: str
+
+        """
+        if server_address is not None:
+            self._server_address = server_address
+        if self._idle_connections is None and self._member_connections is None:
+            self._transport.close()
+            self._open_connection(self._server_address)
+
+    def get_tls_summary(self):
+        """ Returns how many TLS handshakes were done, or None without TLS.
+
+        :rtype: dict
+
+        """
+        return self._tls_context.summarize() if self._tls_context is not None else None
+
+    def get_tunnel_summary(self):
+        """ Returns how many tunnels were opened through the proxy and how long they took, or None without a proxy.
+
+        :rtype: dict
+
+        """
+        return self._proxy_tunneler.summarize() if self._proxy_tunneler is not None else None
 
     def cleanup(self, remove_generated_src=False):
         """ Deletes the gen-py code and closes the transport with the server.
@@ -82,7 +214,18 @@ class ThriftExecutor(object):
         """
         if remove_generated_src:
             self._remove_dir('gen-py')
-        if self._transport:
+        if self._reactor is not None:
+            self._reactor.close()
+        if self._idle_connections is not None:
+            while not self._idle_connections.empty():
+                connection = self._idle_connections.get_nowait()
+                if connection is not None:
+                    connection[0].close()
+        elif self._member_connections is not None:
+            for idle_connections in self._member_connections.values():
+                while not idle_connections.empty():
+                    idle_connections.get_nowait()[0].close()
+        elif self._transport:
             self._transport.close()
 
     @staticmethod
@@ -101,30 +244,81 @@ class ThriftExecutor(object):
         """ Generates and imports the python modules defined by the thrift code.
 
         This method does the following:
-        1. Runs a shell process to generate the python code from the Thrift file
+        1. Runs a shell process to generate the python code from the Thrift file, unless it is already cached
         2. Adds the generated source to the python process' path
         3. Imports the generated source package into this python process
 
+        """
+        if self._codegen_cache is not None:
+            package_root = self._codegen_cache.get_package_root(self._thrift_path, sorted(self._thrift_dir_paths),
+                                                                self._generate_packages)
+        else:
+            package_root = 'gen-py'
+            self._generate_packages()
+        # Searched first, so a package regenerated for a changed thrift file shadows any older version on the path
+        if package_root in sys.path:
+            sys.path.remove(package_root)
+        sys.path.insert(0, package_root)
+        for basename, package in basename_to_namespaces.items():
+            self._import_package(basename, package)
+
+    def _generate_packages(self, out_dir=None):
+        """ Runs the thrift compiler to generate python code for the Thrift file.
+
+        :param out_dir: the directory to write the generated packages to, or None to write them to ./gen-py
+
         """
         thrift_dir_options = ''.join([' -I %s' % thrift_dir_path for thrift_dir_path in self._thrift_dir_paths])
-        command = 'thrift -r%s --gen py %s' % (thrift_dir_options, self._thrift_path)
+        out_option = ' -out %s' % out_dir if out_dir is not None else ''
+        command = 'thrift -r%s --gen py%s %s' % (thrift_dir_options, out_option, self._thrift_path)
         if subprocess.call(command, shell=True) != 0:
             raise ThriftCLIError('Thrift generation command failed: \'%s\'' % command)
-        sys.path.append('gen-py')
-        for basename, package in basename_to_namespaces.items():
-            self._import_package(basename, package)
 
-    def _get_method(self, method_name):
+    def _run_balanced(self, method_name, request_args):
+        """ Runs a method on a connection to the member the load balancer picks.
+
+        A member that fails to connect is ejected from the balancing, and the method is run on another member instead,
+        until every member was tried.
+
+        """
+        for attempt in itertools.count(1):
+            address = self._load_balancer.acquire()
+            connection = None
+            try:
+                try:
+                    connection = self._member_connections[address].get_nowait()
+                except Queue.Empty:
+                    try:
+                        connection = self._connect(address)
+                    except TTransport.TTransportException:
+                        self._load_balancer.eject(address)
+                        if attempt < len(self._load_balancer.addresses):
+                            continue
+                        raise
+                method = self._get_method(method_name, connection[1])
+                return method(**request_args)
+            except TTransport.TTransportException:
+                if connection is not None:
+                    connection[0].close()
+                    connection = None
+                raise
+            finally:
+                self._load_balancer.release(address)
+                if connection is not None:
+                    self._member_connections[address].put(connection)
+
+    def _get_method(self, method_name, protocol=None):
         """ Returns the python method generated for the given endpoint.
 
         :param method_name: the name of the method to retrieve
+        :param protocol: the protocol of the connection to call the method on, defaults to the first connection
         :returns: the python method that can be called to execute the Thrift RPC
         :rtype: method
 
         """
         class_name = 'Client'
         client_constructor = getattr(sys.modules[self._service_reference], class_name)
-        client = client_constructor(self._protocol)
+        client = client_constructor(protocol if protocol is not None else self._protocol)
         try:
             method = getattr(client, method_name)
         except AttributeError:
@@ -137,28 +331,80 @@ class ThriftExecutor(object):
         :param address: the address of the server to connect to
 
         """
+        self._transport, self._protocol = self._connect(address)
+
+    def _connect_all(self, address, count):
+        """ Opens connections with a server address, all at once when they are tunneled through a proxy.
+
+        A tunnel takes round trips to the proxy and through it to the server before the connection is open, so opening
+        a pool of them one after another would take as many times as long.
+
+        :param address: the address of the server to connect to
+        :param count: the number of connections to open
+        :returns: the open transports and the protocols to make requests with
+        :rtype: list of tuple of (TTransport, TProtocol)
+
+        """
+        if not self._proxy or count < 2:
+            return [self._connect(address) for _ in range(count)]
+        # Each slot holds the connection opened by its thread, or the exception it failed with
+        results = [None] * count
+
+        def connect(index):
+            try:
+                results[index] = self._connect(address)
+            except Exception as e:
+                results[index] = e
+
+        threads = [threading.Thread(target=connect, args=(index,)) for index in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            for result in results:
+                if not isinstance(result, Exception):
+                    result[0].close()
+            raise errors[0]
+        return results
+
+    def _connect(self, address):
+        """ Opens a new connection with a server address.
+
+        :param address: the address of the server to connect to
+        :returns: the open transport and the protocol to make requests with
+        :rtype: tuple of (TTransport, TProtocol)
+
+        """
+        # The transports for TLS and proxies are imported on first use to keep startup fast
         (url, port) = self._parse_address_for_hostname_and_port(address)
+        tls_socket = None
         if self._tls:
-            verifier_type = self._get_verifier_type(self.cert_verification_mode)
             if self._proxy:
+                from .tls_transport import TProxySSLSocket
                 proxy_host, proxy_port = self._proxy.split(":")
-                self._transport = TProxySSLSocket(url, port, proxy_host, proxy_port, verifier_type, ca_certs=self._tls_key_path)
+                transport = TProxySSLSocket(url, port, proxy_host, proxy_port,
+                                            ca_certs=self._tls_key_path, tunneler=self._proxy_tunneler,
+                                            tls_context=self._tls_context)
             else:
-                ssl_context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
-                if self._tls_key_path is not None:
-                    ssl_context.load_cert_chain(self._tls_key_path, self._tls_key_path)
-                ssl_context.verify_mode = verifier_type
-                self._transport = TSSLSocket.TSSLSocket(url, port, ca_certs=self._tls_key_path,
-                                                        validate_callback=lambda cert, hostname: None)  # disabling hostname validation
+                from thrift.transport import TSSLSocket
+                tls_socket = transport = TSSLSocket.TSSLSocket(url, port, ssl_context=self._tls_context.ssl_context,
+                                                               server_hostname=url,
+                                                               validate_callback=lambda cert, hostname: None)  # disabling hostname validation
         else:
             if self._proxy:
+                from .transport import TProxySocket
                 proxy_host, proxy_port = self._proxy.split(":")
-                self._transport = TProxySocket(proxy_host, proxy_port, url, port)
+                transport = TProxySocket(proxy_host, proxy_port, url, port, tunneler=self._proxy_tunneler)
             else:
-                self._transport = TSocket.TSocket(url, port)
-        self._transport = TTransport.TFramedTransport(self._transport)
-        self._transport.open()
-        self._protocol = TFinagleProtocol(self._transport, client_id=self._client_id)
+                transport = TSocket.TSocket(url, port)
+        transport = wrap_transport(transport, self._transport_name, self._protocol_name)
+        transport.open()
+        if tls_socket is not None:
+            # TSSLSocket does its own wrapping, so its handshake is counted once the socket is open
+            self._tls_context.record_handshake()
+        return transport, make_protocol(transport, self._protocol_name, self._client_id)
 
     @staticmethod
     def _parse_address_for_hostname_and_port(address):
@@ -181,6 +427,10 @@ class ThriftExecutor(object):
         :param package_name: the name of the package to import, which must be located somewhere on sys.path
 
         """
+        # A long-running process, such as the daemon, may still hold modules imported from an older version
+        for module_name in [module_name for module_name in sys.modules
+                            if module_name == package_name or module_name.startswith(package_name + '.')]:
+            del sys.modules[module_name]
         package = importlib.import_module(package_name)
         for module in package.__all__:
             sub_module_name = '.'.join([basename, module])
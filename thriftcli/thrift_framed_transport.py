@@ -0,0 +1,120 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import cStringIO
+import errno
+import socket
+import struct
+import sys
+
+from thrift.transport import TTransport
+
+# The number of bytes each buffer starts with, grown to fit the largest frame seen.
+INITIAL_BUFFER_SIZE = 64 * 1024
+
+
+class TZeroCopyFramedTransport(TTransport.TFramedTransport):
+    """ Drop-in replacement for TFramedTransport that reuses its buffers instead of copying frames.
+
+    TFramedTransport reads a frame by joining the chunks the socket returns into a new string, then copies it again into
+    the buffer the protocol reads from, and writes a frame by copying the buffered request out and again to prefix its
+    length. For responses of several megabytes, every copy is a new allocation of the whole frame.
+
+    Here each frame is received straight into a bytearray that is kept for the next frame, with socket.recv_into, and
+    the protocol reads from a view of it. Requests are written into another kept bytearray after room for the length,
+    which is filled in place before the frame is sent from a memoryview of it. Transports without a socket, such as
+    memory buffers, are read and written through their own methods.
+
+    """
+
+    def __init__(self, trans):
+        TTransport.TFramedTransport.__init__(self, trans)
+        self._trans = trans
+        self._read_buffer = bytearray(INITIAL_BUFFER_SIZE)
+        self._read_frame = cStringIO.StringIO('')
+        self._length_buffer = bytearray(4)
+        # The frame being written, with its first 4 bytes left for the length
+        self._write_buffer = bytearray(INITIAL_BUFFER_SIZE)
+        self._write_end = 4
+
+    def read(self, sz):
+        ret = self._read_frame.read(sz)
+        if len(ret) != 0:
+            return ret
+        self.readFrame()
+        return self._read_frame.read(sz)
+
+    def readFrame(self):
+        self._receive_into(memoryview(self._length_buffer))
+        size, = struct.unpack_from('!i', self._length_buffer)
+        if size < 0:
+            raise TTransport.TTransportException(type=TTransport.TTransportException.NEGATIVE_SIZE,
+                                                 message='Invalid frame size: %d' % size)
+        if size > len(self._read_buffer):
+            # A new buffer rather than a resized one, since the frame being replaced may still be viewed by a protocol
+            self._read_buffer = bytearray(max(size, 2 * len(self._read_buffer)))
+        self._receive_into(memoryview(self._read_buffer)[:size])
+        self._read_frame = cStringIO.StringIO(buffer(self._read_buffer, 0, size))
+
+    def write(self, buf):
+        end = self._write_end + len(buf)
+        if end > len(self._write_buffer):
+            self._write_buffer.extend(bytearray(max(end, 2 * len(self._write_buffer)) - len(self._write_buffer)))
+        self._write_buffer[self._write_end:end] = buf
+        self._write_end = end
+
+    def flush(self):
+        end, self._write_end = self._write_end, 4
+        struct.pack_into('!i', self._write_buffer, 0, end - 4)
+        frame = memoryview(self._write_buffer)[:end]
+        handle = getattr(self._trans, 'handle', None)
+        if handle is not None:
+            handle.sendall(frame)
+        else:
+            self._trans.write(frame.tobytes())
+        self._trans.flush()
+
+    @property
+    def cstringio_buf(self):
+        return self._read_frame
+
+    def cstringio_refill(self, prefix, reqlen):
+        # As in TFramedTransport, the current frame was read to its end before the accelerated protocol asks for more
+        while len(prefix) < reqlen:
+            self.readFrame()
+            prefix += self._read_frame.getvalue()
+        self._read_frame = cStringIO.StringIO(prefix)
+        return self._read_frame
+
+    def _receive_into(self, view):
+        """ Fills a view of a buffer from the socket, or from the wrapped transport if it has no socket. """
+        handle = getattr(self._trans, 'handle', None)
+        received = 0
+        while received < len(view):
+            if handle is not None:
+                try:
+                    size = handle.recv_into(view[received:])
+                except socket.error as e:
+                    # As in TSocket.read, since freebsd and darwin fail with ECONNRESET once the server shuts down
+                    if e.args[0] != errno.ECONNRESET or not (sys.platform == 'darwin' or
+                                                             sys.platform.startswith('freebsd')):
+                        raise
+                    self._trans.close()
+                    size = 0
+            else:
+                chunk = self._trans.read(len(view) - received)
+                size = len(chunk)
+                view[received:received + size] = chunk
+            if size == 0:
+                raise TTransport.TTransportException(type=TTransport.TTransportException.END_OF_FILE,
+                                                     message='TSocket read 0 bytes')
+            received += size
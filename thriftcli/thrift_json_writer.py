@@ -0,0 +1,246 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import cStringIO
+import itertools
+import json
+import operator
+from json import encoder
+
+from thrift.Thrift import TType
+
+# The number of spaces results are indented by, unless another indent is given.
+DEFAULT_JSON_INDENT = 4
+# The number of bytes of JSON collected before they are written to the output.
+WRITE_SIZE = 64 * 1024
+# On one line and unsorted, the depth from which each value is encoded whole by json's C encoder.
+C_ENCODER_LEVEL = 2
+# On one line and unsorted, the number of elements of a list encoded by json's C encoder at a time.
+C_ENCODER_BATCH_SIZE = 1000
+
+_SCALAR_TYPES = frozenset([TType.BOOL, TType.BYTE, TType.I16, TType.I32, TType.I64, TType.DOUBLE, TType.STRING])
+
+
+def dump_json(obj, indent=None, sort_keys=False):
+    """ Returns the JSON of a result, as written by ThriftJSONWriter.
+
+    :param obj: the result to encode, such as a thrift struct
+    :type obj: object
+    :param indent: the number of spaces to indent nested values by, or None to write the JSON on one line
+    :type indent: int
+    :param sort_keys: whether to write the fields of structs and the keys of maps in sorted order
+    :type sort_keys: bool
+    :rtype: str
+
+    """
+    output = cStringIO.StringIO()
+    ThriftJSONWriter(output, indent, sort_keys).write(obj)
+    return output.getvalue()
+
+
+class ThriftJSONWriter(object):
+    """ Writes results as JSON to a file as they are encoded, rather than building the whole string first.
+
+    Structs are walked through their thrift_spec, so their fields are written in declaration order without copying
+    each struct into a dict. Sets are written as lists, and any other object as its __dict__. With an indent and sorted
+    keys, the JSON is the same as json.dumps with indent and sort_keys writes, and is written as it is encoded.
+
+    json only encodes in C on one line with unsorted keys. Then only the result and its fields are walked, the elements
+    of lists are encoded in C a batch at a time, and any value deeper than that is encoded whole in C, with the fields
+    of its structs in no particular order. Fields other than lists whose thrift_spec holds no structs or sets, such as a
+    map of weights, are encoded whole in C too. Lists are always written a batch at a time, so a list of millions of
+    ids is never held as one string.
+
+    """
+
+    def __init__(self, output, indent=None, sort_keys=False):
+        """
+        :param output: the file to write the JSON to
+        :type output: file
+        :param indent: the number of spaces to indent nested values by, or None to write the JSON on one line
+        :type indent: int
+        :param sort_keys: whether to write the fields of structs and the keys of maps in sorted order
+        :type sort_keys: bool
+
+        """
+        self._output = output
+        self._indent = indent
+        self._sort_keys = sort_keys
+        self._key_separator = ': ' if indent is not None else ':'
+        self._c_encoder = None
+        if indent is None and not sort_keys:
+            self._c_encoder = json.JSONEncoder(separators=(',', ':'), default=_to_json_object)
+        # The field names of each struct class, and whether each holds only plain JSON values
+        self._struct_fields = {}
+        self._chunks = []
+        self._size = 0
+
+    def write(self, obj):
+        """ Writes the JSON of an object to the output.
+
+        :param obj: the result to encode, such as a thrift struct
+        :type obj: object
+        :raises: TypeError if the object holds a value that cannot be encoded
+
+        """
+        try:
+            self._write_value(obj, 0)
+        finally:
+            self._flush()
+
+    def _write_value(self, obj, level):
+        if isinstance(obj, basestring):
+            self._emit(encoder.encode_basestring_ascii(obj))
+        elif obj is None:
+            self._emit('null')
+        elif obj is True:
+            self._emit('true')
+        elif obj is False:
+            self._emit('false')
+        elif isinstance(obj, (int, long)):
+            self._emit(str(obj))
+        elif isinstance(obj, float):
+            self._emit(_float_to_json(obj))
+        elif self._c_encoder is not None and level >= C_ENCODER_LEVEL:
+            self._emit(self._c_encoder.encode(obj))
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            self._write_list(obj, level)
+        elif isinstance(obj, dict):
+            self._write_members([(key, value, False) for key, value in obj.iteritems()], level)
+        elif hasattr(obj, 'thrift_spec'):
+            fields = self._get_struct_fields(obj)
+            self._write_members([(name, getattr(obj, name), plain) for name, plain in fields], level)
+        else:
+            self._write_members([(key, value, False) for key, value in obj.__dict__.iteritems()], level)
+
+    def _write_list(self, items, level):
+        if not items:
+            self._emit('[]')
+            return
+        if self._c_encoder is not None:
+            self._write_list_in_batches(items)
+            return
+        newline = self._get_newline(level + 1)
+        self._emit('[' + newline)
+        first = True
+        for item in items:
+            if not first:
+                self._emit(',' + newline)
+            first = False
+            self._write_value(item, level + 1)
+        self._emit(self._get_newline(level) + ']')
+
+    def _write_list_in_batches(self, items):
+        """ Writes a list on one line by encoding batches of its elements in C, and dropping each batch's brackets. """
+        self._emit('[')
+        items = iter(items)
+        batch = list(itertools.islice(items, C_ENCODER_BATCH_SIZE))
+        while batch:
+            self._emit(self._c_encoder.encode(batch)[1:-1])
+            batch = list(itertools.islice(items, C_ENCODER_BATCH_SIZE))
+            if batch:
+                self._emit(',')
+        self._emit(']')
+
+    def _write_members(self, members, level):
+        """ Writes a JSON object from a list of (key, value, plain) members. """
+        if not members:
+            self._emit('{}')
+            return
+        if self._sort_keys:
+            members.sort(key=operator.itemgetter(0))
+        newline = self._get_newline(level + 1)
+        self._emit('{' + newline)
+        for index, (key, value, plain) in enumerate(members):
+            if index:
+                self._emit(',' + newline)
+            self._emit(encoder.encode_basestring_ascii(_key_to_json(key)) + self._key_separator)
+            if plain and self._c_encoder is not None:
+                self._emit(self._c_encoder.encode(value))
+            else:
+                self._write_value(value, level + 1)
+        self._emit(self._get_newline(level) + '}')
+
+    def _get_struct_fields(self, struct):
+        """ Returns the name of each field of a struct, and whether its value can be encoded whole in C.
+
+        That is whether the value holds only plain JSON values and is not a list, which is written in batches instead.
+
+        """
+        struct_class = type(struct)
+        if struct_class not in self._struct_fields:
+            self._struct_fields[struct_class] = [
+                (field_spec[2], field_spec[1] != TType.LIST and _is_plain(field_spec[1], field_spec[3]))
+                for field_spec in struct.thrift_spec if field_spec is not None]
+        return self._struct_fields[struct_class]
+
+    def _get_newline(self, level):
+        if self._indent is None:
+            return ''
+        return '\n' + ' ' * (self._indent * level)
+
+    def _emit(self, chunk):
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+        if self._size >= WRITE_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self._chunks:
+            self._output.write(''.join(self._chunks))
+            self._chunks = []
+            self._size = 0
+
+
+def _is_plain(ttype, type_args):
+    """ Returns whether values of a thrift_spec type are encoded the same by json, holding no structs or sets. """
+    if ttype in _SCALAR_TYPES:
+        return True
+    if ttype == TType.LIST:
+        return _is_plain(type_args[0], type_args[1])
+    if ttype == TType.MAP:
+        return type_args[0] in _SCALAR_TYPES and _is_plain(type_args[2], type_args[3])
+    return False
+
+
+def _to_json_object(obj):
+    """ Converts an object json's encoder cannot encode into one it can. """
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return obj.__dict__
+
+
+def _key_to_json(key):
+    """ Converts a map key to a string as json does. """
+    if isinstance(key, basestring):
+        return key
+    if isinstance(key, float):
+        return _float_to_json(key)
+    if key is True:
+        return 'true'
+    if key is False:
+        return 'false'
+    if key is None:
+        return 'null'
+    if isinstance(key, (int, long)):
+        return str(key)
+    raise TypeError('key %r is not a string' % (key,))
+
+
+def _float_to_json(value):
+    if value != value:
+        return 'NaN'
+    if value == float('inf'):
+        return 'Infinity'
+    if value == float('-inf'):
+        return '-Infinity'
+    return repr(value)
@@ -0,0 +1,180 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+import random
+import threading
+import time
+
+from .thrift_cli_error import ThriftCLIError
+
+ROUND_ROBIN_POLICY = 'round_robin'
+LEAST_OUTSTANDING_POLICY = 'least_outstanding'
+POWER_OF_TWO_CHOICES_POLICY = 'power_of_two_choices'
+LOAD_BALANCING_POLICIES = [ROUND_ROBIN_POLICY, LEAST_OUTSTANDING_POLICY, POWER_OF_TWO_CHOICES_POLICY]
+# The number of seconds a member that failed to connect is left out of the balancing before it is tried again.
+DEFAULT_EJECTION_SECONDS = 30.0
+
+
+class RoundRobinPolicy(object):
+    """ Picks each member in turn, regardless of how many requests it has outstanding. """
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def choose(self, addresses, outstanding):
+        """ Picks the member to send the next request to.
+
+        :param addresses: the addresses of the members to pick from
+        :type addresses: list of str
+        :param outstanding: the number of requests outstanding on each member
+        :type outstanding: dict of str to int
+        :rtype: str
+
+        """
+        return addresses[next(self._counter) % len(addresses)]
+
+
+class LeastOutstandingPolicy(object):
+    """ Picks the member with the fewest requests outstanding, so slow members are sent fewer requests. """
+
+    def __init__(self, seed=None):
+        self._random = random.Random(seed)
+
+    def choose(self, addresses, outstanding):
+        fewest = min(outstanding.get(address, 0) for address in addresses)
+        return self._random.choice([address for address in addresses if outstanding.get(address, 0) == fewest])
+
+
+class PowerOfTwoChoicesPolicy(object):
+    """ Picks the member with fewer requests outstanding of two picked at random.
+
+    This avoids slow members nearly as well as picking the least loaded member, while not sending every request to
+    whichever member just became the least loaded.
+
+    """
+
+    def __init__(self, seed=None):
+        self._random = random.Random(seed)
+
+    def choose(self, addresses, outstanding):
+        if len(addresses) == 1:
+            return addresses[0]
+        first, second = self._random.sample(addresses, 2)
+        return first if outstanding.get(first, 0) <= outstanding.get(second, 0) else second
+
+
+def make_policy(policy, seed=None):
+    """ Returns the load balancing policy with the given name.
+
+    :param policy: one of LOAD_BALANCING_POLICIES, or an object with a choose(addresses, outstanding) method
+    :param seed: the seed of the random picks, or None to seed them from the system
+    :type seed: int
+    :returns: an object with a choose(addresses, outstanding) method returning one of the addresses
+    :raises: ThriftCLIError if the policy is unknown
+
+    """
+    if hasattr(policy, 'choose'):
+        return policy
+    if policy == ROUND_ROBIN_POLICY:
+        return RoundRobinPolicy()
+    if policy == LEAST_OUTSTANDING_POLICY:
+        return LeastOutstandingPolicy(seed)
+    if policy == POWER_OF_TWO_CHOICES_POLICY:
+        return PowerOfTwoChoicesPolicy(seed)
+    raise ThriftCLIError('Unknown load balancing policy: \'%s\', expected one of: %s' %
+                         (policy, ', '.join(LOAD_BALANCING_POLICIES)))
+
+
+class ThriftLoadBalancer(object):
+    """ Spreads requests over the members of a server set with a policy, leaving out members that failed to connect.
+
+    A member is ejected when a connection to it fails to open, and is left out of the balancing for the ejection time,
+    after which it is tried again. While every member is ejected, requests are spread over all of them.
+
+    Requests made from threads call acquire to pick a member and release once they are done, which lets the balancer
+    count the requests outstanding on each member. Callers that count outstanding requests themselves, such as the
+    event loop, call choose with their counts instead.
+
+    """
+
+    def __init__(self, addresses, policy=POWER_OF_TWO_CHOICES_POLICY, ejection_seconds=DEFAULT_EJECTION_SECONDS,
+                 seed=None):
+        """
+        :param addresses: the addresses of the members, as <host>:<port>
+        :type addresses: list of str
+        :param policy: one of LOAD_BALANCING_POLICIES, or an object with a choose(addresses, outstanding) method
+        :param ejection_seconds: the number of seconds to leave out a member that failed to connect
+        :type ejection_seconds: float
+        :param seed: the seed of the policy's random picks, or None to seed them from the system
+        :type seed: int
+        :raises: ThriftCLIError if there are no addresses or the policy is unknown
+
+        """
+        if not addresses:
+            raise ThriftCLIError('A load balancer needs at least one address')
+        self.addresses = list(addresses)
+        self._policy = make_policy(policy, seed)
+        self._ejection_seconds = ejection_seconds
+        self._lock = threading.Lock()
+        self._outstanding = dict((address, 0) for address in self.addresses)
+        # The time each ejected member is let back into the balancing
+        self._ejected_until = {}
+
+    def get_available(self):
+        """ Returns the addresses of the members that are not ejected.
+
+        :rtype: list of str
+
+        """
+        now = time.time()
+        with self._lock:
+            return [address for address in self.addresses if self._ejected_until.get(address, 0) <= now]
+
+    def choose(self, addresses=None, outstanding=None):
+        """ Picks the member to send the next request to, without counting the request as outstanding.
+
+        :param addresses: the addresses to pick from, defaults to the available members, or every member if none are
+        :type addresses: list of str
+        :param outstanding: the number of requests outstanding on each member, defaults to the ones acquired
+        :type outstanding: dict of str to int
+        :rtype: str
+
+        """
+        if not addresses:
+            addresses = self.get_available() or self.addresses
+        if outstanding is None:
+            with self._lock:
+                outstanding = dict(self._outstanding)
+        return self._policy.choose(addresses, outstanding)
+
+    def acquire(self):
+        """ Picks the member to send a request to, and counts the request as outstanding on it until released.
+
+        :rtype: str
+
+        """
+        addresses = self.get_available() or self.addresses
+        with self._lock:
+            address = self._policy.choose(addresses, self._outstanding)
+            self._outstanding[address] += 1
+        return address
+
+    def release(self, address):
+        """ Counts a request acquired on a member as done, whether or not it succeeded. """
+        with self._lock:
+            self._outstanding[address] -= 1
+
+    def eject(self, address):
+        """ Leaves a member that failed to connect out of the balancing for the ejection time. """
+        with self._lock:
+            self._ejected_until[address] = time.time() + self._ejection_seconds
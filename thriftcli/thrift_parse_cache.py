@@ -0,0 +1,113 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import cPickle
+import hashlib
+import os
+
+from .thrift_codegen_cache import get_cache_dir, _make_dirs, _write_atomically
+
+
+class ThriftParseCache(object):
+    """ Persists the parsing of individual thrift files across runs.
+
+    Entries are keyed by the absolute path of a thrift file and stamped with its size, modification time, and content
+    hash. An entry is reused while the file's size and modification time are unchanged, or when they changed but the
+    content hash still matches. The cache file is only read once the first entry is looked up.
+
+    """
+
+    # Bumped whenever the format of the cached parse results changes, which discards caches from older versions.
+    FORMAT_VERSION = 4
+
+    def __init__(self, cache_dir=None):
+        """
+        :param cache_dir: the directory to keep the cache in, defaults to get_cache_dir()
+        :type cache_dir: str
+
+        """
+        self._cache_path = os.path.join(cache_dir or get_cache_dir(), 'parse-results.pickle')
+        self._entries = None
+        self._modified = False
+
+    def get(self, path):
+        """ Returns the cached parse of a thrift file, or None if the file changed since it was cached.
+
+        :param path: the path to the thrift file
+        :type path: str
+        :returns: the value passed to put when the file was last parsed, or None
+
+        """
+        entries = self._load()
+        key = os.path.abspath(path)
+        if key not in entries:
+            return None
+        (size, mtime, content_hash), parsed = entries[key]
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if (stat.st_size, stat.st_mtime) == (size, mtime):
+            return parsed
+        if stat.st_size == size and _hash_file(path) == content_hash:
+            entries[key] = ((size, stat.st_mtime, content_hash), parsed)
+            self._modified = True
+            return parsed
+        return None
+
+    def put(self, path, content, parsed):
+        """ Caches the parse of a thrift file.
+
+        :param path: the path to the thrift file
+        :type path: str
+        :param content: the content of the thrift file that was parsed
+        :type content: str
+        :param parsed: the value to return from get until the file changes, which must be picklable
+
+        """
+        stamp = (len(content), os.path.getmtime(path), hashlib.sha1(content).hexdigest())
+        self._load()[os.path.abspath(path)] = (stamp, parsed)
+        self._modified = True
+
+    def save(self):
+        """ Writes the cache to disk if any entries were added or restamped since it was loaded. """
+        if not self._modified:
+            return
+        _make_dirs(os.path.dirname(self._cache_path))
+        content = cPickle.dumps((self.FORMAT_VERSION, self._entries), cPickle.HIGHEST_PROTOCOL)
+        _write_atomically(self._cache_path, content)
+        self._modified = False
+
+    def _load(self):
+        """ Returns the cached entries, reading them from disk the first time they are needed.
+
+        A missing, unreadable, or outdated cache file is treated as empty.
+
+        :rtype: dict of str to tuple
+
+        """
+        if self._entries is None:
+            self._entries = {}
+            try:
+                with open(self._cache_path, 'rb') as cache_file:
+                    version, entries = cPickle.load(cache_file)
+                if version == self.FORMAT_VERSION:
+                    self._entries = entries
+            except Exception:
+                pass
+        return self._entries
+
+
+def _hash_file(path):
+    """ Returns the sha1 hex digest of a file's content. """
+    with open(path, 'rb') as file_to_hash:
+        return hashlib.sha1(file_to_hash.read()).hexdigest()
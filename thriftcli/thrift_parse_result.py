@@ -19,7 +19,7 @@ class ThriftParseResult(object):
     A ThriftParseResult holds:
     1. A map of struct names to ThriftStructs
     2. A map of service names to ThriftServices
-    3. A set of all enum type names
+    3. A map of enum type names to their value names and values
     4. A map of initial types to aliased types, defined by typedefs
     5. A map from file basenames to python namespaces
 
@@ -31,14 +31,14 @@ class ThriftParseResult(object):
 
         :param structs: dictionary from struct reference to ThriftStruct object.
         :param services: dictionary from service reference to ThriftService object.
-        :param enums: set of enum references.
+        :param enums: dictionary from enum reference to a dictionary of value names to values.
         :param typedefs: dictionary from typedef alias reference to unaliased field type.
         :param typedefs: dictionary from file basenames to python namespaces.
 
         """
         self.structs = structs if structs is not None else {}
         self.services = services if services is not None else {}
-        self.enums = enums if enums is not None else set([])
+        self.enums = enums if enums is not None else {}
         self.typedefs = typedefs if typedefs is not None else {}
         self.namespaces = namespaces if namespaces is not None else {}
 
@@ -88,7 +88,7 @@ class ThriftParseResult(object):
     def merge_enums(self, enums):
         """ Add the enums from another ThriftParseResult into this one.
 
-        :param enums: a set of enum type names to be added to self's enums.
+        :param enums: a map of enum type names to their values to be added to self's enums.
 
         """
         self.enums.update(enums)
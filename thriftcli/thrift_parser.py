@@ -10,14 +10,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import itertools
 import os
 import re
+import string
 
 from .thrift_cli_error import ThriftCLIError
 from .thrift_parse_result import ThriftParseResult
 from .thrift_service import ThriftService
 from .thrift_struct import ThriftStruct
+from .thrift_type import ThriftType
+
+CONTAINER_TYPES = frozenset(['map', 'set', 'list'])
+IDENTIFIER_STARTS = frozenset(string.ascii_letters + '_')
+LITERAL_STARTS = frozenset('"\'')
+NUMBER_STARTS = frozenset(string.digits + '+-.')
+CONSTANT_STARTS = IDENTIFIER_STARTS | LITERAL_STARTS | NUMBER_STARTS
 
 
 class ThriftParser(object):
@@ -26,116 +35,55 @@ class ThriftParser(object):
     Call parse to extract a ThriftParseResult object.
 
     The parser works by taking the following steps:
-    1. Parse all dependencies and inherit their results
-    2. Match file content with regexs and consolidate the following in a ThriftParseResult:
-        - Struct definitions as ThriftStructs
+    1. Tokenize the file content, parse its definitions in a single pass, and consolidate the following in a
+       ThriftParseResult:
+        - Struct, union, and exception definitions as ThriftStructs
         - Service definitions as ThriftServices
-        - Enum declarations as Enum type names (the names/values aren't needed)
+        - Enum declarations as mappings from enum value names to values
         - Typedefs as mappings from initial type to aliased type
-    3. Merge the ThriftParseResults from the dependencies into the ThriftParseResult from step 2
-    4. Return the merged ThriftParseResult
-
-    """
+    2. Parse all dependencies the same way, each once, and merge their results before the ThriftParseResult from step 1
+    3. Add the endpoints inherited from extended services, which may be declared in dependencies
+    4. Resolve the type of every field into a ThriftType, following typedefs declared in any file
+    5. Return the merged ThriftParseResult
 
-    # Matches Thrift includes statements. Captures the dependency file names.
-    #
-    # For example:
-    #   includes "File.thrift"
-    #   => ("File.thrift")
-    INCLUDES_REGEX = re.compile(r'^include\s+\"([\w./]+.thrift)\"', flags=re.MULTILINE)
+    Given a ThriftParseCache, step 1 is skipped for files that haven't changed since they were last parsed. Step 1 runs
+    on a process pool when enough included files can be parsed at once.
 
-    # Matches Thrift python namespace statements. Captures the namespace.
-    #
-    # For example:
-    #   namespace py com.example.thrift.thriftpy
-    #   => ("com.example.thrift.thriftpy")
-    NAMESPACE_PY_REGEX = re.compile(r'^namespace\s+py\s+(\S+)', flags=re.MULTILINE)
+    """
 
-    # Matches struct definitions. Captures the whole definition and the struct name.
-    #
-    # For example:
-    #   struct MyStruct {
-    #       1:required i64 myNum = 0
-    #   }
-    #   => ("struct MyStruct {\n1:required i64 myNum = 0\n}",
-    #       "MyStruct")
-    STRUCTS_REGEX = re.compile(r'^([\r\t ]*?struct (\w+)[^}]+})', flags=re.MULTILINE)
-
-    # Matches service definitions. Captures the whole definition, the service name, and optionally the extended service.
-    #
-    # For example:
-    #   service MyService extends MyOtherService {
-    #       i64 add(1:i64 num1, 2:i64 num2)
-    #   }
-    #   => ("service MyService extends MyOtherService {\ni64 add(1:i64 num1, 2:i64 num2)\n}",
-    #       "MyService",
-    #       "MyOtherService")
-    SERVICES_REGEX = re.compile(r'^([\r\t ]*?service\s+(\w+)(?:\s+extends\s+([\w.]+))?[^}]+})', flags=re.MULTILINE)
-
-    # Matches enum definitions. Captures the enum name.
-    #
-    # For example:
-    #   enum MyEnum {
-    #       ONE = 0x64,
-    #       TWO = 2,
-    #       THREE
-    #   }
-    #   => ("MyEnum")
-    ENUMS_REGEX = re.compile(r'^[\r\t ]*?enum (\w+)[^}]+}', flags=re.MULTILINE)
-
-    # Matches endpoint declarations. Captures oneway, the return type, the endpoint name, and the fields string.
-    #
-    # For example:
-    #   i64 add(1:i64 num1, 2:i64 num2)
-    #   => ("",
-    #       "i64",
-    #       "add",
-    #       "1:i64 num1, 2:i64 num2")
-    ENDPOINTS_REGEX = re.compile(r'^[\r\t ]*(oneway)?\s*([^\n]*)\s+(\w+)\(([a-zA-Z0-9: ,.<>]*)\)',
-                                 flags=re.MULTILINE)
-
-    # Matches field declarations. Captures index, optional/required, field type, field name, and default value.
-    #
-    # Note that only "field type and field name" are necessary. The other parts are optional.
-    #
-    # For example:
-    #   1:required i64 myNum = 0
-    #   => ("1",
-    #       "required",
-    #       "i64",
-    #       "myNum",
-    #       "0")
-    #   11: optional set<Cohort> cohorts
-    #   => ("11",
-    #       "optional",
-    #       "set<Cohort>",
-    #       "cohorts",
-    #       "")
-    #   string thing_one
-    #   => ("",
-    #       "required",
-    #       "string",
-    #       "thing_one",
-    #       "")
-    FIELDS_REGEX = re.compile(
-        r'^[\r\t ]*(\d+\s*:)?\s*(optional|required)?\s*([^\n=]+)?\s+(\w+)(?:\s*=\s*([^,;\s]+))?[,;\n]',
-        flags=re.MULTILINE)
-
-    # Matches typedefs. Captures initial type name and aliased type name.
+    # Matches the next token after skipping any whitespace and comments before it. Captures the token, which is a
+    # literal, number, identifier, symbol, or any other single character. Captures an empty string at the end.
     #
     # For example:
-    #   typedef MyNumber i64
-    #   => ("MyNumber",
-    #       "i64")
-    TYPEDEFS_REGEX = re.compile(r'^[\r\t ]*typedef\s+([^\n]*)[\r\t ]+([^,;\n]*)', flags=re.MULTILINE)
-
-    def __init__(self, thrift_path, thrift_dir_paths=None):
+    #   // The number of things
+    #   1: optional i32 things = 0x10,
+    #   => ("1"), (":"), ("optional"), ("i32"), ("things"), ("="), ("0x10"), (","), ("")
+    TOKENS_REGEX = re.compile(r'''
+        (?:\s+|//[^\n]*|\#[^\n]*|/\*.*?\*/)*
+        (
+            [a-zA-Z_][\w.]* |
+            "[^"]*" | '[^']*' |
+            [+-]?(?:0[xX][0-9a-fA-F]+|(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?) |
+            \Z |
+            .
+        )''', flags=re.VERBOSE | re.DOTALL)
+
+    # The fewest files that have to be parsed at once before they are worth sending to a process pool.
+    MIN_FILES_PER_POOL = 8
+
+    def __init__(self, thrift_path, thrift_dir_paths=None, parse_cache=None, processes=None):
         """
 
         :param thrift_path: the path to the thrift file being parsed.
         :type thrift_path: str
         :param thrift_dir_paths: additional directories to search for when including thrift files.
         :type thrift_dir_paths: list of str
+        :param parse_cache: a ThriftParseCache to reuse the parsing of unchanged files from, or None.
+        :type parse_cache: ThriftParseCache
+        :param processes: the number of processes to parse included files with, defaults to parsing them in process.
+            Pickling the parses back costs more than a pool saves on few cpus, as benchmarks/parser_pool_benchmark.py
+            measures, so a pool is only used when a caller opts in.
+        :type processes: int
 
         """
         if thrift_dir_paths is None:
@@ -143,10 +91,20 @@ class ThriftParser(object):
         self._thrift_path = thrift_path
         self._thrift_dir_paths = [os.path.dirname(thrift_path)] + thrift_dir_paths
         self._namespace = ThriftParser.get_package_name(thrift_path)
-        self._thrift_content = self._load_file(self._thrift_path)
+        self._parse_cache = parse_cache
+        self._processes = processes or 1
+        self._content = None
+        self._tokens = None
         self._references = set([])
         self._result = None
 
+    @property
+    def _thrift_content(self):
+        """ The content of the parsed thrift file, which is only loaded once it is needed. """
+        if self._content is None:
+            self._content = self._load_file(self._thrift_path)
+        return self._content
+
     def parse(self):
         """ Parses a thrift file into its structs, services, enums, typedefs, and namespaces.
 
@@ -154,18 +112,188 @@ class ThriftParser(object):
         :rtype: ThriftParseResult
 
         """
+        preparsed_files = self._parse_in_waves() if self._processes > 1 else {}
+        parsed_files = collections.OrderedDict()
+        self._parse_with_dependencies(parsed_files, [], preparsed_files)
         self._result = ThriftParseResult()
-        for path in self._get_dependency_paths():
-            parser = ThriftParser(path, self._thrift_dir_paths)
-            self._references.update(parser._parse_references())
-            self._result.merge_result(parser.parse())
-        self._references.update(self._parse_references())
-        parse_result = ThriftParseResult(
-            self._parse_structs(), self._parse_services(), self._parse_enums(), self._parse_typedefs(),
-            self._parse_namespace_py())
-        self._result.merge_result(parse_result)
+        for _, references, parse_result in parsed_files.values():
+            self._references.update(references)
+            self._result.merge_result(parse_result)
+        self._link_services(self._result)
+        if self._parse_cache is not None:
+            self._parse_cache.save()
+        self._resolve_types(self._result)
         return self._result
 
+    def _parse_with_dependencies(self, parsed_files, including_paths, preparsed_files):
+        """ Parses the thrift file and, depth first, each file it includes that was not already parsed.
+
+        Every file in the include graph is loaded and parsed once, however many files include it. A file is added to
+        parsed_files after its dependencies, so its definitions are merged after theirs.
+
+        :param parsed_files: the parses of the files visited so far, by absolute path
+        :type parsed_files: collections.OrderedDict
+        :param including_paths: the absolute paths of the files that include this one, outermost first
+        :type including_paths: list of str
+        :param preparsed_files: parses to use instead of parsing the files again, by absolute path
+        :type preparsed_files: dict of str to tuple
+        :raises: ThriftCLIError
+
+        """
+        including_paths = including_paths + [os.path.abspath(self._thrift_path)]
+        parsed = preparsed_files.get(including_paths[-1]) or self._parse_file()
+        for path in self._get_dependency_paths(parsed[0]):
+            dependency_path = os.path.abspath(path)
+            if dependency_path in including_paths:
+                cycle = including_paths[including_paths.index(dependency_path):] + [dependency_path]
+                raise ThriftCLIError('Circular include: %s' % ' -> '.join(cycle))
+            if dependency_path not in parsed_files:
+                parser = ThriftParser(path, self._thrift_dir_paths, self._parse_cache, 1)
+                parser._parse_with_dependencies(parsed_files, including_paths, preparsed_files)
+        parsed_files[including_paths[-1]] = parsed
+
+    def _parse_in_waves(self):
+        """ Parses every file in the include graph, a wave of newly discovered includes at a time.
+
+        The files in a wave don't depend on each other, so a wave with enough files that aren't cached is parsed on a
+        pool of processes. The parses are only collected here; they are merged in a deterministic order afterwards.
+
+        :returns: the parses of the files in the include graph, by absolute path
+        :rtype: dict of str to tuple
+
+        """
+        parsed_files = {}
+        wave = [self]
+        pool = None
+        try:
+            while wave:
+                unparsed = []
+                for parser in wave:
+                    cached = self._parse_cache.get(parser._thrift_path) if self._parse_cache is not None else None
+                    if cached is not None:
+                        parsed_files[os.path.abspath(parser._thrift_path)] = cached
+                    else:
+                        unparsed.append(parser)
+                if len(unparsed) >= ThriftParser.MIN_FILES_PER_POOL:
+                    if pool is None:
+                        import multiprocessing
+                        pool = multiprocessing.Pool(self._processes)
+                    paths = [parser._thrift_path for parser in unparsed]
+                    for parser, (content, parsed) in zip(unparsed, pool.map(_parse_file_in_process, paths)):
+                        parsed_files[os.path.abspath(parser._thrift_path)] = parsed
+                        if self._parse_cache is not None:
+                            self._parse_cache.put(parser._thrift_path, content, parsed)
+                else:
+                    for parser in unparsed:
+                        parsed_files[os.path.abspath(parser._thrift_path)] = parser._parse_file()
+                next_wave = collections.OrderedDict()
+                for parser in wave:
+                    for path in parser._get_dependency_paths(parsed_files[os.path.abspath(parser._thrift_path)][0]):
+                        if os.path.abspath(path) not in parsed_files:
+                            next_wave.setdefault(os.path.abspath(path),
+                                                 ThriftParser(path, parser._thrift_dir_paths, self._parse_cache, 1))
+                wave = next_wave.values()
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        return parsed_files
+
+    def _parse_file(self):
+        """ Parses what the thrift file declares by itself, reusing the cached parse if the file is unchanged.
+
+        The result of a single file does not depend on its dependencies. Services extending a service from another
+        file only contain their own endpoints until the merged result is linked by _link_services.
+
+        :returns: the names of the included files, the references the file declares, and its parse result
+        :rtype: tuple of (set of str, set of str, ThriftParseResult)
+
+        """
+        if self._parse_cache is not None:
+            cached = self._parse_cache.get(self._thrift_path)
+            if cached is not None:
+                return cached
+        names_to_include, namespaces, structs, services, enums, typedefs = self._parse_definitions()
+        self._references.update('%s.%s' % (self._namespace, name)
+                                for definitions in (structs, services, enums, typedefs) for name in definitions)
+        parse_result = self._build_parse_result(namespaces, structs, services, enums, typedefs)
+        parsed = (names_to_include, set(self._references), parse_result)
+        if self._parse_cache is not None:
+            self._parse_cache.put(self._thrift_path, self._thrift_content, parsed)
+        return parsed
+
+    @staticmethod
+    def _link_services(parse_result):
+        """ Adds the endpoints that each service inherits from the service it extends.
+
+        :param parse_result: a merged parse result whose services may extend services from other files
+        :type parse_result: ThriftParseResult
+        :raises: ThriftCLIError
+
+        """
+        linked = set([])
+
+        def link(reference, extending):
+            service = parse_result.services[reference]
+            if reference in linked or service.extends not in parse_result.services:
+                return service
+            if reference in extending:
+                raise ThriftCLIError('Circular service inheritance involving \'%s\'' % reference)
+            endpoints = link(service.extends, extending | {reference}).endpoints.copy()
+            endpoints.update(service.endpoints)
+            service = parse_result.services[reference] = ThriftService(reference, endpoints, service.extends)
+            linked.add(reference)
+            return service
+
+        for service_reference in list(parse_result.services):
+            link(service_reference, set([]))
+
+    @staticmethod
+    def _resolve_types(parse_result):
+        """ Sets the type_node of every struct and endpoint field to the ThriftType its field_type resolves to.
+
+        Each distinct field type is only resolved once, however many fields declare it.
+
+        :param parse_result: a merged parse result, whose typedefs may alias types from other files
+        :type parse_result: ThriftParseResult
+        :raises: ThriftCLIError
+
+        """
+        resolved_types = {}
+
+        def resolve(field_type):
+            if field_type in resolved_types:
+                return resolved_types[field_type]
+            unaliased_type = parse_result.unalias_type(field_type)
+            if unaliased_type in parse_result.structs:
+                thrift_type = ThriftType.get(ThriftType.STRUCT, unaliased_type)
+            elif unaliased_type in parse_result.enums:
+                thrift_type = ThriftType.get(ThriftType.ENUM, unaliased_type)
+            elif unaliased_type.startswith('list<') or unaliased_type.startswith('set<'):
+                kind = ThriftType.LIST if unaliased_type.startswith('list<') else ThriftType.SET
+                elem_type = unaliased_type[unaliased_type.index('<') + 1:unaliased_type.rindex('>')]
+                thrift_type = ThriftType.get(kind, kind, (resolve(elem_type),))
+            elif unaliased_type.startswith('map<'):
+                types_string = unaliased_type[unaliased_type.index('<') + 1:unaliased_type.rindex('>')]
+                split_index = ThriftParser.calc_map_types_split_index(types_string)
+                if split_index == -1:
+                    raise ThriftCLIError('Invalid type formatting for map - \'%s\'' % types_string)
+                key_type = resolve(types_string[:split_index].strip())
+                value_type = resolve(types_string[split_index + 1:].strip())
+                thrift_type = ThriftType.get(ThriftType.MAP, ThriftType.MAP, (key_type, value_type))
+            else:
+                thrift_type = ThriftType.get(ThriftType.BASE, unaliased_type)
+            resolved_types[field_type] = thrift_type
+            return thrift_type
+
+        for struct in parse_result.structs.values():
+            for field in struct.fields.values():
+                field.type_node = resolve(field.field_type)
+        for service in parse_result.services.values():
+            for endpoint in service.endpoints.values():
+                for field in endpoint.fields.values() + endpoint.exceptions.values():
+                    field.type_node = resolve(field.field_type)
+
     @staticmethod
     def get_package_name(thrift_path):
         """ Returns the name of the package generated by a thrift file.
@@ -191,14 +319,17 @@ class ThriftParser(object):
         with open(path, 'r') as file_to_read:
             return file_to_read.read()
 
-    def _get_dependency_paths(self):
+    def _get_dependency_paths(self, names_to_include=None):
         """ Returns the paths to all of the parsed thrift file's dependencies.
 
+        :param names_to_include: the file names included by the parsed thrift file, or None to find them in its content
+        :type names_to_include: set of str
         :returns: the paths to all of the parsed thrift file's dependencies, which are denoted by includes statements
         :rtype: list of str
 
         """
-        names_to_include = set(ThriftParser.INCLUDES_REGEX.findall(self._thrift_content))
+        if names_to_include is None:
+            names_to_include = self._parse_file()[0]
         names_found = set([])
         dependency_paths = []
         for thrift_dir_path, name in itertools.product(self._thrift_dir_paths, names_to_include):
@@ -210,175 +341,409 @@ class ThriftParser(object):
                 names_found.add(name)
         return dependency_paths
 
-    def _parse_namespace_py(self):
-        basename = ThriftParser.get_package_name(self._thrift_path)
-        namespace_list = ThriftParser.NAMESPACE_PY_REGEX.findall(self._thrift_content)
-        if namespace_list:
-            return {basename: namespace_list[0]}
-        else:
-            return {basename: basename}
+    def _tokenize(self):
+        """ Splits the content of the thrift file into tokens, skipping whitespace and comments.
 
-    def _parse_references(self):
-        """ Returns the set of references defined by the parsed thrift file.
+        :returns: the text of each token, followed by an empty string marking the end of the file
+        :rtype: list of str
 
-        A reference is a struct, service, enum, or typedef name prepended with the defining thrift file name.
+        """
+        tokens = ThriftParser.TOKENS_REGEX.findall(self._thrift_content)
+        while tokens and not tokens[-1]:
+            tokens.pop()
+        tokens.append('')
+        return tokens
 
-        For example: MyStruct defined in MyThrift.thrift has a reference of MyThrift.MyStruct
+    def _parse_definitions(self):
+        """ Parses the headers and definitions of the thrift file in a single pass over its tokens.
 
-        :returns: the set of references defined by the parsed thrift file
-        :rtype: set of str
+        Types are returned as they are written, since a definition may refer to definitions that follow it. Constants
+        and annotations are parsed but not returned.
 
-        """
-        struct_names = {name for _, name in ThriftParser.STRUCTS_REGEX.findall(self._thrift_content)}
-        service_names = {name for _, name, _ in ThriftParser.SERVICES_REGEX.findall(self._thrift_content)}
-        enum_names = {name for name in ThriftParser.ENUMS_REGEX.findall(self._thrift_content)}
-        typedef_names = {name for _, name in ThriftParser.TYPEDEFS_REGEX.findall(self._thrift_content)}
-        names = struct_names | service_names | enum_names | typedef_names
-        references = {'%s.%s' % (self._namespace, name) for name in names}
-        return references
+        Each of the _parse methods below takes the position of the token to start parsing at, and returns what it parsed
+        along with the position of the token that follows it.
 
-    def _parse_structs(self):
-        """ Returns the structs defined by the parsed thrift file, keyed by reference.
+        :returns: the names of the included files, namespaces by language, fields by struct name, extended service
+            names and endpoints by service name, values by enum name, and types by typedef alias
+        :rtype: tuple of (set of str, dict of str to str, dict of str to list of ThriftStruct.Field,
+            dict of str to (str, dict of str to ThriftService.Endpoint), dict of str to (dict of str to int),
+            dict of str to str)
+        :raises: ThriftCLIError
 
-        :returns: a dict of struct references to ThriftStructs for each struct defined in the parsed thrift file
-        :rtype: dict of str to ThriftStruct
+        """
+        tokens = self._tokens = self._tokenize()
+        names_to_include = set([])
+        namespaces = {}
+        structs = {}
+        services = {}
+        enums = {}
+        typedefs = {}
+        position = 0
+        while tokens[position]:
+            keyword = tokens[position]
+            position += 1
+            if keyword == 'include' or keyword == 'cpp_include':
+                name = self._literal(position)[1:-1]
+                position += 1
+                if keyword == 'include':
+                    names_to_include.add(name)
+            elif keyword == 'namespace':
+                scope = tokens[position] if tokens[position] == '*' else self._identifier(position)
+                # Some scopes, such as smalltalk.category, take a literal instead of an identifier
+                value = tokens[position + 1]
+                namespaces[scope] = value[1:-1] if value[:1] in LITERAL_STARTS else self._identifier(position + 1)
+                position += 2
+            elif keyword == 'typedef':
+                field_type, position = self._parse_type(position)
+                typedefs[self._identifier(position)] = field_type
+                position += 1
+            elif keyword == 'const':
+                _, position = self._parse_type(position)
+                self._identifier(position)
+                position = self._parse_const_value(self._expect(position + 1, '='))
+            elif keyword == 'enum':
+                name = self._identifier(position)
+                enums[name], position = self._parse_enum_values(self._expect(position + 1, '{'))
+            elif keyword == 'senum':
+                # Deprecated enums of strings, which thrift no longer generates code for
+                self._identifier(position)
+                position = self._expect(position + 1, '{')
+                while tokens[position] != '}':
+                    self._literal(position)
+                    position += 1
+                    if tokens[position] == ',' or tokens[position] == ';':
+                        position += 1
+                position += 1
+            elif keyword == 'struct' or keyword == 'union' or keyword == 'exception':
+                name = self._identifier(position)
+                position += 1
+                if tokens[position] == 'xsd_all':
+                    position += 1
+                structs[name], position = self._parse_fields(self._expect(position, '{'), '}')
+            elif keyword == 'service':
+                name = self._identifier(position)
+                extends = None
+                position += 1
+                if tokens[position] == 'extends':
+                    extends = self._identifier(position + 1)
+                    position += 2
+                endpoints, position = self._parse_endpoints(self._expect(position, '{'))
+                services[name] = (extends, endpoints)
+            else:
+                raise self._syntax_error(position - 1, 'a definition')
+            position = self._skip_annotations(position)
+            if tokens[position] == ',' or tokens[position] == ';':
+                position += 1
+        self._tokens = None
+        return names_to_include, namespaces, structs, services, enums, typedefs
+
+    def _parse_type(self, position):
+        """ Parses a field type, such as 'i32', 'MyStruct', or 'map<string, list<MyStruct>>'.
+
+        :returns: the type as it is written, with one space after the comma of maps
+        :rtype: tuple of (str, int)
 
         """
-        definitions_by_reference = self._parse_struct_definitions()
-        fields_by_reference = {reference: self._parse_fields_from_struct_definition(definition)
-                               for reference, definition in definitions_by_reference.items()}
-        structs = {reference: ThriftStruct(reference, fields) for reference, fields in fields_by_reference.items()}
-        return structs
+        tokens = self._tokens
+        field_type = self._identifier(position)
+        position += 1
+        if field_type in CONTAINER_TYPES:
+            if field_type != 'list':
+                position = self._skip_cpp_type(position)
+            position = self._expect(position, '<')
+            if field_type == 'map':
+                key_type, position = self._parse_type(position)
+                value_type, position = self._parse_type(self._expect(position, ','))
+                field_type = 'map<%s, %s>' % (key_type, value_type)
+            else:
+                elem_type, position = self._parse_type(position)
+                field_type = '%s<%s>' % (field_type, elem_type)
+            position = self._expect(position, '>')
+            if field_type.startswith('list<'):
+                position = self._skip_cpp_type(position)
+        if tokens[position] == '(':
+            position = self._skip_annotations(position)
+        return field_type, position
+
+    def _parse_fields(self, position, closing):
+        """ Parses the fields of a struct, or the arguments or exceptions of an endpoint, through a closing symbol.
+
+        :param closing: the symbol that ends the fields, '}' or ')'
+        :type closing: str
+        :returns: the fields in the order they are declared, with types as they are written
+        :rtype: tuple of (list of ThriftStruct.Field, int)
 
-    def _parse_struct_definitions(self):
-        """ Returns the struct definitions found in the parsed thrift file, keyed by reference.
+        """
+        tokens = self._tokens
+        fields = []
+        has_implicit_indices = False
+        while tokens[position] != closing:
+            # Fields make up most of a thrift file, so the common cases are checked here instead of calling helpers
+            index = None
+            token = tokens[position]
+            if token.isdigit() and tokens[position + 1] == ':':
+                index = int(token)
+                position += 2
+            elif token[:1] in NUMBER_STARTS:
+                index = self._integer(position)
+                position = self._expect(position + 1, ':')
+            else:
+                has_implicit_indices = True
+            modifier = tokens[position]
+            if modifier == 'required' or modifier == 'optional':
+                position += 1
+            else:
+                modifier = None
+            field_type = tokens[position]
+            if field_type[:1] not in IDENTIFIER_STARTS or field_type in CONTAINER_TYPES or \
+                    tokens[position + 1] == '(':
+                field_type, position = self._parse_type(position)
+            else:
+                position += 1
+            if tokens[position] == '&':
+                # A cpp reference, which only changes the generated C++
+                position += 1
+            name = tokens[position]
+            if name[:1] not in IDENTIFIER_STARTS:
+                raise self._syntax_error(position, 'an identifier')
+            position += 1
+            default = None
+            if tokens[position] == '=':
+                default_position = position + 1
+                position = self._parse_const_value(default_position)
+                default = ''.join(token + ' ' if token == ',' or token == ':' else token
+                                  for token in tokens[default_position:position]).rstrip()
+            while tokens[position] == 'xsd_optional' or tokens[position] == 'xsd_nillable':
+                position += 1
+            if tokens[position] == 'xsd_attrs':
+                _, position = self._parse_fields(self._expect(position + 1, '{'), '}')
+            if tokens[position] == '(':
+                position = self._skip_annotations(position)
+            if tokens[position] == ',' or tokens[position] == ';':
+                position += 1
+            required = True if modifier == 'required' else None
+            optional = True if modifier == 'optional' else None
+            fields.append(ThriftStruct.Field(index, field_type, name, required=required, optional=optional,
+                                             default=default))
+        if has_implicit_indices:
+            self._assign_field_indices(fields)
+        return fields, position + 1
+
+    def _parse_endpoints(self, position):
+        """ Parses the functions of a service through its closing brace.
+
+        :returns: the endpoints of the service by name, with types as they are written
+        :rtype: tuple of (dict of str to ThriftService.Endpoint, int)
 
-        :returns: a dict of struct references to struct definitions for each struct defined in the parsed thrift file
-        :rtype: dict of str to str
+        """
+        tokens = self._tokens
+        endpoints = {}
+        while tokens[position] != '}':
+            oneway = tokens[position] == 'oneway'
+            if oneway:
+                position += 1
+            return_type, position = self._parse_type(position)
+            name = self._identifier(position)
+            fields, position = self._parse_fields(self._expect(position + 1, '('), ')')
+            exceptions = []
+            if tokens[position] == 'throws':
+                exceptions, position = self._parse_fields(self._expect(position + 1, '('), ')')
+            position = self._skip_annotations(position)
+            if tokens[position] == ',' or tokens[position] == ';':
+                position += 1
+            fields = {field.name: field for field in fields}
+            exceptions = {field.name: field for field in exceptions}
+            endpoints[name] = ThriftService.Endpoint(return_type, name, fields, oneway=oneway, exceptions=exceptions)
+        return endpoints, position + 1
+
+    def _parse_enum_values(self, position):
+        """ Parses the values of an enum through its closing brace, numbering them the way thrift numbers them.
+
+        A value without an explicit number is one greater than the value before it, starting from 0.
+
+        :returns: a dict of value names to values
+        :rtype: tuple of (dict of str to int, int)
 
         """
-        structs_list = ThriftParser.STRUCTS_REGEX.findall(self._thrift_content)
-        structs = {'%s.%s' % (self._namespace, name): definition for definition, name in structs_list}
-        return structs
+        tokens = self._tokens
+        values = {}
+        next_value = 0
+        while tokens[position] != '}':
+            name = self._identifier(position)
+            position += 1
+            if tokens[position] == '=':
+                next_value = self._integer(position + 1)
+                position += 2
+            values[name] = next_value
+            next_value += 1
+            position = self._skip_annotations(position)
+            if tokens[position] == ',' or tokens[position] == ';':
+                position += 1
+        return values, position + 1
+
+    def _parse_const_value(self, position):
+        """ Parses a constant value, including lists and maps of constants.
+
+        :returns: the position of the token following the constant
+        :rtype: int
 
-    def _parse_fields_from_struct_definition(self, definition):
-        """ Returns the fields in the struct definition, keyed by field name.
+        """
+        tokens = self._tokens
+        token = tokens[position]
+        if token == '[' or token == '{':
+            closing = ']' if token == '[' else '}'
+            position += 1
+            while tokens[position] != closing:
+                position = self._parse_const_value(position)
+                if token == '{':
+                    position = self._parse_const_value(self._expect(position, ':'))
+                if tokens[position] == ',' or tokens[position] == ';':
+                    position += 1
+            return position + 1
+        elif token[:1] in CONSTANT_STARTS and token not in ('+', '-', '.'):
+            return position + 1
+        raise self._syntax_error(position, 'a constant value')
+
+    def _skip_annotations(self, position):
+        """ Skips over parenthesized annotations, such as '(python.immutable = "")', if there are any.
+
+        :returns: the position of the token following the annotations
+        :rtype: int
 
-        :returns: a dict of field names to ThriftStruct.Fields for each field defined in a struct definition
-        :rtype: dict of str to ThriftStruct.Field
+        """
+        tokens = self._tokens
+        if tokens[position] != '(':
+            return position
+        position += 1
+        while tokens[position] != ')':
+            self._identifier(position)
+            position += 1
+            if tokens[position] == '=':
+                self._literal(position + 1)
+                position += 2
+            if tokens[position] == ',' or tokens[position] == ';':
+                position += 1
+        return position + 1
+
+    def _skip_cpp_type(self, position):
+        """ Skips over the cpp_type declaration of a container type if there is one.
+
+        :returns: the position of the token following the declaration
+        :rtype: int
 
         """
-        field_matches = ThriftParser.FIELDS_REGEX.findall(definition)
-        fields = [self._construct_field_from_field_match(field_match) for field_match in field_matches]
-        self._assign_field_indices(fields)
-        fields = {field.name: field for field in fields}
-        return fields
+        if self._tokens[position] != 'cpp_type':
+            return position
+        self._literal(position + 1)
+        return position + 2
 
-    def _parse_services(self):
-        """ Returns the services defined by the parsed thrift file, keyed by reference.
+    def _identifier(self, position):
+        """ Returns the token at a position, which must be an identifier.
 
-        :returns: a dict of service references to ThriftServices for each service defined in the parsed thrift file
-        :rtype: dict of str to ThriftService
+        :raises: ThriftCLIError
 
         """
-        definitions_by_reference = self._parse_service_definitions()
-        known_services = self._result.services
-        services = known_services.copy()
-        for reference, (definition, extends) in definitions_by_reference:
-            endpoints = self._build_service_endpoints(services, definition, extends)
-            service = ThriftService(reference, endpoints, extends)
-            services[reference] = service
-        return services
+        token = self._tokens[position]
+        if token[:1] not in IDENTIFIER_STARTS:
+            raise self._syntax_error(position, 'an identifier')
+        return token
 
-    def _parse_service_definitions(self):
-        """ Returns the service definitions found in the parsed thrift file, keyed by reference.
+    def _literal(self, position):
+        """ Returns the token at a position, which must be a string literal, including its quotes.
 
-        :returns: a dict of service references to service definitions for each service defined in the parsed thrift file
-        :rtype: dict of str to str
+        :raises: ThriftCLIError
 
         """
-        services_list = ThriftParser.SERVICES_REGEX.findall(self._thrift_content)
-        services = [(self._apply_namespace(name), (definition, self._apply_namespace(extends) if extends else None))
-                    for definition, name, extends in services_list]
-        return services
-
-    def _build_service_endpoints(self, services, definition, extends=None):
-        """ Returns the ThriftService.Endpoints contained by a service definition, including from service inheritance
-
-        :param services: a dict of service references to ThriftServices that have been parsed so far
-        :type services: dict of str to ThriftService
-        :param definition: the service definition that endpoints are being built for
-        :type definition: str
-        :param extends: a reference to the service being extended, or None
-        :type extends: str or None
-        :return: a dict of endpoint names to ThriftService.Endpoints provided by the given service definition
-        :rtype: dict of str to ThriftService.Endpoint
+        token = self._tokens[position]
+        if token[:1] not in LITERAL_STARTS:
+            raise self._syntax_error(position, 'a string literal')
+        return token
 
-        """
-        endpoints = services[extends].endpoints.copy() if extends is not None else {}
-        parsed_endpoints = self._parse_endpoints_from_service_definition(definition)
-        endpoints.update(parsed_endpoints)
-        return endpoints
-
-    def _parse_endpoints_from_service_definition(self, definition):
-        """ Returns the endpoints in the service definition, keyed by method name.
+    def _integer(self, position):
+        """ Returns the value of the token at a position, which must be a decimal or hexadecimal integer constant.
 
-        :param definition: the service definition to parse
-        :type definition: str
-        :returns: a dict of endpoint names to ThriftService.Endpoints provided by the given service definition
-        :rtype: dict of str to ThriftService.Endpoint
+        :raises: ThriftCLIError
 
         """
-        endpoint_matches = ThriftParser.ENDPOINTS_REGEX.findall(definition)
-        (oneways, return_types, names, fields_strings) = zip(*endpoint_matches)
-        (oneways, return_types, names, fields_strings) = \
-            (list(oneways), list(return_types), list(names), list(fields_strings))
-        return_types = [self._apply_namespace(return_type) for return_type in return_types]
-        fields_lists = [self._parse_fields_from_fields_string(fields_string) for fields_string in fields_strings]
-        fields_dicts = [{field.name: field for field in field_list} for field_list in fields_lists]
-        endpoints = [ThriftService.Endpoint(return_type, name, fields, oneway=oneway) for
-                     oneway, return_type, name, fields in zip(oneways, return_types, names, fields_dicts)]
-        endpoints = {endpoint.name: endpoint for endpoint in endpoints}
-        return endpoints
-
-    def _parse_fields_from_fields_string(self, fields_string):
-        """ Returns the fields in the field string.
-
-        :param fields_string: the field string to parse
-        :type fields_string: str
-        :returns: a list of ThriftStruct.Fields defined by the field string
-        :rtype: list of ThriftStruct.Field
+        token = self._tokens[position]
+        if token.isdigit():
+            return int(token)
+        try:
+            return int(token, 16) if 'x' in token.lower() else int(token)
+        except ValueError:
+            raise self._syntax_error(position, 'an integer')
+
+    def _expect(self, position, text):
+        """ Checks that the token at a position is a symbol or identifier with the given text.
+
+        :returns: the position of the token following it
+        :rtype: int
+        :raises: ThriftCLIError
 
         """
-        field_strings = self.split_fields_string(fields_string)
-        field_matches = [ThriftParser.FIELDS_REGEX.findall(field_string + '\n') for field_string in field_strings]
-        field_matches = [field_match[0] for field_match in field_matches if len(field_match)]
-        fields = [self._construct_field_from_field_match(field_match) for field_match in field_matches]
-        self._assign_field_indices(fields)
-        return fields
+        if self._tokens[position] != text:
+            raise self._syntax_error(position, '\'%s\'' % text)
+        return position + 1
 
-    def _parse_enums(self):
-        """ Returns the set of enum references defined by the parsed thrift file.
+    def _syntax_error(self, position, expected):
+        """ Returns an error describing an unexpected token.
 
-        :returns: the set of enum references defined by the parsed thrift file
-        :rtype: set of str
+        :param position: the position of the unexpected token
+        :type position: int
+        :param expected: a description of what was expected instead
+        :type expected: str
+        :rtype: ThriftCLIError
 
         """
-        enums_list = ThriftParser.ENUMS_REGEX.findall(self._thrift_content)
-        enums = {'%s.%s' % (self._namespace, enum) for enum in enums_list}
-        return enums
-
-    def _parse_typedefs(self):
-        """ Returns the typedefs defined by the parsed thrift file, keyed by alias.
-
-        :returns: a dict of aliased types to unaliased types
-        :rtype: dict of str to str
+        content = self._thrift_content
+        offset = len(content)
+        for token_position, token_match in enumerate(ThriftParser.TOKENS_REGEX.finditer(content)):
+            if token_position == position:
+                offset = token_match.start(1)
+                break
+        line = content.count('\n', 0, offset) + 1
+        token = self._tokens[position]
+        found = '\'%s\'' % token if token else 'end of file'
+        return ThriftCLIError('Syntax error in %s on line %d: expected %s, found %s' %
+                              (self._thrift_path, line, expected, found))
+
+    def _build_parse_result(self, namespaces, structs, services, enums, typedefs):
+        """ Namespaces the types in the definitions of the thrift file and consolidates them in a ThriftParseResult.
+
+        Services extending a service declared in the same file are linked to it.
+
+        :returns: the parse result of the thrift file on its own
+        :rtype: ThriftParseResult
 
         """
-        typedef_matches = ThriftParser.TYPEDEFS_REGEX.findall(self._thrift_content)
-        typedefs = {self._apply_namespace(alias): self._apply_namespace(field_type)
-                    for (field_type, alias) in typedef_matches}
-        return typedefs
+        namespaced_types = {}
+
+        def apply_namespace(field_type):
+            # Most fields share a handful of types, so each distinct type is only namespaced once
+            if field_type not in namespaced_types:
+                namespaced_types[field_type] = self._apply_namespace(field_type)
+            return namespaced_types[field_type]
+
+        for fields in structs.values():
+            for field in fields:
+                field.field_type = apply_namespace(field.field_type)
+        for _, endpoints in services.values():
+            for endpoint in endpoints.values():
+                endpoint.return_type = apply_namespace(endpoint.return_type)
+                for field in endpoint.fields.values() + endpoint.exceptions.values():
+                    field.field_type = apply_namespace(field.field_type)
+        structs = {apply_namespace(name): {field.name: field for field in fields} for name, fields in structs.items()}
+        services = {apply_namespace(name): (apply_namespace(extends), endpoints)
+                    for name, (extends, endpoints) in services.items()}
+        parse_result = ThriftParseResult(
+            {reference: ThriftStruct(reference, fields) for reference, fields in structs.items()},
+            {reference: ThriftService(reference, endpoints, extends)
+             for reference, (extends, endpoints) in services.items()},
+            {apply_namespace(name): values for name, values in enums.items()},
+            {apply_namespace(alias): apply_namespace(field_type) for alias, field_type in typedefs.items()},
+            {self._namespace: namespaces.get('py', namespaces.get('*', self._namespace))})
+        self._link_services(parse_result)
+        return parse_result
 
     def _apply_namespace(self, field_type):
         """ Applies the package namespace to the field type appropriately.
@@ -425,25 +790,11 @@ class ThriftParser(object):
         elem_type = types_string[split_index + 1:].strip()
         return 'map<%s, %s>' % (self._apply_namespace(key_type), self._apply_namespace(elem_type))
 
-    def _construct_field_from_field_match(self, field_match):
-        """ Construct a ThriftStruct.Field from a regex match on a field declaration.
-
-        :param field_match: a tuple of captured groups from the FIELDS_REGEX
-        :type field_match: tuple of (str, str, str, str, str)
-        :returns: a ThriftStruct.Field represented by the groups captured in the field declaration
-        :rtype: ThriftStruct.Field
-
-        """
-        (index, modifier, field_type, name, default) = field_match
-        field_type = self._apply_namespace(field_type)
-        required = True if modifier == 'required' else None
-        optional = True if modifier == 'optional' else None
-        default = default if len(default) else None
-        return ThriftStruct.Field(index, field_type, name, required=required, optional=optional, default=default)
-
     @staticmethod
     def _assign_field_indices(fields):
-        """ Assign indices to a list of fields to match thrift.
+        """ Assign indices to the fields in a list that were declared without one.
+
+        A field without an index follows the greatest index declared before it.
 
         :param fields: a list of ThriftStruct.Fields to assign indices to
         :type fields: list of ThriftStruct.Field
@@ -451,9 +802,9 @@ class ThriftParser(object):
         """
         last_index = 0
         for field in fields:
-            if not field.index or field.index <= last_index:
+            if field.index is None:
                 field.index = last_index + 1
-            last_index = field.index
+            last_index = max(last_index, field.index)
 
     @staticmethod
     def split_fields_string(fields_string, opening='<', closing='>', delim=','):
@@ -505,3 +856,16 @@ class ThriftParser(object):
             elif char == ',' and bracket_depth == 0:
                 return i
         return -1
+
+
+def _parse_file_in_process(thrift_path):
+    """ Parses a single thrift file in a pool process.
+
+    :param thrift_path: the path to the thrift file
+    :type thrift_path: str
+    :returns: the content of the file and its parse, as returned by ThriftParser._parse_file
+    :rtype: tuple
+
+    """
+    parser = ThriftParser(thrift_path, processes=1)
+    return parser._thrift_content, parser._parse_file()
@@ -0,0 +1,103 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from thrift.protocol import TBinaryProtocol, TCompactProtocol
+from thrift.transport import TTransport
+
+from .thrift_framed_transport import TZeroCopyFramedTransport
+from .thrift_cli_error import ThriftCLIError
+
+FINAGLE_PROTOCOL = 'finagle'
+BINARY_PROTOCOL = 'binary'
+ACCELERATED_BINARY_PROTOCOL = 'accelerated-binary'
+COMPACT_PROTOCOL = 'compact'
+HEADER_PROTOCOL = 'header'
+PROTOCOLS = [FINAGLE_PROTOCOL, BINARY_PROTOCOL, ACCELERATED_BINARY_PROTOCOL, COMPACT_PROTOCOL, HEADER_PROTOCOL]
+FRAMED_TRANSPORT = 'framed'
+BUFFERED_TRANSPORT = 'buffered'
+TRANSPORTS = [FRAMED_TRANSPORT, BUFFERED_TRANSPORT]
+
+
+def wrap_transport(socket_transport, transport=FRAMED_TRANSPORT, protocol=FINAGLE_PROTOCOL):
+    """ Wraps a socket in the transport that frames or buffers the bytes of a protocol.
+
+    Frames are read and written in place by TZeroCopyFramedTransport. The header protocol does its own framing, so its
+    socket is left unwrapped.
+
+    :param socket_transport: the transport of the socket connected to the server
+    :type socket_transport: TTransportBase
+    :param transport: one of TRANSPORTS
+    :type transport: str
+    :param protocol: one of PROTOCOLS
+    :type protocol: str
+    :rtype: TTransportBase
+    :raises: ThriftCLIError if the transport is unknown
+
+    """
+    if protocol == HEADER_PROTOCOL:
+        return socket_transport
+    if transport == FRAMED_TRANSPORT:
+        return TZeroCopyFramedTransport(socket_transport)
+    if transport == BUFFERED_TRANSPORT:
+        return TTransport.TBufferedTransport(socket_transport)
+    raise ThriftCLIError('Unknown transport: \'%s\', expected one of: %s' % (transport, ', '.join(TRANSPORTS)))
+
+
+def make_protocol(transport, protocol=FINAGLE_PROTOCOL, client_id=None):
+    """ Returns the protocol to make requests with over an open transport.
+
+    The finagle protocol negotiates finagle's request headers with the server as it is created, so the transport must
+    already be open. The accelerated binary and compact protocols encode and decode whole structs in C when thrift was
+    built with its C extension, and fall back to the pure python protocols when it was not.
+
+    :param transport: the open transport, as returned by wrap_transport
+    :type transport: TTransportBase
+    :param protocol: one of PROTOCOLS
+    :type protocol: str
+    :param client_id: Finagle client id for identifying requests, with the finagle protocol
+    :type client_id: str
+    :rtype: TProtocolBase
+    :raises: ThriftCLIError if the protocol is unknown, or not supported by the installed thrift
+
+    """
+    if protocol == FINAGLE_PROTOCOL:
+        # Imported here, since the finagle protocol is slow to import
+        from twitter.common.rpc.finagle.protocol import TFinagleProtocol
+        return TFinagleProtocol(transport, client_id=client_id)
+    if protocol == HEADER_PROTOCOL:
+        try:
+            from thrift.protocol.THeaderProtocol import THeaderProtocolFactory
+        except ImportError:
+            raise ThriftCLIError('The header protocol requires thrift 0.13 or later')
+        # The factory only accepts responses framed with headers, as a header client expects
+        return THeaderProtocolFactory().getProtocol(transport)
+    return get_protocol_factory(protocol).getProtocol(transport)
+
+
+def get_protocol_factory(protocol):
+    """ Returns the factory of a protocol that encodes messages without negotiating anything with the server.
+
+    :param protocol: one of PROTOCOLS other than the finagle and header protocols
+    :type protocol: str
+    :rtype: TProtocolFactory
+    :raises: ThriftCLIError if the protocol is unknown or negotiates with the server
+
+    """
+    if protocol == BINARY_PROTOCOL:
+        return TBinaryProtocol.TBinaryProtocolFactory()
+    if protocol == ACCELERATED_BINARY_PROTOCOL:
+        return TBinaryProtocol.TBinaryProtocolAcceleratedFactory()
+    if protocol == COMPACT_PROTOCOL:
+        return TCompactProtocol.TCompactProtocolAcceleratedFactory()
+    if protocol in PROTOCOLS:
+        raise ThriftCLIError('The %s protocol cannot be created from a factory' % protocol)
+    raise ThriftCLIError('Unknown protocol: \'%s\', expected one of: %s' % (protocol, ', '.join(PROTOCOLS)))
@@ -0,0 +1,109 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+
+class ThriftProxyTunneler(object):
+    """ Opens tunnels through an HTTP CONNECT proxy that authenticates with Kerberos, sharing the work between them.
+
+    One Kerberos auth handler is shared by every tunnel, and the service ticket it asks for is kept in the credential
+    cache, so only the first tunnel waits for the ticket. A new Proxy-Authorization header is generated for every
+    tunnel, since each holds a Kerberos authenticator that proxies with a replay cache refuse to accept twice. The
+    time taken to open each tunnel is recorded, so it can be reported apart from the time of the requests sent through
+    it.
+
+    """
+
+    def __init__(self, proxy_host, proxy_port):
+        """
+        :param proxy_host: the hostname of the proxy
+        :type proxy_host: str
+        :param proxy_port: the port of the proxy
+        :type proxy_port: int
+
+        """
+        self.proxy_host = proxy_host
+        self.proxy_port = int(proxy_port)
+        self._lock = threading.Lock()
+        self._auth = None
+        self._auth_headers_generated = 0
+        # The number of tunnels opened, and the total, minimum, and maximum seconds taken to open them
+        self._tunnels = 0
+        self._total_seconds = 0.0
+        self._min_seconds = None
+        self._max_seconds = None
+
+    def get_auth_header(self):
+        """ Returns a new Proxy-Authorization header to send with a CONNECT request.
+
+        :rtype: str
+
+        """
+        with self._lock:
+            if self._auth is None:
+                # Imported here, since requests_kerberos is slow to import and only needed with --proxy
+                import requests_kerberos
+                self._auth = requests_kerberos.HTTPKerberosAuth()
+            self._auth_headers_generated += 1
+            return self._auth.generate_request_header(None, self.proxy_host, is_preemptive=True)
+
+    def open_tunnel(self, host_port):
+        """ Connects to the proxy and asks it to open a tunnel to a server.
+
+        :param host_port: the address of the server to tunnel to
+        :type host_port: tuple of (str, int)
+        :returns: the socket of the tunnel, connected to the server through the proxy
+        :rtype: socket.socket
+
+        """
+        import httplib
+        started = time.time()
+        conn = httplib.HTTPConnection(self.proxy_host, self.proxy_port)
+        conn.set_tunnel(*host_port[:2], headers={'Proxy-Authorization': self.get_auth_header()})
+        try:
+            conn.connect()
+        except Exception:
+            conn.close()
+            raise
+        self.record_tunnel(time.time() - started)
+        return conn.sock
+
+    def record_tunnel(self, seconds):
+        """ Records the time taken to open a tunnel, for tunnels opened by the caller such as on the event loop.
+
+        :param seconds: the number of seconds from connecting to the proxy until the tunnel was open
+        :type seconds: float
+
+        """
+        with self._lock:
+            self._tunnels += 1
+            self._total_seconds += seconds
+            self._min_seconds = seconds if self._min_seconds is None else min(self._min_seconds, seconds)
+            self._max_seconds = seconds if self._max_seconds is None else max(self._max_seconds, seconds)
+
+    def summarize(self):
+        """ Returns the number of tunnels opened and headers generated, and the time taken to open the tunnels.
+
+        :returns: the counts, and the minimum, mean, and maximum milliseconds taken to open a tunnel, or None for the
+            times if no tunnel was opened
+        :rtype: dict
+
+        """
+        with self._lock:
+            summary = {'tunnels': self._tunnels, 'auth_headers': self._auth_headers_generated,
+                       'min': None, 'mean': None, 'max': None}
+            if self._tunnels:
+                summary.update(min=self._min_seconds * 1000, mean=self._total_seconds * 1000 / self._tunnels,
+                               max=self._max_seconds * 1000)
+            return summary
@@ -0,0 +1,703 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import errno
+import select
+import socket
+import ssl
+import struct
+import sys
+import threading
+import time
+
+from thrift.Thrift import TApplicationException, TMessageType
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+
+from .thrift_cli_error import ThriftCLIError
+from .thrift_protocols import FINAGLE_PROTOCOL, HEADER_PROTOCOL, get_protocol_factory
+from .thrift_proxy_tunneler import ThriftProxyTunneler
+
+# The method a client calls first to find out whether the server understands finagle request headers.
+FINAGLE_UPGRADE_METHOD = '__can__finagle__trace__v3__'
+# The number of bytes to read from a socket at once.
+RECV_SIZE = 65536
+
+
+class ThriftFuture(object):
+    """ The eventual result of a request submitted to a ThriftReactor.
+
+    Calling result waits for the request by running the reactor, which makes progress on every other request in flight
+    at the same time.
+
+    """
+
+    def __init__(self, reactor):
+        self._reactor = reactor
+        self._done = False
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        """ Returns whether the request completed, successfully or not.
+
+        :rtype: bool
+
+        """
+        return self._done
+
+    def result(self):
+        """ Returns the result of the request, running the reactor until it completes.
+
+        :returns: the value returned by the endpoint
+        :raises: the exception raised by the endpoint, or a TTransportException if the connection failed
+
+        """
+        self._reactor.run_until(self.done)
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        """ Returns the exception the request failed with, or None, running the reactor until it completes. """
+        self._reactor.run_until(self.done)
+        return self._exception
+
+    def add_done_callback(self, callback):
+        """ Calls a function with this future once the request completes, or right away if it already has.
+
+        :param callback: a function taking the future as its only argument
+        :type callback: callable
+
+        """
+        if self._done:
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def set_result(self, result):
+        self._complete(result, None)
+
+    def set_exception(self, exception):
+        self._complete(None, exception)
+
+    def _complete(self, result, exception):
+        self._result = result
+        self._exception = exception
+        self._done = True
+        for callback in self._callbacks:
+            callback(self)
+        self._callbacks = []
+
+
+class ThriftReactor(object):
+    """ Runs requests on a single-threaded event loop over non-blocking connections.
+
+    Requests are encoded by the send_<method> half of the service's Client and decoded by its recv_<method> half, each
+    over a memory buffer, while the event loop moves the framed bytes between the buffers and the sockets. Up to
+    max_connections connections are opened as requests are submitted. Connections may be tunneled through an HTTP
+    CONNECT proxy and may use TLS.
+
+    Every connection has up to pipeline_window requests in flight: their frames are written back to back without
+    waiting for replies, and each reply is matched to its request by sequence id.
+
+    With a load balancer, each request goes to the member its policy picks among the members with an idle connection,
+    or among every member while more connections may be opened, counting the requests outstanding on the connections
+    to each member. A member whose connection fails to open is ejected, and the requests waiting on the connection are
+    sent to other members instead while any are left.
+
+    The loop only runs while a caller waits on it, through ThriftFuture.result or run_until, and a reactor must only be
+    used from one thread.
+
+    """
+
+    def __init__(self, host, port, service_reference, max_connections=1, client_id=None, proxy=None,
+                 tls_context=None, pipeline_window=1, load_balancer=None, proxy_tunneler=None,
+                 protocol=FINAGLE_PROTOCOL):
+        """
+        :param host: the hostname of the server
+        :type host: str
+        :param port: the port of the server
+        :type port: int
+        :param service_reference: the namespaced service name, whose generated module provides the Client class
+        :type service_reference: str
+        :param max_connections: the number of connections to run requests on at once
+        :type max_connections: int
+        :param client_id: Finagle client id for identifying requests
+        :type client_id: str
+        :param proxy: [<proxy host>:<proxy port>] to tunnel connections through, or None
+        :type proxy: str
+        :param tls_context: the context to wrap connections in TLS with, or None to connect in plain text
+        :type tls_context: ThriftTLSContext
+        :param pipeline_window: the number of requests to have in flight on each connection at once
+        :type pipeline_window: int
+        :param load_balancer: if given, the balancer to spread requests over the members of a server set with, instead
+            of sending them all to the host and port
+        :type load_balancer: ThriftLoadBalancer
+        :param proxy_tunneler: the tunneler to share the proxy's auth header with and record tunnel times in, defaults
+            to one of the reactor's own when there is a proxy
+        :type proxy_tunneler: ThriftProxyTunneler
+        :param protocol: the protocol to encode requests with, one of PROTOCOLS other than the header protocol
+        :type protocol: str
+        :raises: ThriftCLIError if the protocol is not supported on non-blocking connections
+
+        """
+        self._address = (host, port)
+        self._service_reference = service_reference
+        self._max_connections = max_connections
+        self._client_id = client_id
+        self._proxy = proxy
+        if proxy and proxy_tunneler is None:
+            proxy_host, proxy_port = proxy.split(':')
+            proxy_tunneler = ThriftProxyTunneler(proxy_host, proxy_port)
+        self._proxy_tunneler = proxy_tunneler
+        self._tls_context = tls_context
+        self._pipeline_window = pipeline_window
+        self._load_balancer = load_balancer
+        if protocol == HEADER_PROTOCOL:
+            raise ThriftCLIError('The %s protocol is not supported on non-blocking connections' % protocol)
+        # Protocols other than finagle's encode requests without negotiating anything with the server first
+        self._protocol_factory = get_protocol_factory(protocol) if protocol != FINAGLE_PROTOCOL else None
+        self._idle_connections = []
+        self._connections = set([])
+        self._pending_requests = collections.deque()
+
+    def submit(self, method_name, request_args):
+        """ Submits a request to run on the next connection with room in its window, opening one if there is room.
+
+        :param method_name: the name of the method to call
+        :type method_name: str
+        :param request_args: keyword arguments to pass into the method call
+        :type request_args: dict
+        :returns: the future result of the call
+        :rtype: ThriftFuture
+
+        """
+        future = ThriftFuture(self)
+        self._pending_requests.append((future, method_name, request_args))
+        self._dispatch()
+        return future
+
+    def run_until(self, condition, timeout=None):
+        """ Runs the event loop until a condition holds.
+
+        :param condition: a function returning whether to stop
+        :type condition: callable
+        :param timeout: the number of seconds to wait for each socket event, or None to wait as long as needed
+        :type timeout: float
+        :raises: ThriftCLIError if the loop has nothing left to wait on before the condition holds
+
+        """
+        while not condition():
+            # Connections only become idle or close while the loop runs, so pending requests are assigned here
+            self._dispatch()
+            if condition():
+                break
+            if not any(connection.events for connection in self._connections):
+                raise ThriftCLIError('The event loop has no requests in flight to wait on')
+            self._run_once(timeout)
+
+    def close(self):
+        """ Closes every connection and fails the requests that were still pending. """
+        for connection in list(self._connections):
+            connection.fail(TTransport.TTransportException(TTransport.TTransportException.NOT_OPEN,
+                                                           'The connection was closed'))
+        while self._pending_requests:
+            future, _, _ = self._pending_requests.popleft()
+            future.set_exception(ThriftCLIError('The event loop was closed before the request was sent'))
+
+    def _dispatch(self):
+        """ Assigns pending requests to connections with room in their window, opening new connections while allowed.
+
+        The idle connections are the ones with room for another request, whether or not they have requests in flight.
+
+        """
+        while self._pending_requests:
+            if self._load_balancer is not None:
+                connection = self._choose_connection()
+                if connection is None:
+                    return
+            elif self._idle_connections:
+                connection = self._idle_connections[-1]
+            elif len(self._connections) < self._max_connections:
+                connection = self._open_connection(self._address)
+            else:
+                return
+            connection.start_request(*self._pending_requests.popleft())
+            if not connection.has_room() and connection in self._idle_connections:
+                self._idle_connections.remove(connection)
+
+    def _choose_connection(self):
+        """ Returns a connection with room to the member the load balancer picks, or None if none may take a request.
+        """
+        idle_members = set(connection.member for connection in self._idle_connections)
+        can_open = len(self._connections) < self._max_connections
+        members = [member for member in self._load_balancer.get_available() if can_open or member in idle_members]
+        if not members:
+            # Only ejected members have idle connections, which still work
+            members = sorted(idle_members)
+        if not members:
+            return None
+        outstanding = collections.Counter()
+        for connection in self._connections:
+            outstanding[connection.member] += connection.outstanding()
+        member = self._load_balancer.choose(members, outstanding)
+        for connection in reversed(self._idle_connections):
+            if connection.member == member:
+                return connection
+        host, _, port = member.rpartition(':')
+        return self._open_connection((host, int(port)), member)
+
+    def _open_connection(self, address, member=None):
+        connection = _Connection(self, address, member)
+        self._connections.add(connection)
+        self._idle_connections.append(connection)
+        return connection
+
+    def _eject(self, connection):
+        """ Ejects the member a connection failed to open to, returning whether other members are left to send to. """
+        if self._load_balancer is None:
+            return False
+        self._load_balancer.eject(connection.member)
+        return bool(self._load_balancer.get_available())
+
+    def _on_idle(self, connection):
+        if connection not in self._idle_connections:
+            self._idle_connections.append(connection)
+
+    def _on_closed(self, connection):
+        self._connections.discard(connection)
+        if connection in self._idle_connections:
+            self._idle_connections.remove(connection)
+
+    def _run_once(self, timeout):
+        """ Waits for socket events on the busy connections and handles them. """
+        busy_connections = [connection for connection in self._connections if connection.events]
+        if hasattr(select, 'poll'):
+            poller = select.poll()
+            by_fileno = {}
+            for connection in busy_connections:
+                by_fileno[connection.fileno()] = connection
+                poller.register(connection.fileno(), (select.POLLIN if connection.events & _READ else 0) |
+                                (select.POLLOUT if connection.events & _WRITE else 0))
+            events = poller.poll(None if timeout is None else timeout * 1000)
+            ready = [(by_fileno[fileno], event) for fileno, event in events]
+        else:
+            readers = [connection for connection in busy_connections if connection.events & _READ]
+            writers = [connection for connection in busy_connections if connection.events & _WRITE]
+            readable, writable, _ = select.select(readers, writers, [], timeout)
+            ready = [(connection, select.POLLIN) for connection in readable] + \
+                    [(connection, select.POLLOUT) for connection in writable]
+        for connection, _ in ready:
+            if connection in self._connections:
+                connection.on_ready()
+
+    def _get_client_class(self):
+        return sys.modules[self._service_reference].Client
+
+
+_READ = 1
+_WRITE = 2
+
+
+class _Connection(object):
+    """ A non-blocking connection, advanced by the reactor whenever its socket is ready.
+
+    A connection goes through the following states:
+    1. Connecting the socket, then sending an HTTP CONNECT request and reading its response if there is a proxy
+    2. Performing the TLS handshake, if there is a TLS context
+    3. Asking the server to upgrade the connection to finagle's protocol, if it uses the finagle protocol
+    4. Running requests, up to the reactor's pipeline window at once, until it fails or is closed
+
+    A connection is opened for its first request. Requests started before it is established wait to be sent, and fail
+    along with every request in flight if the connection fails, unless the reactor sends them to another member of its
+    load balancer because the connection failed to open.
+
+    """
+
+    CONNECTING, PROXYING, HANDSHAKING, UPGRADING, OPEN, CLOSED = range(6)
+
+    def __init__(self, reactor, address, member=None):
+        self._reactor = reactor
+        self._address = address
+        # The address of the load balancer's member the connection is to, if any
+        self.member = member
+        self._socket = None
+        self._state = None
+        # The bytes to send, from _outgoing_start on, appended to in place rather than copied for every request
+        self._outgoing = bytearray()
+        self._outgoing_start = 0
+        # The bytes received, from _incoming_start up to _incoming_end, read into in place with recv_into
+        self._incoming = bytearray(RECV_SIZE)
+        self._incoming_start = 0
+        self._incoming_end = 0
+        self._finagle_upgraded = False
+        # When the socket started connecting to the proxy, to time the tunnel
+        self._connect_started = None
+        # Requests waiting for the connection to be established, as (future, method name, request args)
+        self._unsent_requests = collections.deque()
+        # Requests waiting for their replies, as (future, method name) keyed by sequence id
+        self._requests_in_flight = {}
+        self._next_seqid = 0
+        self.events = 0
+
+    def fileno(self):
+        return self._socket.fileno()
+
+    def outstanding(self):
+        """ Returns the number of requests started on the connection that have not completed. """
+        return len(self._unsent_requests) + len(self._requests_in_flight)
+
+    def has_room(self):
+        """ Returns whether the connection can take another request without going over the pipeline window.
+
+        :rtype: bool
+
+        """
+        return self._state != _Connection.CLOSED and self.outstanding() < self._reactor._pipeline_window
+
+    def start_request(self, future, method_name, request_args):
+        """ Encodes a request and starts sending it, connecting first if the connection is new. """
+        self._unsent_requests.append((future, method_name, request_args))
+        try:
+            if self._state is None:
+                self._connect()
+            elif self._state == _Connection.OPEN:
+                self._send_requests()
+        except Exception as e:
+            self.fail(e)
+
+    def on_ready(self):
+        """ Advances the connection as far as its socket allows. """
+        try:
+            self._advance()
+        except Exception as e:
+            self.fail(e)
+
+    def fail(self, exception):
+        """ Closes the connection and fails its requests, in the order they were started. """
+        failed_to_open = self._state in (None, _Connection.CONNECTING, _Connection.PROXYING, _Connection.HANDSHAKING)
+        if self._socket is not None:
+            self._socket.close()
+        self._state = _Connection.CLOSED
+        self.events = 0
+        unsent_requests = list(self._unsent_requests)
+        futures = [future for _, (future, _) in sorted(self._requests_in_flight.items())]
+        futures.extend(future for future, _, _ in unsent_requests)
+        self._requests_in_flight = {}
+        self._unsent_requests.clear()
+        self._reactor._on_closed(self)
+        if failed_to_open and self._reactor._eject(self):
+            # None of the requests were sent, so they are sent to another member, ahead of the later requests
+            self._reactor._pending_requests.extendleft(reversed(unsent_requests))
+            return
+        if isinstance(exception, (socket.error, ssl.SSLError)):
+            exception = TTransport.TTransportException(TTransport.TTransportException.UNKNOWN, str(exception))
+        for future in futures:
+            future.set_exception(exception)
+
+    def _connect(self):
+        reactor = self._reactor
+        if reactor._proxy:
+            address = (reactor._proxy_tunneler.proxy_host, reactor._proxy_tunneler.proxy_port)
+            self._connect_started = time.time()
+        else:
+            address = self._address
+        family, socket_type, protocol, _, socket_address = socket.getaddrinfo(
+            address[0], address[1], socket.AF_UNSPEC, socket.SOCK_STREAM)[0]
+        self._socket = socket.socket(family, socket_type, protocol)
+        self._socket.setblocking(False)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        result = self._socket.connect_ex(socket_address)
+        if result not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            raise socket.error(result, 'Could not connect to %s:%d' % address)
+        self._state = _Connection.CONNECTING
+        self.events = _WRITE
+
+    def _advance(self):
+        """ Runs the state machine until the connection has to wait for its socket. """
+        while True:
+            state = self._state
+            if state == _Connection.CONNECTING:
+                error = self._socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if error:
+                    raise socket.error(error, 'Could not connect to %s:%d' % self._address)
+                if self._reactor._proxy:
+                    self._outgoing += self._make_proxy_request()
+                    self._state = _Connection.PROXYING
+                else:
+                    self._start_handshake()
+            elif state == _Connection.PROXYING:
+                if not self._send() or not self._receive():
+                    return
+                end = self._incoming.find('\r\n\r\n', self._incoming_start, self._incoming_end)
+                if end == -1:
+                    return
+                response = str(buffer(self._incoming, self._incoming_start, end - self._incoming_start))
+                self._incoming_start = end + 4
+                status_line = response.split('\r\n', 1)[0]
+                if status_line.split(' ')[1:2] != ['200']:
+                    raise TTransport.TTransportException(TTransport.TTransportException.NOT_OPEN,
+                                                         'Proxy refused to connect: %s' % status_line)
+                self._reactor._proxy_tunneler.record_tunnel(time.time() - self._connect_started)
+                self._start_handshake()
+            elif state == _Connection.HANDSHAKING:
+                try:
+                    self._socket.do_handshake()
+                except ssl.SSLWantReadError:
+                    self.events = _READ
+                    return
+                except ssl.SSLWantWriteError:
+                    self.events = _WRITE
+                    return
+                self._reactor._tls_context.record_handshake()
+                self._start_upgrade()
+            elif state == _Connection.UPGRADING:
+                payload = self._send_and_receive_frame()
+                if payload is None:
+                    return
+                self._finagle_upgraded = _read_upgrade_reply(payload)
+                self._state = _Connection.OPEN
+                self._send_requests()
+            elif state == _Connection.OPEN:
+                # Replies are read while requests are still being written, so neither side waits on the other
+                self._send()
+                if self._requests_in_flight:
+                    self._receive()
+                    self._finish_requests()
+                self._update_events()
+                return
+            else:
+                return
+
+    def _start_handshake(self):
+        tls_context = self._reactor._tls_context
+        if tls_context is None:
+            self._start_upgrade()
+            return
+        self._socket = tls_context.wrap_socket(self._socket, self._address[0], do_handshake_on_connect=False)
+        self._state = _Connection.HANDSHAKING
+
+    def _start_upgrade(self):
+        if self._reactor._protocol_factory is not None:
+            # Only finagle's protocol is upgraded, so the connection is ready for requests
+            self._state = _Connection.OPEN
+            self._send_requests()
+            return
+        from gen.twitter.finagle.thrift.ttypes import ConnectionOptions
+        buffer = TTransport.TMemoryBuffer()
+        protocol = TBinaryProtocol.TBinaryProtocol(buffer)
+        protocol.writeMessageBegin(FINAGLE_UPGRADE_METHOD, TMessageType.CALL, 0)
+        ConnectionOptions().write(protocol)
+        protocol.writeMessageEnd()
+        self._append_frame(buffer.getvalue())
+        self._state = _Connection.UPGRADING
+
+    def _make_proxy_request(self):
+        host, port = self._address
+        auth_header = self._reactor._proxy_tunneler.get_auth_header()
+        return 'CONNECT %s:%d HTTP/1.0\r\nHost: %s:%d\r\nProxy-Authorization: %s\r\n\r\n' % (
+            host, port, host, port, auth_header)
+
+    def _send_requests(self):
+        """ Encodes the unsent requests with the Client's send half, numbering them with sequence ids. """
+        client_class = self._reactor._get_client_class()
+        while self._unsent_requests:
+            future, method_name, request_args = self._unsent_requests.popleft()
+            buffer = TTransport.TMemoryBuffer()
+            client = client_class(self._make_protocol(buffer))
+            seqid = self._next_seqid
+            self._next_seqid = (seqid + 1) & 0x7fffffff
+            client._seqid = seqid
+            try:
+                getattr(client, 'send_%s' % method_name)(**request_args)
+            except Exception as e:
+                # The request could not be encoded, so nothing was sent and the connection can be reused
+                future.set_exception(e)
+                continue
+            self._append_frame(buffer.getvalue())
+            if hasattr(client, 'recv_%s' % method_name):
+                self._requests_in_flight[seqid] = (future, method_name)
+            else:
+                # Oneway requests have no response to wait for
+                future.set_result(None)
+        self._update_events()
+
+    def _finish_requests(self):
+        """ Decodes every complete reply with the Client's recv half, completing the request with its sequence id. """
+        while self._requests_in_flight:
+            payload = self._read_frame()
+            if payload is None:
+                return
+            seqid = self._make_protocol(TTransport.TMemoryBuffer(payload)).readMessageBegin()[2]
+            if seqid not in self._requests_in_flight:
+                raise ThriftCLIError('Received a response to an unknown request, with sequence id %d' % seqid)
+            future, method_name = self._requests_in_flight.pop(seqid)
+            client = self._reactor._get_client_class()(self._make_protocol(TTransport.TMemoryBuffer(payload)))
+            try:
+                result = getattr(client, 'recv_%s' % method_name)()
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def _update_events(self):
+        """ Waits to write any unsent bytes and to read replies, or becomes idle if there is room for a request. """
+        has_outgoing = self._outgoing_start < len(self._outgoing)
+        self.events = (_WRITE if has_outgoing else 0) | (_READ if self._requests_in_flight else 0)
+        if self.has_room():
+            self._reactor._on_idle(self)
+
+    def _make_protocol(self, buffer):
+        if self._reactor._protocol_factory is not None:
+            return self._reactor._protocol_factory.getProtocol(buffer)
+        return _make_buffered_protocol(buffer, self._reactor._client_id, self._finagle_upgraded)
+
+    def _send_and_receive_frame(self):
+        """ Sends the outgoing bytes and reads a frame, returning its payload once all of it arrived. """
+        if not self._send() or not self._receive():
+            return None
+        payload = self._read_frame()
+        if payload is None:
+            self.events = _READ
+        return payload
+
+    def _append_frame(self, payload):
+        """ Appends a payload to the outgoing bytes, prefixed with its length the way TFramedTransport sends it. """
+        if self._outgoing_start and self._outgoing_start >= len(self._outgoing) // 2:
+            # Drops the bytes already sent once they are at least half the buffer, so each byte is moved at most once
+            del self._outgoing[:self._outgoing_start]
+            self._outgoing_start = 0
+        self._outgoing += struct.pack('!i', len(payload))
+        self._outgoing += payload
+
+    def _read_frame(self):
+        """ Removes a frame from the incoming bytes and returns its payload, or None if all of it has not arrived. """
+        available = self._incoming_end - self._incoming_start
+        if available >= 4:
+            length = struct.unpack_from('!i', self._incoming, self._incoming_start)[0]
+            if available >= 4 + length:
+                start = self._incoming_start + 4
+                payload = str(buffer(self._incoming, start, length))
+                self._incoming_start = start + length
+                if self._incoming_start == self._incoming_end:
+                    self._incoming_start = self._incoming_end = 0
+                return payload
+        return None
+
+    def _send(self):
+        """ Sends as many outgoing bytes as the socket accepts, returning whether all of them were sent. """
+        while self._outgoing_start < len(self._outgoing):
+            try:
+                sent = self._socket.send(memoryview(self._outgoing)[self._outgoing_start:])
+            except ssl.SSLWantWriteError:
+                sent = 0
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+                sent = 0
+            if not sent:
+                self.events = _WRITE
+                return False
+            self._outgoing_start += sent
+        del self._outgoing[:]
+        self._outgoing_start = 0
+        return True
+
+    def _receive(self):
+        """ Reads the bytes available on the socket, returning False if it was closed by the server. """
+        while True:
+            self._make_room_to_receive()
+            try:
+                received = self._socket.recv_into(memoryview(self._incoming)[self._incoming_end:])
+            except ssl.SSLWantReadError:
+                break
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+                break
+            if not received:
+                raise TTransport.TTransportException(TTransport.TTransportException.END_OF_FILE,
+                                                     'The server closed the connection')
+            self._incoming_end += received
+        self.events = _READ
+        return True
+
+    def _make_room_to_receive(self):
+        """ Makes room for at least RECV_SIZE more bytes after the incoming ones, moving or growing the buffer. """
+        if len(self._incoming) - self._incoming_end >= RECV_SIZE:
+            return
+        if self._incoming_start:
+            # Only the bytes of frames that have not fully arrived are moved to the front
+            unread = self._incoming_end - self._incoming_start
+            self._incoming[:unread] = self._incoming[self._incoming_start:self._incoming_end]
+            self._incoming_start, self._incoming_end = 0, unread
+        if len(self._incoming) - self._incoming_end < RECV_SIZE:
+            # Doubling the buffer copies each received byte a constant number of times on average
+            self._incoming.extend(bytearray(max(RECV_SIZE, len(self._incoming))))
+
+
+def wait_first(futures, timeout=None):
+    """ Runs the reactor until any of the futures completes, like concurrent.futures.wait with FIRST_COMPLETED.
+
+    :param futures: futures submitted to the same reactor
+    :type futures: iterable of ThriftFuture
+    :param timeout: the number of seconds to wait at most, or None to wait until a future completes
+    :type timeout: float
+    :returns: the futures that completed
+    :rtype: list of ThriftFuture
+
+    """
+    futures = list(futures)
+    if not futures:
+        return []
+    deadline = None if timeout is None else time.time() + timeout
+
+    def any_done():
+        return any(future.done() for future in futures) or (deadline is not None and time.time() >= deadline)
+
+    futures[0]._reactor.run_until(any_done, timeout)
+    return [future for future in futures if future.done()]
+
+
+def _make_buffered_protocol(trans, client_id, finagle_upgraded):
+    """ Returns a TFinagleProtocol over a memory buffer, for a connection whose upgrade the reactor already negotiated.
+    """
+    from gen.twitter.finagle.thrift.ttypes import ClientId
+    from twitter.common.rpc.finagle.protocol import TFinagleProtocol
+    # TFinagleProtocol.__init__ would negotiate the upgrade over the buffer, which has no server behind it
+    protocol = TFinagleProtocol.__new__(TFinagleProtocol)
+    TBinaryProtocol.TBinaryProtocolAccelerated.__init__(protocol, trans)
+    protocol._locals = threading.local()
+    protocol._finagle_upgraded = finagle_upgraded
+    protocol._client_id = ClientId(name=client_id) if client_id else None
+    return protocol
+
+
+def _read_upgrade_reply(payload):
+    """ Returns whether the server accepted the finagle upgrade, given its response.
+
+    :raises: ThriftCLIError
+
+    """
+    from gen.twitter.finagle.thrift.ttypes import UpgradeReply
+    protocol = TBinaryProtocol.TBinaryProtocol(TTransport.TMemoryBuffer(payload))
+    method_name, message_type, _ = protocol.readMessageBegin()
+    if method_name != FINAGLE_UPGRADE_METHOD:
+        raise ThriftCLIError('Unexpected response to the finagle upgrade: \'%s\'' % method_name)
+    if message_type == TMessageType.EXCEPTION:
+        TApplicationException().read(protocol)
+        return False
+    UpgradeReply().read(protocol)
+    return True
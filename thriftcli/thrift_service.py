@@ -14,11 +14,13 @@ class ThriftService(object):
     """ Provides a representation of a service declared in thrift. """
 
     class Endpoint(object):
-        def __init__(self, return_type, name, fields=None, oneway=False):
+        def __init__(self, return_type, name, fields=None, oneway=False, exceptions=None):
             self.return_type = return_type
             self.name = name
             self.fields = fields if fields is not None else {}
             self.oneway = True if oneway else False
+            # The exceptions declared by the endpoint's throws clause, as fields by name
+            self.exceptions = exceptions if exceptions is not None else {}
 
         def __eq__(self, other):
             return type(other) is type(self) and self.__dict__ == other.__dict__
@@ -50,3 +52,7 @@ class ThriftService(object):
     def __str__(self):
         return self.reference + (' extends %s' % self.extends if self.extends is not None else '') + \
                ''.join(['\n\t%s' % str(endpoint) for endpoint in self.endpoints.values()])
+
+
+# Pickle looks nested classes up by their unqualified name in the module they were defined in.
+Endpoint = ThriftService.Endpoint
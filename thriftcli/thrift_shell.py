@@ -0,0 +1,219 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import cmd
+import time
+
+from thrift.transport import TTransport
+
+from .request_body_converter import convert
+from .thrift_type import ThriftType
+
+
+class ThriftShell(cmd.Cmd):
+    """ An interactive shell making requests to one service, over a ThriftCLI kept open between them.
+
+    A line starting with a method name runs that method, with the rest of the line as its request body in any format
+    accepted by --body. Method names and the field names of request bodies complete with tab, and every request reports
+    how long it took. If the connection was closed, such as by a server that timed it out while idle, it is reopened
+    and the request is sent again.
+
+    """
+
+    intro = 'Type a method name and its request body, such as: method {"field": 1}. Type help for commands.'
+
+    def __init__(self, cli, return_json=True, stdin=None, stdout=None):
+        """
+        :param cli: the ThriftCLI to make requests with
+        :type cli: ThriftCLI
+        :param return_json: whether to print results in JSON format
+        :type return_json: bool
+        :param stdin: the file to read commands from, defaults to sys.stdin
+        :type stdin: file
+        :param stdout: the file to write results to, defaults to sys.stdout
+        :type stdout: file
+
+        """
+        cmd.Cmd.__init__(self, stdin=stdin, stdout=stdout)
+        if stdin is not None:
+            self.use_rawinput = False
+        self._cli = cli
+        self._parse_result = cli.get_parse_result()
+        self._endpoints = cli.get_endpoints()
+        self._return_json = return_json
+        self.prompt = '%s> ' % cli.get_service_name()
+
+    def default(self, line):
+        """ Runs the method named at the start of the line with the rest of the line as its request body. """
+        method_name, _, request_body = line.partition(' ')
+        if method_name not in self._endpoints:
+            self._print('Unknown method or command \'%s\', type methods to list the methods' % method_name)
+            return
+        started = time.time()
+        try:
+            request_body = convert(request_body.strip()) if request_body.strip() else {}
+            try:
+                result = self._cli.run(method_name, request_body, self._return_json)
+            except TTransport.TTransportException:
+                self._print('Reconnecting')
+                self._cli.reconnect()
+                started = time.time()
+                result = self._cli.run(method_name, request_body, self._return_json)
+        except Exception as e:
+            self._print('%s: %s' % (type(e).__name__, e))
+        else:
+            if result is not None:
+                self._print(result)
+        self._print('(%.1f ms)' % ((time.time() - started) * 1000))
+
+    def emptyline(self):
+        # The default would repeat the last request
+        pass
+
+    def do_methods(self, _):
+        """ methods: lists the methods of the service and their arguments. """
+        for method_name in sorted(self._endpoints):
+            self._print(str(self._endpoints[method_name]))
+
+    def do_describe(self, name):
+        """ describe <method or struct>: lists the fields of a method's request body or of a struct. """
+        name = name.strip()
+        if name in self._endpoints:
+            fields = self._endpoints[name].fields
+        else:
+            struct = self._find_struct(name)
+            if struct is None:
+                self._print('Unknown method or struct \'%s\'' % name)
+                return
+            fields = struct.fields
+        for field in sorted(fields.values(), key=lambda field: field.index):
+            self._print(str(field))
+
+    def complete_describe(self, text, *_):
+        names = list(self._endpoints) + [reference.split('.')[-1] for reference in self._parse_result.structs]
+        return sorted(set(name for name in names if name.startswith(text)))
+
+    def do_json(self, arg):
+        """ json [on|off]: shows or sets whether results are printed in JSON format. """
+        if arg.strip() in ('on', 'off'):
+            self._return_json = arg.strip() == 'on'
+        self._print('json is %s' % ('on' if self._return_json else 'off'))
+
+    def do_reconnect(self, _):
+        """ reconnect: closes the connection to the server and opens a new one. """
+        self._cli.reconnect()
+
+    def do_exit(self, _):
+        """ exit: leaves the shell. """
+        return True
+
+    do_quit = do_exit
+
+    def do_EOF(self, _):
+        self._print('')
+        return True
+
+    def completenames(self, text, *_):
+        names = cmd.Cmd.completenames(self, text) + [name for name in self._endpoints if name.startswith(text)]
+        return sorted(set(name for name in names if name != 'EOF'))
+
+    def completedefault(self, text, line, begidx, _):
+        """ Completes the field names of the struct being written in a request body. """
+        method_name, _, request_body = line[:begidx].partition(' ')
+        if method_name not in self._endpoints:
+            return []
+        fields = self.get_fields_at(method_name, request_body)
+        if fields is None:
+            return []
+        return sorted(name for name in fields if name.startswith(text))
+
+    def get_fields_at(self, method_name, request_body):
+        """ Returns the fields of the struct that the end of a partial JSON request body is inside of.
+
+        :param method_name: the method the request body is for
+        :type method_name: str
+        :param request_body: the request body up to where fields are being completed
+        :type request_body: str
+        :returns: the fields by name, or None if the end of the body is not inside a struct
+        :rtype: dict of str to ThriftStruct.Field
+
+        """
+        # Each open object or array, as the fields of a struct, the type of a map or list, or None if unknown
+        scopes = []
+        key = None
+        in_string = False
+        escaped = False
+        string = []
+        last_string = None
+        for char in request_body:
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+                    last_string = ''.join(string)
+                else:
+                    string.append(char)
+            elif char == '"':
+                in_string = True
+                string = []
+            elif char == ':':
+                key = last_string
+            elif char in '{[':
+                if not scopes:
+                    scopes.append(self._endpoints[method_name].fields if char == '{' else None)
+                else:
+                    scopes.append(self._get_scope(self._get_value_type(scopes[-1], key)))
+                key = None
+            elif char in '}]':
+                if scopes:
+                    scopes.pop()
+                key = None
+            elif char == ',':
+                key = None
+        if not scopes or not isinstance(scopes[-1], dict):
+            return None
+        return scopes[-1]
+
+    @staticmethod
+    def _get_value_type(scope, key):
+        """ Returns the type of the values in an open object or array, given the key being written in an object. """
+        if isinstance(scope, dict):
+            field = scope.get(key)
+            return field.type_node if field is not None else None
+        if isinstance(scope, ThriftType):
+            # A map's values, or a list's or set's elements
+            return scope.args[-1]
+        return None
+
+    def _get_scope(self, value_type):
+        if value_type is None:
+            return None
+        if value_type.kind == ThriftType.STRUCT:
+            struct = self._parse_result.structs.get(value_type.name)
+            return struct.fields if struct is not None else None
+        if value_type.kind in (ThriftType.LIST, ThriftType.SET, ThriftType.MAP):
+            return value_type
+        return None
+
+    def _find_struct(self, name):
+        if name in self._parse_result.structs:
+            return self._parse_result.structs[name]
+        for reference, struct in self._parse_result.structs.iteritems():
+            if reference.split('.')[-1] == name:
+                return struct
+        return None
+
+    def _print(self, text):
+        self.stdout.write('%s\n' % text)
@@ -20,7 +20,7 @@ class ThriftStruct(object):
         def __init__(self, index, field_type, name, **kwargs):
             try:
                 self.index = int(index)
-            except ValueError:
+            except (TypeError, ValueError):
                 self.index = None
             self.field_type = field_type
             self.name = name
@@ -34,9 +34,13 @@ class ThriftStruct(object):
             self.optional = (optional_explicit if optional_explicit is not None else True) and not required_explicit
             self.required = not self.optional and kwargs.get('required', True)
             self.modifier = 'required' if self.required else 'optional' if optional_explicit else ''
+            # The ThriftType that field_type resolves to, which is set once the whole include graph is parsed
+            self.type_node = None
 
         def __eq__(self, other):
-            return type(other) is type(self) and self.__dict__ == other.__dict__
+            # type_node follows from field_type and the typedefs in scope, so it is left out of the comparison
+            return type(other) is type(self) and \
+                dict(self.__dict__, type_node=None) == dict(other.__dict__, type_node=None)
 
         def __ne__(self, other):
             return not self.__eq__(other)
@@ -64,3 +68,7 @@ class ThriftStruct(object):
     def __str__(self):
         sorted_fields = sorted(self.fields.values(), key=lambda field: field.index)
         return '%s ' % self.reference + ''.join(['\n\t%s' % str(field) for field in sorted_fields])
+
+
+# Pickle looks nested classes up by their unqualified name in the module they were defined in.
+Field = ThriftStruct.Field
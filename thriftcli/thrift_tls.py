@@ -0,0 +1,104 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ssl
+import threading
+
+_tls_contexts = {}
+_tls_contexts_lock = threading.Lock()
+
+
+def get_tls_context(tls_key_path, verify_mode, ssl_version=ssl.PROTOCOL_SSLv23):
+    """ Returns the TLS context shared by every connection with the same key file, verification mode and version.
+
+    :param tls_key_path: the path to the key file to present as the client certificate and trust as a certificate
+        authority, or None to present no certificate and trust the system's authorities
+    :type tls_key_path: str
+    :param verify_mode: how to verify the server's certificate, one of ssl.CERT_NONE, CERT_OPTIONAL, or CERT_REQUIRED
+    :type verify_mode: int
+    :param ssl_version: the TLS version to connect with, one of the ssl.PROTOCOL_* constants
+    :type ssl_version: int
+    :rtype: ThriftTLSContext
+
+    """
+    key = (tls_key_path, verify_mode, ssl_version)
+    with _tls_contexts_lock:
+        if key not in _tls_contexts:
+            _tls_contexts[key] = ThriftTLSContext(tls_key_path, verify_mode, ssl_version)
+        return _tls_contexts[key]
+
+
+class ThriftTLSContext(object):
+    """ Wraps connections in TLS with one SSLContext, so the key file is loaded once rather than per connection.
+
+    The context presents the key file as the client certificate and trusts it as a certificate authority, and does not
+    validate the server's hostname. Each handshake is counted. Python 2.7's ssl module cannot resume sessions, so every
+    handshake is a full one.
+
+    """
+
+    def __init__(self, tls_key_path, verify_mode, ssl_version=ssl.PROTOCOL_SSLv23):
+        """
+        :param tls_key_path: the path to the key file, or None to present no certificate
+        :type tls_key_path: str
+        :param verify_mode: how to verify the server's certificate, one of the ssl.CERT_* constants
+        :type verify_mode: int
+        :param ssl_version: the TLS version to connect with, one of the ssl.PROTOCOL_* constants
+        :type ssl_version: int
+
+        """
+        ssl_context = ssl.SSLContext(ssl_version)
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = verify_mode
+        if tls_key_path is not None:
+            ssl_context.load_cert_chain(tls_key_path, tls_key_path)
+            ssl_context.load_verify_locations(tls_key_path)
+        elif verify_mode != ssl.CERT_NONE:
+            ssl_context.load_default_certs()
+        self.ssl_context = ssl_context
+        self._lock = threading.Lock()
+        self._handshakes = 0
+
+    def wrap_socket(self, sock, server_hostname, do_handshake_on_connect=True):
+        """ Wraps a connected socket in TLS.
+
+        When the handshake is done on connect, it is recorded before returning. Otherwise, the caller calls
+        record_handshake once it completes.
+
+        :param sock: the socket connected to the server
+        :type sock: socket.socket
+        :param server_hostname: the hostname of the server
+        :type server_hostname: str
+        :param do_handshake_on_connect: whether to perform the handshake before returning
+        :type do_handshake_on_connect: bool
+        :rtype: ssl.SSLSocket
+
+        """
+        ssl_socket = self.ssl_context.wrap_socket(sock, server_hostname=server_hostname,
+                                                  do_handshake_on_connect=do_handshake_on_connect)
+        if do_handshake_on_connect:
+            self.record_handshake()
+        return ssl_socket
+
+    def record_handshake(self):
+        """ Counts a completed handshake. """
+        with self._lock:
+            self._handshakes += 1
+
+    def summarize(self):
+        """ Returns the number of handshakes done.
+
+        :rtype: dict
+
+        """
+        with self._lock:
+            return {'handshakes': self._handshakes}
@@ -0,0 +1,80 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+class ThriftType(object):
+    """ Provides an immutable representation of a resolved field type, such as map<string, list<package.Struct>>.
+
+    Typedefs are resolved, so a type is one of the following kinds:
+    - BASE, named by a base type such as 'i64' or 'string', or by a type that was never declared
+    - STRUCT or ENUM, named by its reference, such as 'package.Struct'
+    - LIST or SET, whose args are its element type
+    - MAP, whose args are its key and value types
+
+    Types are interned: ThriftType.get returns the same object for the same kind, name, and args, so types can be
+    compared by identity and used as dict keys without hashing their structure.
+
+    """
+
+    BASE = 'base'
+    STRUCT = 'struct'
+    ENUM = 'enum'
+    LIST = 'list'
+    SET = 'set'
+    MAP = 'map'
+
+    __slots__ = ('kind', 'name', 'args')
+
+    _interned = {}
+
+    @staticmethod
+    def get(kind, name, args=()):
+        """ Returns the type of a given kind, creating it the first time it is requested.
+
+        :param kind: one of ThriftType.BASE, STRUCT, ENUM, LIST, SET, or MAP
+        :type kind: str
+        :param name: the name of a base type, the reference of a struct or enum, or the kind of a container
+        :type name: str
+        :param args: the element type of a list or set, or the key and value types of a map
+        :type args: tuple of ThriftType
+        :rtype: ThriftType
+
+        """
+        key = (kind, name, args)
+        thrift_type = ThriftType._interned.get(key)
+        if thrift_type is None:
+            thrift_type = object.__new__(ThriftType)
+            object.__setattr__(thrift_type, 'kind', kind)
+            object.__setattr__(thrift_type, 'name', name)
+            object.__setattr__(thrift_type, 'args', args)
+            thrift_type = ThriftType._interned.setdefault(key, thrift_type)
+        return thrift_type
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ThriftType is immutable')
+
+    def __reduce__(self):
+        # Unpickled types are interned again rather than copied
+        return _get_thrift_type, (self.kind, self.name, self.args)
+
+    def __repr__(self):
+        return 'ThriftType(%s)' % str(self)
+
+    def __str__(self):
+        if self.args:
+            return '%s<%s>' % (self.name, ', '.join(str(arg) for arg in self.args))
+        return self.name
+
+
+def _get_thrift_type(kind, name, args):
+    """ Returns an interned ThriftType, for pickle to call by name when it loads one. """
+    return ThriftType.get(kind, name, args)
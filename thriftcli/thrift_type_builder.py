@@ -0,0 +1,352 @@
+# Copyright Notice:
+# Copyright 2017, Fitbit, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License"); you
+# may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import types
+
+from thrift.Thrift import TApplicationException, TException, TMessageType, TType
+from thrift.transport import TTransport
+
+from .thrift_cli_error import ThriftCLIError
+from .thrift_parser import ThriftParser
+
+
+class ThriftTypeBuilder(object):
+    """ Builds the python modules that the thrift compiler would generate, directly from a ThriftParseResult.
+
+    For every thrift file in the parse result, this registers the following in sys.modules under both the file's
+    basename and its python namespace:
+    - <package>.ttypes, containing a class for every struct and enum
+    - <package>.constants, which is empty
+    - <package>.<Service>, containing a Client class for every service
+
+    Struct classes serialize through their thrift_spec, using the accelerated protocol when it is available. Unions are
+    built as structs with optional fields. Exceptions thrown by an endpoint are built as TException subclasses, and are
+    raised by the client when the server returns one, as generated clients do.
+
+    """
+
+    # Maps thrift base types to their wire type and thrift_spec type arguments.
+    BASE_TYPES = {
+        'bool': (TType.BOOL, None),
+        'byte': (TType.BYTE, None),
+        'i8': (TType.BYTE, None),
+        'i16': (TType.I16, None),
+        'i32': (TType.I32, None),
+        'i64': (TType.I64, None),
+        'double': (TType.DOUBLE, None),
+        'string': (TType.STRING, None),
+        'binary': (TType.STRING, 'BINARY'),
+    }
+
+    def __init__(self, parse_result):
+        """
+        :param parse_result: the parse result to build python modules for.
+        :type parse_result: ThriftParseResult
+
+        """
+        self._parse_result = parse_result
+        self._modules = {}
+        self._struct_classes = {}
+        self._unfinished_struct_specs = []
+
+    def build(self):
+        """ Builds the python modules for the parse result and registers them in sys.modules.
+
+        :returns: a dict of module names to the modules that were registered
+        :rtype: dict of str to module
+
+        """
+        for reference, values in self._parse_result.enums.items():
+            self._add_to_module(reference, 'ttypes', self._build_enum_class(reference, values))
+        thrown_references = set(self._parse_result.unalias_type(field.field_type)
+                                for service in self._parse_result.services.values()
+                                for endpoint in service.endpoints.values()
+                                for field in endpoint.exceptions.values())
+        for reference in self._parse_result.structs:
+            struct_class = _build_struct_class(_split_reference(reference)[1], reference in thrown_references)
+            self._struct_classes[reference] = struct_class
+            self._add_to_module(reference, 'ttypes', struct_class)
+        for reference, struct in self._parse_result.structs.items():
+            self._struct_classes[reference].thrift_spec = self._build_thrift_spec(struct.fields)
+        for reference, service in self._parse_result.services.items():
+            self._build_service_module(reference, service)
+        for struct_spec in self._unfinished_struct_specs:
+            struct_spec[1] = struct_spec[0].thrift_spec
+        for basename in self._parse_result.namespaces:
+            self._get_module(basename, 'constants')
+        self._register_modules()
+        return self._modules
+
+    @staticmethod
+    def _build_enum_class(reference, values):
+        """ Returns a class holding an enum's values the way generated enum classes do. """
+        attributes = dict(values)
+        attributes['_VALUES_TO_NAMES'] = {value: name for name, value in values.items()}
+        attributes['_NAMES_TO_VALUES'] = dict(values)
+        return type(str(_split_reference(reference)[1]), (object,), attributes)
+
+    def _build_service_module(self, reference, service):
+        """ Builds the module for a service, containing its Client and the args and result structs of each endpoint.
+
+        :param reference: the service reference, as 'package.Service'
+        :type reference: str
+        :param service: the service to build a module for
+        :type service: ThriftService
+
+        """
+        module = self._get_module(*_split_reference(reference))
+        client_attributes = {}
+        for endpoint in service.endpoints.values():
+            args_class = _build_struct_class('%s_args' % endpoint.name)
+            args_class.thrift_spec = self._build_thrift_spec(endpoint.fields)
+            setattr(module, args_class.__name__, args_class)
+            result_class = None
+            if not endpoint.oneway:
+                result_class = _build_struct_class('%s_result' % endpoint.name)
+                # The success field is 0, followed by the declared exceptions by their field ids
+                result_spec = [None] * (max([field.index for field in endpoint.exceptions.values()] + [0]) + 1)
+                if endpoint.return_type != 'void':
+                    ttype, type_args = self._get_type_spec(endpoint.return_type)
+                    result_spec[0] = (0, ttype, 'success', type_args, None)
+                for field in endpoint.exceptions.values():
+                    ttype, type_args = self._get_type_spec(field.field_type)
+                    result_spec[field.index] = (field.index, ttype, field.name, type_args, None)
+                result_class.thrift_spec = tuple(result_spec)
+                setattr(module, result_class.__name__, result_class)
+            client_attributes.update(_build_client_methods(endpoint, args_class, result_class))
+        module.Client = type('Client', (_BuiltClient,), client_attributes)
+
+    def _build_thrift_spec(self, fields):
+        """ Returns the thrift_spec tuple for a set of fields, indexed by field id.
+
+        :param fields: a dict of field names to ThriftStruct.Fields
+        :type fields: dict of str to ThriftStruct.Field
+        :rtype: tuple
+
+        """
+        thrift_spec = [None] * (max([field.index for field in fields.values()] + [0]) + 1)
+        for field in fields.values():
+            ttype, type_args = self._get_type_spec(field.field_type)
+            default = self._get_default_value(field.field_type, field.default)
+            thrift_spec[field.index] = (field.index, ttype, field.name, type_args, default)
+        return tuple(thrift_spec)
+
+    def _get_type_spec(self, field_type):
+        """ Returns the wire type and thrift_spec type arguments for a field type.
+
+        :param field_type: a namespaced field type, such as 'list<package.Struct>'
+        :type field_type: str
+        :rtype: tuple of (int, object)
+        :raises: ThriftCLIError
+
+        """
+        field_type = self._parse_result.unalias_type(field_type)
+        if field_type in self._struct_classes:
+            struct_spec = [self._struct_classes[field_type], None]
+            self._unfinished_struct_specs.append(struct_spec)
+            return TType.STRUCT, struct_spec
+        elif self._parse_result.has_enum(field_type):
+            return TType.I32, None
+        elif field_type.startswith('list<') or field_type.startswith('set<'):
+            elem_type = field_type[field_type.index('<') + 1:field_type.rindex('>')]
+            ttype = TType.LIST if field_type.startswith('list<') else TType.SET
+            return (ttype, self._get_type_spec(elem_type) + (False,))
+        elif field_type.startswith('map<'):
+            types_string = field_type[field_type.index('<') + 1:field_type.rindex('>')]
+            split_index = ThriftParser.calc_map_types_split_index(types_string)
+            if split_index == -1:
+                raise ThriftCLIError('Invalid type formatting for map - \'%s\'' % types_string)
+            key_spec = self._get_type_spec(types_string[:split_index].strip())
+            value_spec = self._get_type_spec(types_string[split_index + 1:].strip())
+            return TType.MAP, key_spec + value_spec + (False,)
+        elif field_type in ThriftTypeBuilder.BASE_TYPES:
+            return ThriftTypeBuilder.BASE_TYPES[field_type]
+        raise ThriftCLIError('Unable to build unknown type \'%s\'' % field_type)
+
+    def _get_default_value(self, field_type, default):
+        """ Converts the default value declared for a field into a python value.
+
+        Only defaults of base types and enums are supported. Other defaults are ignored.
+
+        :param field_type: the type of the field
+        :type field_type: str
+        :param default: the default value as it is written in the thrift file, or None
+        :type default: str or None
+        :returns: the python default value, or None
+
+        """
+        if default is None:
+            return None
+        field_type = self._parse_result.unalias_type(field_type)
+        if self._parse_result.has_enum(field_type):
+            return self._parse_result.enums[field_type].get(default.split('.')[-1])
+        try:
+            if field_type == 'bool':
+                return default.lower() in ('true', '1')
+            elif field_type == 'double':
+                return float(default)
+            elif field_type in ('string', 'binary'):
+                return default.strip('"\'')
+            elif field_type in ThriftTypeBuilder.BASE_TYPES:
+                return int(default, 0)
+        except ValueError:
+            pass
+        return None
+
+    def _add_to_module(self, reference, module_name, value):
+        """ Adds a class to the module of the package that declares the given reference. """
+        module = self._get_module(_split_reference(reference)[0], module_name)
+        setattr(module, value.__name__, value)
+
+    def _get_module(self, basename, module_name):
+        """ Returns the module being built for a package, creating it the first time it is requested. """
+        name = '%s.%s' % (basename, module_name)
+        if name not in self._modules:
+            self._modules[name] = types.ModuleType(name)
+        return self._modules[name]
+
+    def _register_modules(self):
+        """ Registers the built modules in sys.modules, under both the file basenames and python namespaces. """
+        packages = {}
+        for name, module in self._modules.items():
+            basename, module_name = name.split('.', 1)
+            namespace = self._parse_result.namespaces.get(basename, basename)
+            sys.modules[name] = module
+            sys.modules['%s.%s' % (namespace, module_name)] = module
+            packages.setdefault(namespace, []).append(module_name)
+        for namespace, module_names in packages.items():
+            package = sys.modules.get(namespace)
+            if package is None:
+                package = sys.modules[namespace] = types.ModuleType(namespace)
+            package.__all__ = sorted(module_names)
+            for module_name in module_names:
+                setattr(package, module_name, sys.modules['%s.%s' % (namespace, module_name)])
+
+
+class _BuiltStruct(object):
+    """ The base class of struct classes built by ThriftTypeBuilder. """
+
+    thrift_spec = ()
+
+    def __init__(self, *args, **kwargs):
+        field_specs = [field_spec for field_spec in self.thrift_spec if field_spec is not None]
+        for field_spec, value in zip(field_specs, args):
+            kwargs[field_spec[2]] = value
+        for field_spec in field_specs:
+            setattr(self, field_spec[2], kwargs.pop(field_spec[2], field_spec[4]))
+        if kwargs:
+            raise TypeError('%s got unexpected fields: %s' % (self.__class__.__name__, ', '.join(sorted(kwargs))))
+
+    def read(self, iprot):
+        if (iprot._fast_decode is not None and
+                isinstance(iprot.trans, TTransport.CReadableTransport)):
+            iprot._fast_decode(self, iprot, [self.__class__, self.thrift_spec])
+        else:
+            iprot.readStruct(self, self.thrift_spec)
+
+    def write(self, oprot):
+        if oprot._fast_encode is not None:
+            oprot.trans.write(oprot._fast_encode(self, [self.__class__, self.thrift_spec]))
+        else:
+            oprot.writeStruct(self, self.thrift_spec)
+
+    def validate(self):
+        return
+
+    def __repr__(self):
+        fields = ['%s=%r' % (key, value) for key, value in self.__dict__.items()]
+        return '%s(%s)' % (self.__class__.__name__, ', '.join(fields))
+
+    def __eq__(self, other):
+        return isinstance(other, self.__class__) and self.__dict__ == other.__dict__
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+class _BuiltException(_BuiltStruct, TException):
+    """ The base class of exception classes built by ThriftTypeBuilder. """
+
+    def __str__(self):
+        return repr(self)
+
+
+class _BuiltClient(object):
+    """ The base class of service clients built by ThriftTypeBuilder. """
+
+    def __init__(self, iprot, oprot=None):
+        self._iprot = self._oprot = iprot
+        if oprot is not None:
+            self._oprot = oprot
+        self._seqid = 0
+
+
+def _build_struct_class(name, exception=False):
+    """ Returns a new struct or exception class, whose thrift_spec must be assigned before use. """
+    return type(str(name), (_BuiltException if exception else _BuiltStruct,), {})
+
+
+def _build_client_methods(endpoint, args_class, result_class):
+    """ Returns the send_<method>, recv_<method>, and <method> functions of a client for an endpoint.
+
+    :param endpoint: the endpoint to build the methods for
+    :type endpoint: ThriftService.Endpoint
+    :param args_class: the struct class holding the endpoint's arguments
+    :param result_class: the struct class holding the endpoint's result, or None if the endpoint is oneway
+    :rtype: dict of str to function
+
+    """
+    name = endpoint.name
+    exception_names = [field.name for field in sorted(endpoint.exceptions.values(), key=lambda field: field.index)]
+
+    def send(self, *args, **kwargs):
+        message_type = TMessageType.ONEWAY if result_class is None else TMessageType.CALL
+        self._oprot.writeMessageBegin(name, message_type, self._seqid)
+        args_class(*args, **kwargs).write(self._oprot)
+        self._oprot.writeMessageEnd()
+        self._oprot.trans.flush()
+
+    def recv(self):
+        iprot = self._iprot
+        (_, message_type, _) = iprot.readMessageBegin()
+        if message_type == TMessageType.EXCEPTION:
+            exception = TApplicationException()
+            exception.read(iprot)
+            iprot.readMessageEnd()
+            raise exception
+        result = result_class()
+        result.read(iprot)
+        iprot.readMessageEnd()
+        if getattr(result, 'success', None) is not None:
+            return result.success
+        for exception_name in exception_names:
+            if getattr(result, exception_name) is not None:
+                raise getattr(result, exception_name)
+        if endpoint.return_type == 'void':
+            return None
+        raise TApplicationException(TApplicationException.MISSING_RESULT, '%s failed: unknown result' % name)
+
+    def call(self, *args, **kwargs):
+        send(self, *args, **kwargs)
+        if result_class is not None:
+            return recv(self)
+
+    methods = {name: call, 'send_%s' % name: send}
+    if result_class is not None:
+        methods['recv_%s' % name] = recv
+    return methods
+
+
+def _split_reference(reference):
+    """ Splits a reference such as 'package.Name' into its package and name. """
+    return reference.split('.', 1)
@@ -10,65 +10,294 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import json
 import os
 import random
+import threading
+import time
 import urlparse
 
-from kazoo.client import KazooClient
-
 from .thrift_cli_error import ThriftCLIError
+from .thrift_codegen_cache import get_cache_dir, _make_dirs, _write_atomically
+
+# The number of seconds the members of a server set are reused from the cache before asking Zookeeper for them again.
+DEFAULT_SERVER_SET_TTL = 60
 
 
-def get_server_address(zk_host_address, service_name):
+def get_server_address(zk_host_address, service_name, resolver=None):
     """ Extracts the server address from a zookeeper address for a given service.
 
     :param zk_host_address: the address of the Zookeeper host, as given as a command line argument
     :param service_name: the name of the service interface being requested
+    :param resolver: the resolver to look up the server set with, defaults to one asking Zookeeper every time
+    :type resolver: ThriftZookeeperResolver
     :returns: the address of a server implementing the desired service
     :rtype: str
 
     """
-    if '//' not in zk_host_address:
-        zk_host_address = '//' + zk_host_address
-    url_obj = urlparse.urlparse(zk_host_address)
-    zk_host_address = '%s:%s' % (url_obj.hostname, url_obj.port)
-    znode = _get_znode_from_zookeeper_host(zk_host_address, url_obj.path)
-    return _parse_znode_for_address(znode, service_name, url_obj.path)
+    if resolver is None:
+        resolver = ThriftZookeeperResolver()
+    return resolver.get_server_address(zk_host_address, service_name)
 
 
-def _get_znode_from_zookeeper_host(zk_host_address, path):
-    """ Picks a znode assigned to a path.
+def get_server_addresses(zk_host_address, service_name, resolver=None):
+    """ Extracts the addresses of every server in a server set that provides a given service.
 
-    :param zk_host_address: the address of the Zookeeper host
-    :param path: the path to the server set as registered under Zookeeper
-    :returns: a random node from the host's server set for the given path
-    :rtype: Znode
+    The data of the members is fetched from Zookeeper all at once, so a large server set resolves in about one round
+    trip rather than one per member.
+
+    :param zk_host_address: the address of the Zookeeper host, as given as a command line argument
+    :param service_name: the name of the service interface being requested
+    :param resolver: the resolver to look up the server set with, defaults to one asking Zookeeper every time
+    :type resolver: ThriftZookeeperResolver
+    :returns: the addresses of the servers implementing the desired service, in a stable order
+    :rtype: list of str
+
+    """
+    if resolver is None:
+        resolver = ThriftZookeeperResolver()
+    return resolver.get_server_addresses(zk_host_address, service_name)
+
+
+class ThriftServerSetCache(object):
+    """ Persists the members of Zookeeper server sets across runs, for a limited time.
+
+    Entries are keyed by the Zookeeper host and the path of the server set, and hold the data of every member along
+    with when it was fetched. An entry older than the time to live is ignored. The cache file is read again for every
+    lookup, since other processes and daemons keep it current.
+
+    """
+
+    # Bumped whenever the format of the cache file changes, which discards caches from older versions.
+    FORMAT_VERSION = 1
+
+    def __init__(self, cache_dir=None, ttl=DEFAULT_SERVER_SET_TTL):
+        """
+        :param cache_dir: the directory to keep the cache in, defaults to get_cache_dir()
+        :type cache_dir: str
+        :param ttl: the number of seconds to reuse cached members for
+        :type ttl: float
+
+        """
+        self._cache_path = os.path.join(cache_dir or get_cache_dir(), 'server-sets.json')
+        self._ttl = ttl
+        self._lock = threading.Lock()
+
+    def get(self, zk_host_address, path):
+        """ Returns the cached members of a server set, or None if they are not cached or are older than the ttl.
+
+        :param zk_host_address: the address of the Zookeeper host
+        :type zk_host_address: str
+        :param path: the path to the server set as registered under Zookeeper
+        :type path: str
+        :returns: the data of each member
+        :rtype: list of str
+
+        """
+        entry = self._load().get(_make_key(zk_host_address, path))
+        if entry is None or not 0 <= time.time() - entry['fetched'] < self._ttl:
+            return None
+        return entry['members']
+
+    def put(self, zk_host_address, path, members):
+        """ Caches the members of a server set, as fetched now.
+
+        :param zk_host_address: the address of the Zookeeper host
+        :type zk_host_address: str
+        :param path: the path to the server set as registered under Zookeeper
+        :type path: str
+        :param members: the data of each member
+        :type members: list of str
+
+        """
+        with self._lock:
+            entries = self._load()
+            entries[_make_key(zk_host_address, path)] = {'fetched': time.time(), 'members': list(members)}
+            self._save(entries)
+
+    def invalidate(self, zk_host_address, path):
+        """ Removes the cached members of a server set, such as after they changed. """
+        with self._lock:
+            entries = self._load()
+            if entries.pop(_make_key(zk_host_address, path), None) is not None:
+                self._save(entries)
+
+    def _load(self):
+        """ Returns the cached entries. A missing, unreadable, or outdated cache file is treated as empty.
+
+        :rtype: dict of str to dict
+
+        """
+        try:
+            with open(self._cache_path, 'rb') as cache_file:
+                content = json.load(cache_file)
+            if content['version'] == self.FORMAT_VERSION:
+                return content['entries']
+        except Exception:
+            pass
+        return {}
+
+    def _save(self, entries):
+        _make_dirs(os.path.dirname(self._cache_path))
+        _write_atomically(self._cache_path, json.dumps({'version': self.FORMAT_VERSION, 'entries': entries}))
+
+
+class ThriftZookeeperResolver(object):
+    """ Resolves the addresses of servers from the server sets registered under Zookeeper.
+
+    Each resolution picks a random member of the server set. Without watching, the members are read from the cache if
+    it has them, and are otherwise fetched by a Zookeeper client opened for the purpose and cached. With watching, for
+    long-running processes such as the daemon or a batch, one client per Zookeeper host is kept open, and a child watch
+    on each server set resolved keeps its members current in memory, so later resolutions need no request to Zookeeper
+    unless a member joined. Changes seen by a watch also invalidate the cache, so other processes fetch them.
 
     """
-    zk = KazooClient(hosts=zk_host_address)
-    zk.start()
-    children = zk.get_children(path)
-    try:
-        child = random.choice(children)
-    except IndexError:
-        raise ThriftCLIError('Path not found on Zookeeper: \'%s\'' % path)
-    znode = zk.get(os.path.join(path, child))
-    zk.stop()
-    return znode
 
+    def __init__(self, cache=None, watch=False):
+        """
+        :param cache: the cache to keep the members of server sets in, or None to not cache them
+        :type cache: ThriftServerSetCache
+        :param watch: whether to keep clients open and watch the server sets resolved, until closed
+        :type watch: bool
 
-def _parse_znode_for_address(znode, service_name, path):
-    """ Extracts the hostname and port for the providing server from the znode.
+        """
+        self._cache = cache
+        self._watch = watch
+        self._lock = threading.RLock()
+        # The open client of each Zookeeper host, when watching
+        self._clients = {}
+        # The members of each watched server set by (host, path), as dicts of child name to data, or None if not fetched
+        self._server_sets = {}
 
-    :param znode: the znode object returned by Zookeeper
+    def get_server_address(self, zk_host_address, service_name):
+        """ Extracts the server address from a zookeeper address for a given service.
+
+        :param zk_host_address: the address of the Zookeeper host with the path of the server set
+        :type zk_host_address: str
+        :param service_name: the name of the service interface being requested
+        :type service_name: str
+        :returns: the address of a server implementing the desired service
+        :rtype: str
+
+        """
+        zk_host_address, path = _split_zookeeper_address(zk_host_address)
+        members = self.get_members(zk_host_address, path)
+        try:
+            member = random.choice(members)
+        except IndexError:
+            raise ThriftCLIError('Path not found on Zookeeper: \'%s\'' % path)
+        return _parse_member_for_address(member, service_name, path)
+
+    def get_server_addresses(self, zk_host_address, service_name):
+        """ Extracts the addresses of every member of a server set that provides a given service.
+
+        :param zk_host_address: the address of the Zookeeper host with the path of the server set
+        :type zk_host_address: str
+        :param service_name: the name of the service interface being requested
+        :type service_name: str
+        :returns: the addresses of the servers implementing the desired service, in a stable order
+        :rtype: list of str
+        :raises: ThriftCLIError if no member provides the service
+
+        """
+        zk_host_address, path = _split_zookeeper_address(zk_host_address)
+        members = self.get_members(zk_host_address, path)
+        if not members:
+            raise ThriftCLIError('Path not found on Zookeeper: \'%s\'' % path)
+        addresses = set([])
+        for member in members:
+            try:
+                addresses.add(_parse_member_for_address(member, service_name, path))
+            except ThriftCLIError:
+                pass
+        if not addresses:
+            raise ThriftCLIError('\'%s\' service not provided by \'%s\'' % (service_name, path))
+        return sorted(addresses)
+
+    def get_members(self, zk_host_address, path):
+        """ Returns the data of every member of a server set.
+
+        :param zk_host_address: the address of the Zookeeper host
+        :type zk_host_address: str
+        :param path: the path to the server set as registered under Zookeeper
+        :type path: str
+        :rtype: list of str
+
+        """
+        if self._watch:
+            return self._get_watched_members(zk_host_address, path)
+        members = self._cache.get(zk_host_address, path) if self._cache is not None else None
+        if members is None:
+            members = _get_members_from_zookeeper_host(zk_host_address, path)
+            if self._cache is not None:
+                self._cache.put(zk_host_address, path, members)
+        return members
+
+    def close(self):
+        """ Stops watching server sets, and closes the clients kept open for them. """
+        with self._lock:
+            clients, self._clients = self._clients.values(), {}
+            self._server_sets = {}
+        for zk in clients:
+            zk.stop()
+            zk.close()
+
+    def _get_watched_members(self, zk_host_address, path):
+        key = (zk_host_address, path)
+        with self._lock:
+            zk = self._clients.get(zk_host_address)
+            if zk is None:
+                from kazoo.client import KazooClient
+                zk = KazooClient(hosts=zk_host_address)
+                zk.start()
+                self._clients[zk_host_address] = zk
+            if key not in self._server_sets:
+                self._server_sets[key] = {}
+                # Calls back with the current children on this thread before returning, then again whenever they change
+                zk.ChildrenWatch(path, functools.partial(self._on_children_changed, key))
+            unfetched = [child for child, data in self._server_sets[key].iteritems() if data is None]
+        fetched = _fetch_children(zk, path, unfetched) if unfetched else {}
+        with self._lock:
+            server_set = self._server_sets.get(key, {})
+            for child, data in fetched.iteritems():
+                # The child may have left while it was being fetched
+                if child in server_set:
+                    server_set[child] = data
+            members = [data for data in server_set.values() if data is not None]
+        if fetched and self._cache is not None:
+            self._cache.put(zk_host_address, path, members)
+        return members
+
+    def _on_children_changed(self, key, children):
+        """ Updates the members of a watched server set to its current children, keeping the data of those fetched. """
+        with self._lock:
+            if key not in self._server_sets:
+                # Closed, so stop watching
+                return False
+            previous = self._server_sets[key]
+            server_set = dict((child, previous.get(child)) for child in children)
+            self._server_sets[key] = server_set
+        if not previous or set(previous) == set(children) or self._cache is None:
+            return
+        if None in server_set.values():
+            # Members joined, and are fetched by the next resolution
+            self._cache.invalidate(*key)
+        else:
+            self._cache.put(key[0], key[1], server_set.values())
+
+
+def _parse_member_for_address(member, service_name, path):
+    """ Extracts the hostname and port for the providing server from the data of a server set member.
+
+    :param member: the data of the member's znode
     :param service_name: the name of the service interface implemented by the znode
     :param path: the path to the server set as registered under Zookeeper
     :returns: the address of a server implementing the desired service
     :rtype: str
 
     """
-    data = json.loads(znode[0])
+    data = json.loads(member)
     try:
         address = data['additionalEndpoints'][service_name]
     except KeyError:
@@ -76,3 +305,53 @@ def _parse_znode_for_address(znode, service_name, path):
     hostname, port = address['host'], address['port']
     address = '%s:%s' % (hostname, port)
     return address
+
+
+def _split_zookeeper_address(zk_host_address):
+    """ Splits a zookeeper address given on the command line into the host's address and the server set's path. """
+    if '//' not in zk_host_address:
+        zk_host_address = '//' + zk_host_address
+    url_obj = urlparse.urlparse(zk_host_address)
+    return '%s:%s' % (url_obj.hostname, url_obj.port), url_obj.path
+
+
+def _make_key(zk_host_address, path):
+    return '%s%s' % (zk_host_address, path)
+
+
+def _get_members_from_zookeeper_host(zk_host_address, path):
+    """ Fetches the data of every member of a server set, with a client opened for the purpose.
+
+    :param zk_host_address: the address of the Zookeeper host
+    :param path: the path to the server set as registered under Zookeeper
+    :returns: the data of each member of the host's server set for the given path
+    :rtype: list of str
+
+    """
+    # Imported here, since kazoo is slow to import and only needed with --zookeeper
+    from kazoo.client import KazooClient
+    zk = KazooClient(hosts=zk_host_address)
+    zk.start()
+    try:
+        children = zk.get_children(path)
+        return _fetch_children(zk, path, children).values()
+    finally:
+        zk.stop()
+
+
+def _fetch_children(zk, path, children):
+    """ Fetches the data of children of a path, all at once rather than one after another.
+
+    :returns: the data of each child by name, leaving out those that no longer exist
+    :rtype: dict of str to str
+
+    """
+    from kazoo.exceptions import NoNodeError
+    requests = [(child, zk.get_async(os.path.join(path, child))) for child in children]
+    fetched = {}
+    for child, request in requests:
+        try:
+            fetched[child] = request.get()[0]
+        except NoNodeError:
+            pass
+    return fetched
@@ -9,27 +9,31 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-import httplib
 import os
 import socket
 import ssl
 
-import requests_kerberos
 from thrift.transport import TSocket
 from thrift.transport.TTransport import TTransportException
 
+from .thrift_proxy_tunneler import ThriftProxyTunneler
+
 
 class TProxySSLSocket(TSocket.TSocket):
     SSL_VERSION = ssl.PROTOCOL_SSLv23
 
     def __init__(self, host, port, proxy_host, proxy_port,
-                 cert_verification_mode,
                  ca_certs=None,
-                 unix_socket=None):
+                 unix_socket=None,
+                 tunneler=None,
+                 tls_context=None):
         self.proxy_host = proxy_host
         self.proxy_port = proxy_port
+        # Shares the proxy's auth header with other sockets when given
+        self.tunneler = tunneler or ThriftProxyTunneler(proxy_host, proxy_port)
+        # Shares the key file's SSLContext with other sockets when given
+        self.tls_context = tls_context
         self.is_valid = False
-        self.cert_reqs = cert_verification_mode
         self.ca_certs = ca_certs
         if ca_certs is not None and not os.access(ca_certs, os.R_OK):
             raise IOError(
@@ -43,7 +47,10 @@ class TProxySSLSocket(TSocket.TSocket):
                 ip_port = res[4]
                 plain_sock = self._setup_tunnel(ip_port)
                 plain_sock.settimeout(self._timeout)
-                self.handle = ssl.wrap_socket(plain_sock, certfile=self.ca_certs, ssl_version=ssl.PROTOCOL_TLSv1_2)
+                if self.tls_context is not None:
+                    self.handle = self.tls_context.wrap_socket(plain_sock, self.host)
+                else:
+                    self.handle = ssl.wrap_socket(plain_sock, certfile=self.ca_certs, ssl_version=ssl.PROTOCOL_TLSv1_2)
                 self.handle.settimeout(self._timeout)
         except socket.error, e:
             if self._unix_socket:
@@ -57,12 +64,4 @@ class TProxySSLSocket(TSocket.TSocket):
 
         host_port: tuple (host, port) from thrift.transport.TSocket._resolveAddr.
         """
-        conn = httplib.HTTPConnection(self.proxy_host, self.proxy_port)
-        auth_header = requests_kerberos.HTTPKerberosAuth().generate_request_header(None,
-                                                                                   self.proxy_host,
-                                                                                   is_preemptive=True)
-        conn.set_tunnel(
-            *host_port,
-            headers={'Proxy-Authorization': auth_header})
-        conn.connect()
-        return conn.sock
+        return self.tunneler.open_tunnel(host_port)
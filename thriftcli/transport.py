@@ -15,25 +15,29 @@
 Maybe you need to access some backend services via a squid proxy that uses kerberos for authentication, authorization
 and auditing ofthese requests.
 
-TProxySocket is a thin wrapper around TSocket transport that uses httplib to handle setting up the tunnel 
-and requests_kerberos to handle kerberos auth.
+TProxySocket is a thin wrapper around TSocket transport that uses ThriftProxyTunneler to handle setting up the tunnel
+and kerberos auth.
 """
-import httplib
-import requests_kerberos
 import socket
 
 from thrift.transport import TSocket
 from thrift.transport import TTransport
 
+from .thrift_proxy_tunneler import ThriftProxyTunneler
+
 class TProxySocket(TSocket.TSocket):
   """Thrift transport, adds proxy support to TSocket transport."""
   def __init__(self, proxy_host=None, proxy_port=None, *args, **kwargs):
+    """tunneler: a ThriftProxyTunneler to share the proxy's auth header with other sockets, or None for one of its own.
+    """
+    tunneler = kwargs.pop('tunneler', None)
     if proxy_host is None and proxy_port is None:
       return TSocket.TSocket(*args, **kwargs)
 
     TSocket.TSocket.__init__(self, *args, **kwargs)
     self.proxy_host = proxy_host
     self.proxy_port = proxy_port
+    self.tunneler = tunneler or ThriftProxyTunneler(proxy_host, proxy_port)
 
   def open(self):
     """Open a connection.
@@ -65,14 +69,4 @@ class TProxySocket(TSocket.TSocket):
 
     host_port: tuple (host, port) from thrift.transport.TSocket._resolveAddr.
     """
-    conn = httplib.HTTPConnection(self.proxy_host, self.proxy_port)
-    auth_header = requests_kerberos.HTTPKerberosAuth().generate_request_header(None,
-                                                                                self.proxy_host,
-                                                                                is_preemptive=True)
-    conn.set_tunnel(
-                    *host_port,
-                    headers={'Proxy-Authorization': auth_header})
-    conn.connect()
-    return conn.sock
-
-
+    return self.tunneler.open_tunnel(host_port)